@@ -0,0 +1,22 @@
+"""
+Offline benchmarks of the SDK against a local mock of the DDS Cloud API.
+
+Run all scenarios, or some of them by name, from the repository root::
+
+    python -m benchmarks
+    python -m benchmarks single_task_latency bulk_throughput --json bench.json
+
+"""
+
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+
+class _NullTransport(Transport):
+    def capture_envelope(self, envelope):
+        pass
+
+
+# keep benchmark runs out of the SDK's error reporting, this must happen before the SDK is imported
+if not sentry_sdk.get_client().is_active():
+    sentry_sdk.init(dsn="http://benchmark@localhost/0", transport=_NullTransport, traces_sample_rate=0)
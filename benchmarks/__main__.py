@@ -0,0 +1,34 @@
+import argparse
+import json
+import logging
+import sys
+
+from benchmarks.scenarios import SCENARIOS
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the SDK offline.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, all by default: {', '.join(sorted(SCENARIOS))}")
+    parser.add_argument("--json", help="write the measurements to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the logs of the SDK")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+
+    report = {}
+    for name in args.scenarios or sorted(SCENARIOS):
+        report[name] = measurements = SCENARIOS[name]()
+        print(name)
+        for key, value in measurements.items():
+            print(f"  {key:<24} {value:.6g}" if isinstance(value, float) else f"  {key:<24} {value}")
+
+    if args.json:
+        with open(args.json, "w") as fp:
+            json.dump(report, fp, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
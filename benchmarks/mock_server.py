@@ -0,0 +1,318 @@
+"""
+A local mock of the DDS Cloud API for offline benchmarks.
+
+It implements the two endpoints used by :class:`V2Task <dds_cloudapi_sdk.tasks.v2_task.V2Task>`:
+
+- ``POST /v2/task/...`` accepts a task and returns its ``task_uuid``
+- ``GET /v2/task_status/{uuid}`` reports ``waiting``, ``running`` and finally ``success`` with a synthetic result
+
+A task triggered with a ``callback_url`` in its body also gets its final status posted to that url,
+like a :class:`CallbackReceiver <dds_cloudapi_sdk.callback.CallbackReceiver>` expects.
+
+``HEAD`` requests on any path are answered with an empty 200, to open connections.
+With a certificate, the server speaks HTTPS and its endpoint starts with ``https://``.
+
+Latencies and the size of the results are configurable, so the client side overhead of the SDK can be measured::
+
+    with MockDDSServer(queue_latency=0.1, run_latency=0.2, num_objects=50, targets=("bbox", "mask")) as server:
+        config = Config("any token")
+        config.endpoint = server.endpoint
+        ...
+
+"""
+
+import json
+import logging
+import random
+import ssl
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import Sequence
+
+import cv2
+import numpy as np
+import pycocotools.mask as maskUtils
+import requests
+
+from dds_cloudapi_sdk.rle_util import mask_to_rle
+
+logger = logging.getLogger("dds_cloudapi_sdk.benchmarks")
+
+
+def synthetic_result(
+    num_objects: int = 10,
+    image_size: Sequence[int] = (1024, 1536),
+    targets: Sequence[str] = ("bbox",),
+    mask_format: str = "dds_rle",
+    embedding_dim: int = 256,
+    max_object_size: float = 1 / 3,
+    seed: int = 0,
+) -> dict:
+    """
+    Generate a task result with random objects.
+
+    :param num_objects: The number of objects in the result.
+    :param image_size: The (height, width) the coordinates and masks refer to.
+    :param targets: The targets to generate, any of bbox, mask, pose_keypoints, hand_keypoints and embedding.
+    :param mask_format: Either dds_rle or coco_rle.
+    :param embedding_dim: The length of the embedding of each object.
+    :param max_object_size: The maximum size of an object relative to the image size.
+    :param seed: The seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = image_size
+    objects = []
+    for i in range(num_objects):
+        x0, y0 = int(rng.integers(0, width - 16)), int(rng.integers(0, height - 16))
+        x1 = int(rng.integers(x0 + 8, min(width, x0 + max(8, int(width * max_object_size))) + 1))
+        y1 = int(rng.integers(y0 + 8, min(height, y0 + max(8, int(height * max_object_size))) + 1))
+        obj = {
+            "bbox": [x0, y0, x1, y1],
+            "score": round(float(rng.uniform(0.3, 1.0)), 4),
+            "category": f"class_{i % 5}",
+        }
+
+        if "mask" in targets:
+            mask = np.zeros((height, width), dtype=np.uint8)
+            center = ((x0 + x1) // 2, (y0 + y1) // 2)
+            cv2.ellipse(mask, center, ((x1 - x0) // 2, (y1 - y0) // 2), 0, 0, 360, 1, -1)
+            if mask_format == "coco_rle":
+                rle = maskUtils.encode(np.asfortranarray(mask))
+                obj["mask"] = {"counts": rle["counts"].decode("utf-8"), "size": list(rle["size"]), "format": "coco_rle"}
+            else:
+                obj["mask"] = {"counts": mask_to_rle(mask, encode=True), "size": [height, width], "format": "dds_rle"}
+
+        if "pose_keypoints" in targets:
+            obj["pose"] = _keypoints(rng, 17, x0, y0, x1, y1)
+        if "hand_keypoints" in targets:
+            obj["hand"] = _keypoints(rng, 21, x0, y0, x1, y1)
+        if "embedding" in targets:
+            obj["embedding"] = [round(float(v), 6) for v in rng.standard_normal(embedding_dim)]
+        objects.append(obj)
+    return {"objects": objects}
+
+
+def _keypoints(rng, count: int, x0: int, y0: int, x1: int, y1: int) -> list:
+    keypoints = []
+    for _ in range(count):
+        keypoints.extend([
+            int(rng.integers(x0, x1 + 1)),
+            int(rng.integers(y0, y1 + 1)),
+            round(float(rng.uniform(0, 1)), 4),
+            2,
+        ])
+    return keypoints
+
+
+class MockDDSServer:
+    """
+    A threaded HTTP server mimicking the task endpoints of the DDS Cloud API.
+
+    :param trigger_latency: The seconds a trigger request takes.
+    :param poll_latency: The seconds a status request takes.
+    :param queue_latency: The seconds a task stays waiting after being triggered.
+    :param run_latency: The seconds a task stays running before it succeeds.
+    :param fail_rate: The probability of a request to be answered with HTTP 503.
+    :param callback_drop_rate: The probability of the completion callback of a task not to be sent.
+    :param host: The host to listen on.
+    :param port: The port to listen on, 0 picks a free port.
+    :param certfile: The PEM certificate chain to serve HTTPS with, HTTP if None.
+    :param keyfile: The PEM private key of the certificate, if not in ``certfile``.
+    :param connect_latency: The seconds every new connection waits before its TLS handshake,
+        standing for the network round trips of the TCP and TLS handshakes.
+    :param idle_timeout: The seconds after which an idle keep-alive connection is closed, never if None.
+    :param result_kwargs: The arguments of :func:`synthetic_result` used to build the result of every task.
+    """
+
+    def __init__(
+        self,
+        trigger_latency: float = 0.0,
+        poll_latency: float = 0.0,
+        queue_latency: float = 0.0,
+        run_latency: float = 0.0,
+        fail_rate: float = 0.0,
+        callback_drop_rate: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        certfile: str = None,
+        keyfile: str = None,
+        connect_latency: float = 0.0,
+        idle_timeout: float = None,
+        **result_kwargs,
+    ):
+        self.trigger_latency = trigger_latency
+        self.poll_latency = poll_latency
+        self.queue_latency = queue_latency
+        self.run_latency = run_latency
+        self.fail_rate = fail_rate
+        self.callback_drop_rate = callback_drop_rate
+        self.host = host
+        self.port = port
+        self.connect_latency = connect_latency
+        self.idle_timeout = idle_timeout
+        self._ssl_context = None
+        if certfile is not None:
+            self._ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self._ssl_context.load_cert_chain(certfile, keyfile)
+
+        result = synthetic_result(**result_kwargs)
+        self._result_payload = json.dumps(result)
+        self.result_size = len(self._result_payload)
+
+        self.triggers = 0
+        self.polls = 0
+        self.connections = 0
+        self.bytes_received = 0
+        self.callbacks_sent = 0
+        self._tasks: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def endpoint(self) -> str:
+        scheme = "http" if self._ssl_context is None else "https"
+        return f"{scheme}://{self.host}:{self._server.server_address[1]}"
+
+    def task_info(self, task_uuid: str) -> dict:
+        """The trigger time, finish time and number of polls of a task."""
+        return self._tasks[task_uuid]
+
+    def _status_payload(self, task_uuid: str) -> bytes:
+        payload = '{"code": 0, "msg": "ok", "data": {"uuid": "%s", "status": "success", "result": %s}}' % (
+            task_uuid, self._result_payload
+        )
+        return payload.encode()
+
+    def _send_callback(self, task_uuid: str, callback_url: str):
+        if self.callback_drop_rate > 0 and random.random() < self.callback_drop_rate:
+            return
+        try:
+            requests.post(callback_url, data=self._status_payload(task_uuid), timeout=5,
+                          headers={"Content-Type": "application/json"})
+            with self._lock:
+                self.callbacks_sent += 1
+        except requests.RequestException as e:
+            logger.warning(f"failed to send the callback of {task_uuid}: {e}")
+
+    def start(self) -> "MockDDSServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            timeout = server.idle_timeout
+            disable_nagle_algorithm = True  # headers and body are separate writes, don't wait for an ack between
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.send_raw(*server.handle_trigger(self.path, body))
+
+            def do_GET(self):
+                self.send_raw(*server.handle_status(self.path))
+
+            def send_raw(self, code: int, body: bytes):
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        class Server(ThreadingHTTPServer):
+
+            def finish_request(self, request, client_address):
+                # runs in the thread of the connection, handshakes don't hold the others back
+                with server._lock:
+                    server.connections += 1
+                if server.connect_latency:
+                    time.sleep(server.connect_latency)
+                if server._ssl_context is None:
+                    super().finish_request(request, client_address)
+                    return
+                with server._ssl_context.wrap_socket(request, server_side=True) as tls_request:
+                    super().finish_request(tls_request, client_address)
+
+        self._server = Server((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-dds-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _unavailable(self) -> bool:
+        return self.fail_rate > 0 and random.random() < self.fail_rate
+
+    def handle_trigger(self, path: str, body: bytes):
+        if self.trigger_latency:
+            time.sleep(self.trigger_latency)
+        with self._lock:
+            self.triggers += 1
+            self.bytes_received += len(body)
+        if self._unavailable():
+            return 503, b"{}"
+        if not path.startswith("/v2/task/"):
+            return 404, json.dumps({"code": 404, "msg": f"unknown api {path}"}).encode()
+
+        callback_url = None
+        if b'"callback_url"' in body:
+            callback_url = json.loads(body).get("callback_url")
+
+        task_uuid = uuid.uuid4().hex
+        triggered_at = time.time()
+        with self._lock:
+            self._tasks[task_uuid] = {
+                "api_path": path,
+                "triggered_at": triggered_at,
+                "running_at": triggered_at + self.queue_latency,
+                "finished_at": triggered_at + self.queue_latency + self.run_latency,
+                "polls": 0,
+            }
+        if callback_url:
+            timer = threading.Timer(self.queue_latency + self.run_latency, self._send_callback, (task_uuid, callback_url))
+            timer.daemon = True
+            timer.start()
+        return 200, json.dumps({"code": 0, "msg": "ok", "data": {"task_uuid": task_uuid}}).encode()
+
+    def handle_status(self, path: str):
+        if self.poll_latency:
+            time.sleep(self.poll_latency)
+        task_uuid = path.rstrip("/").rsplit("/", 1)[-1]
+        with self._lock:
+            self.polls += 1
+            task = self._tasks.get(task_uuid)
+            if task is not None:
+                task["polls"] += 1
+        if self._unavailable():
+            return 503, b"{}"
+        if not path.startswith("/v2/task_status/") or task is None:
+            return 404, json.dumps({"code": 404, "msg": f"unknown task {task_uuid}"}).encode()
+
+        now = time.time()
+        if now < task["running_at"]:
+            return 200, json.dumps({"code": 0, "msg": "ok", "data": {"uuid": task_uuid, "status": "waiting"}}).encode()
+        if now < task["finished_at"]:
+            return 200, json.dumps({"code": 0, "msg": "ok", "data": {"uuid": task_uuid, "status": "running"}}).encode()
+
+        return 200, self._status_payload(task_uuid)
@@ -0,0 +1,78 @@
+"""
+Reference implementations the optimized code paths of the SDK are benchmarked and checked against.
+"""
+
+from typing import List
+
+import cv2
+import numpy as np
+
+from dds_cloudapi_sdk.visualization_util import COCO_SKELETON
+
+
+def draw_pose(frame: np.ndarray, pose: List[float]) -> None:
+    """The per-keypoint pose drawing of ResultVisualizer before it was vectorized."""
+    left_color = (0, 0, 255)
+    right_color = (0, 255, 0)
+    center_color = (255, 0, 0)
+
+    for i in range(17):
+        kp = pose[i * 4:(i + 1) * 4]
+        if kp[2] > 0.5:
+            x = int(kp[0])
+            y = int(kp[1])
+            if i in [0, 1, 3, 5, 7, 9, 11, 13, 15]:
+                cv2.circle(frame, (x, y), 3, left_color, -1)
+            elif i in [2, 4, 6, 8, 10, 12, 14, 16]:
+                cv2.circle(frame, (x, y), 3, right_color, -1)
+
+    for start_idx, end_idx in COCO_SKELETON:
+        start_kp = pose[start_idx * 4:(start_idx + 1) * 4]
+        end_kp = pose[end_idx * 4:(end_idx + 1) * 4]
+        if start_kp[2] > 0.5 and end_kp[2] > 0.5:
+            start_point = (int(start_kp[0]), int(start_kp[1]))
+            end_point = (int(end_kp[0]), int(end_kp[1]))
+            if (start_idx, end_idx) in [(5, 6), (11, 12), (5, 11), (6, 12)]:
+                line_color = center_color
+            elif start_idx in [0, 1, 3, 5, 7, 9, 11, 13, 15] or end_idx in [0, 1, 3, 5, 7, 9, 11, 13, 15]:
+                line_color = left_color
+            else:
+                line_color = right_color
+            cv2.line(frame, start_point, end_point, line_color, 2)
+
+
+def draw_hand(frame: np.ndarray, hand: List[float]) -> None:
+    """The per-keypoint hand drawing of ResultVisualizer before it was vectorized."""
+    finger_colors = {
+        'thumb': (0, 0, 255),
+        'index': (0, 255, 0),
+        'middle': (255, 0, 0),
+        'ring': (255, 255, 0),
+        'pinky': (255, 0, 255)
+    }
+    finger_ranges = {
+        'thumb': (0, 4),
+        'index': (5, 8),
+        'middle': (9, 12),
+        'ring': (13, 16),
+        'pinky': (17, 20)
+    }
+
+    for finger, (start_idx, end_idx) in finger_ranges.items():
+        color = finger_colors[finger]
+        for i in range(start_idx, end_idx + 1):
+            kp = hand[i * 4:(i + 1) * 4]
+            if kp[2] > 0.5:
+                cv2.circle(frame, (int(kp[0]), int(kp[1])), 3, color, -1)
+
+        for i in range(start_idx, end_idx):
+            start_kp = hand[i * 4:(i + 1) * 4]
+            end_kp = hand[(i + 1) * 4:(i + 2) * 4]
+            if start_kp[2] > 0.5 and end_kp[2] > 0.5:
+                cv2.line(frame, (int(start_kp[0]), int(start_kp[1])), (int(end_kp[0]), int(end_kp[1])), color, 2)
+
+        if start_idx > 0:
+            palm_kp = hand[0:4]
+            finger_kp = hand[start_idx * 4:(start_idx + 1) * 4]
+            if palm_kp[2] > 0.5 and finger_kp[2] > 0.5:
+                cv2.line(frame, (int(palm_kp[0]), int(palm_kp[1])), (int(finger_kp[0]), int(finger_kp[1])), color, 2)
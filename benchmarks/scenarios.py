@@ -0,0 +1,647 @@
+"""
+Scripted benchmark scenarios measuring the client side overhead of the SDK against :class:`MockDDSServer`.
+
+Each scenario is a function returning a flat dict of measurements, registered in :data:`SCENARIOS`.
+"""
+
+import copy
+import functools
+import json
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+import numpy as np
+import pycocotools.mask as maskUtils
+from PIL import Image
+
+from benchmarks import reference
+from benchmarks.mock_server import MockDDSServer
+from benchmarks.mock_server import synthetic_result
+from dds_cloudapi_sdk import Client
+from dds_cloudapi_sdk import Config
+from dds_cloudapi_sdk import instrumentation
+from dds_cloudapi_sdk.cache import SQLiteCache
+from dds_cloudapi_sdk.callback import CallbackReceiver
+from dds_cloudapi_sdk.config import BodyRetention
+from dds_cloudapi_sdk.connection import configure_session
+from dds_cloudapi_sdk.connection import create_ssl_context
+from dds_cloudapi_sdk.embedding_index import FlatIndex
+from dds_cloudapi_sdk.embedding_index import IVFIndex
+from dds_cloudapi_sdk.embedding_index import collect_embeddings
+from dds_cloudapi_sdk.export import CocoWriter
+from dds_cloudapi_sdk.export import export_results
+from dds_cloudapi_sdk.image_resizer import image_to_base64
+from dds_cloudapi_sdk.image_resizer import resize_image
+from dds_cloudapi_sdk.metrics import LatencyHistogram
+from dds_cloudapi_sdk.postprocess import postprocess
+from dds_cloudapi_sdk.rle_util import dds_rle_to_coco_rle
+from dds_cloudapi_sdk.rle_util import rle_iou
+from dds_cloudapi_sdk.rle_util import rle_to_array
+from dds_cloudapi_sdk.scheduler import Priority
+from dds_cloudapi_sdk.scheduler import Scheduler
+from dds_cloudapi_sdk.tasks.base import http_session
+from dds_cloudapi_sdk.tasks.v2_task import ResizeHelper
+from dds_cloudapi_sdk.tasks.v2_task import V2Task
+from dds_cloudapi_sdk.tasks.v2_task import create_task_with_local_image_auto_resize
+from dds_cloudapi_sdk.visualization_util import ResultVisualizer
+
+API_PATH = "/v2/task/dinox/detection"
+API_BODY = {
+    "model": "DINO-X-1.0",
+    "image": "https://example.com/image.jpg",
+    "prompt": {"type": "text", "text": "person.car"},
+    "targets": ["bbox"],
+}
+
+SCENARIOS: Dict[str, Callable[..., dict]] = {}
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def synthetic_image(width: int, height: int, format: str = "JPEG") -> bytes:
+    """Encode a noisy gradient image, which compresses like a natural photo more than a flat one does."""
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    pixels = np.clip(gradient + rng.normal(0, 20, (height, width, 3)), 0, 255).astype(np.uint8)
+    output = BytesIO()
+    Image.fromarray(pixels).save(output, format=format)
+    return output.getvalue()
+
+
+def _client(server: MockDDSServer, **client_kwargs) -> Client:
+    config = Config("benchmark")
+    config.endpoint = server.endpoint
+    return Client(config, **client_kwargs)
+
+
+def _summary(prefix: str, histogram: LatencyHistogram) -> dict:
+    return {
+        f"{prefix}_mean": histogram.mean,
+        f"{prefix}_p50": histogram.percentile(50),
+        f"{prefix}_p99": histogram.percentile(99),
+    }
+
+
+@scenario
+def single_task_latency(tasks: int = 20, queue_latency: float = 0.05, run_latency: float = 0.1, **result_kwargs) -> dict:
+    """Run tasks one by one, the overhead is the latency beyond the time the server spends on them."""
+    latency = LatencyHistogram()
+    overhead = LatencyHistogram()
+    with MockDDSServer(queue_latency=queue_latency, run_latency=run_latency, **result_kwargs) as server:
+        client = _client(server)
+        for _ in range(tasks):
+            task = V2Task(API_PATH, copy.deepcopy(API_BODY))
+            start = time.perf_counter()
+            client.run_task(task)
+            elapsed = time.perf_counter() - start
+            latency.record(elapsed)
+            overhead.record(elapsed - queue_latency - run_latency)
+    return {"tasks": tasks, **_summary("latency", latency), **_summary("overhead", overhead)}
+
+
+@scenario
+def bulk_throughput(tasks: int = 200, workers: int = 32, run_latency: float = 0.2, **result_kwargs) -> dict:
+    """Run many tasks from a thread pool and measure the completed tasks per second."""
+    with MockDDSServer(run_latency=run_latency, **result_kwargs) as server:
+        client = _client(server)
+        batch = [V2Task(API_PATH, copy.deepcopy(API_BODY)) for _ in range(tasks)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(client.run_task, batch))
+        elapsed = time.perf_counter() - start
+    return {"tasks": tasks, "workers": workers, "seconds": elapsed, "tasks_per_second": tasks / elapsed}
+
+
+def _self_signed_certificate(directory: str) -> str:
+    """Create a certificate and key for 127.0.0.1 with the openssl command, in a single PEM file."""
+    path = os.path.join(directory, "localhost.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=IP:127.0.0.1,DNS:localhost", "-keyout", path, "-out", path + ".crt"],
+        check=True, capture_output=True,
+    )
+    with open(path + ".crt") as crt, open(path, "a") as pem:
+        pem.write(crt.read())
+    return path
+
+
+@scenario
+def connection_warmup(burst: int = 8, bursts: int = 5, connect_latency: float = 0.05,
+                      idle_timeout: float = 1.0) -> dict:
+    """Run bursts of tasks over HTTPS on cold, warmed up, reused, idle and kept alive connections."""
+    measurements = {"burst": burst}
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = _self_signed_certificate(directory)
+        with MockDDSServer(certfile=certfile, connect_latency=connect_latency, idle_timeout=idle_timeout) as server:
+            client = _client(server)
+
+            def run_burst(histogram: LatencyHistogram):
+                def run_one(_):
+                    start = time.perf_counter()
+                    client.run_task(V2Task(API_PATH, copy.deepcopy(API_BODY)))
+                    histogram.record(time.perf_counter() - start)
+
+                with ThreadPoolExecutor(burst) as executor:
+                    list(executor.map(run_one, range(burst)))
+
+            phases = {name: LatencyHistogram() for name in ("cold", "warm", "steady", "idle", "keepalive")}
+            try:
+                for _ in range(bursts):
+                    configure_session(http_session, create_ssl_context(certfile))
+                    run_burst(phases["cold"])
+                for _ in range(bursts):
+                    configure_session(http_session, create_ssl_context(certfile))
+                    client.warmup(burst)
+                    run_burst(phases["warm"])
+                for _ in range(bursts):
+                    run_burst(phases["steady"])
+                adapter = configure_session(http_session, create_ssl_context(certfile))
+                client.warmup(burst)
+                # the server closes the idle connections, which reopen with resumed TLS sessions
+                for _ in range(bursts):
+                    time.sleep(idle_timeout * 1.5)
+                    run_burst(phases["idle"])
+                measurements["idle_handshakes"] = adapter.ssl_context.handshakes
+                measurements["idle_resumed_handshakes"] = adapter.ssl_context.resumed
+                with client.keepalive(interval=idle_timeout / 2, connections=burst):
+                    for _ in range(bursts):
+                        time.sleep(idle_timeout * 1.5)
+                        run_burst(phases["keepalive"])
+            finally:
+                configure_session(http_session)
+
+    for name, histogram in phases.items():
+        measurements.update(_summary(name, histogram))
+    return measurements
+
+
+@scenario
+def polling_overhead(tasks: int = 10, queue_latency: float = 0.3, run_latency: float = 0.7, **result_kwargs) -> dict:
+    """Count the status requests per task and how late the client notices a finished task."""
+    delay = LatencyHistogram()
+    with MockDDSServer(queue_latency=queue_latency, run_latency=run_latency, **result_kwargs) as server:
+        client = _client(server)
+        batch = [V2Task(API_PATH, copy.deepcopy(API_BODY)) for _ in range(tasks)]
+        with ThreadPoolExecutor(tasks) as executor:
+            list(executor.map(client.run_task, batch))
+        polls = [server.task_info(task.task_uuid)["polls"] for task in batch]
+        for task in batch:
+            delay.record(task.timestamps["finished"] - server.task_info(task.task_uuid)["finished_at"])
+    return {"tasks": tasks, "polls_per_task": sum(polls) / tasks, **_summary("detection_delay", delay)}
+
+
+@scenario
+def callback_completion(tasks: int = 50, queue_latency: float = 0.3, run_latency: float = 0.7,
+                        callback_drop_rate: float = 0.1, fallback_interval: float = 2.0, **result_kwargs) -> dict:
+    """Wait for tasks with completion callbacks, polling only the tasks whose callback is dropped."""
+    delay = LatencyHistogram()
+    with MockDDSServer(queue_latency=queue_latency, run_latency=run_latency,
+                       callback_drop_rate=callback_drop_rate, **result_kwargs) as server:
+        with CallbackReceiver(fallback_interval=fallback_interval) as receiver:
+            client = _client(server, callback_receiver=receiver)
+            batch = [V2Task(API_PATH, copy.deepcopy(API_BODY)) for _ in range(tasks)]
+            with ThreadPoolExecutor(tasks) as executor:
+                list(executor.map(client.run_task, batch))
+        for task in batch:
+            delay.record(task.timestamps["finished"] - server.task_info(task.task_uuid)["finished_at"])
+    return {
+        "tasks": tasks,
+        "callbacks_per_task": server.callbacks_sent / tasks,
+        "polls_per_task": server.polls / tasks,
+        **_summary("detection_delay", delay),
+    }
+
+
+@scenario
+def mixed_priority(batch_tasks: int = 200, interactive_tasks: int = 20, max_in_flight: int = 8,
+                   run_latency: float = 0.2, **result_kwargs) -> dict:
+    """Run interactive tasks while a batch saturates the in-flight limit, with and without priorities."""
+    measurements = {}
+    with MockDDSServer(run_latency=run_latency, **result_kwargs) as server:
+        for mode in ("fifo", "priority"):
+            # with priorities, two slots are kept for interactive tasks
+            class_limits = {Priority.Batch: max_in_flight - 2} if mode == "priority" else None
+            client = _client(server, scheduler=Scheduler(max_in_flight, class_limits=class_limits))
+            latency = LatencyHistogram()
+            batch = [V2Task(API_PATH, copy.deepcopy(API_BODY)) for _ in range(batch_tasks)]
+
+            def run_interactive():
+                time.sleep(0.5)  # let the batch fill the queue first
+                for _ in range(interactive_tasks):
+                    task = V2Task(API_PATH, copy.deepcopy(API_BODY))
+                    start = time.perf_counter()
+                    client.run_task(task, priority=Priority.Interactive if mode == "priority" else Priority.Batch)
+                    latency.record(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(1) as executor:
+                interactive = executor.submit(run_interactive)
+                client.run_tasks(batch, max_workers=batch_tasks)
+                interactive.result()
+            measurements[f"{mode}_batch_seconds"] = time.perf_counter() - start
+            measurements.update(_summary(f"{mode}_interactive_latency", latency))
+    return measurements
+
+
+@scenario
+def pipelined_bulk(tasks: int = 100, width: int = 640, height: int = 480, trigger_latency: float = 0.2,
+                   queue_latency: float = 1.0, run_latency: float = 0.5, threads: int = 10) -> dict:
+    """Run tasks built from local images with the same number of threads, one task per thread or pipelined."""
+    image = synthetic_image(width, height)
+
+    def make_task() -> V2Task:
+        return create_task_with_local_image_auto_resize(API_PATH, copy.deepcopy(API_BODY), image)
+
+    measurements = {"tasks": tasks}
+    with MockDDSServer(trigger_latency=trigger_latency, queue_latency=queue_latency, run_latency=run_latency) as server:
+        client = _client(server)
+
+        def run_one(_):
+            client.run_task(make_task())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(run_one, range(tasks)))
+        measurements["thread_pool_seconds"] = time.perf_counter() - start
+
+        # 2 upload + 4 trigger + 2 poll + 2 post threads
+        pipeline = client.pipeline(upload_workers=2, trigger_workers=threads - 6, poll_workers=2, post_workers=2)
+        start = time.perf_counter()
+        errors = [error for _, error in pipeline.map(make_task for _ in range(tasks)) if error is not None]
+        measurements["pipeline_seconds"] = time.perf_counter() - start
+        measurements["pipeline_errors"] = len(errors)
+        for stage, stats in pipeline.stats().items():
+            measurements[f"pipeline_{stage}_occupancy"] = stats["occupancy"]
+    return measurements
+
+
+@scenario
+def resize_rle_cost(width: int = 4000, height: int = 3000, num_objects: int = 50, repeat: int = 3) -> dict:
+    """Time the local work around a task: resizing, base64 encoding and scaling masks back."""
+    image = synthetic_image(width, height)
+    max_size = ResizeHelper.image_max_size(API_PATH)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        resized, resize_info = resize_image(image, max_size)
+    resize_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        image_to_base64(resized)
+    base64_seconds = (time.perf_counter() - start) / repeat
+
+    helper = ResizeHelper(**resize_info)
+    resized_size = (int(height * resize_info["ratio"]), int(width * resize_info["ratio"]))
+    result = synthetic_result(num_objects=num_objects, image_size=resized_size, targets=("bbox", "mask"))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        helper.format_result(copy.deepcopy(result))
+    format_seconds = (time.perf_counter() - start) / repeat
+
+    return {
+        "image_bytes": len(image),
+        "resized_bytes": len(resized.getvalue()),
+        "resize_seconds": resize_seconds,
+        "base64_seconds": base64_seconds,
+        "format_result_seconds": format_seconds,
+    }
+
+
+@scenario
+def stage_breakdown(tasks: int = 10, width: int = 4000, height: int = 3000, num_objects: int = 50) -> dict:
+    """Run resized mask tasks end to end with and without a stage collector, and break the client time down."""
+    image = synthetic_image(width, height)
+    ratio = ResizeHelper.image_max_size(API_PATH) / max(width, height)
+    resized_size = (int(height * ratio), int(width * ratio))
+    body = {**API_BODY, "targets": ["bbox", "mask"]}
+    del body["image"]
+
+    def run(client: Client) -> float:
+        start = time.perf_counter()
+        for _ in range(tasks):
+            client.run_task(create_task_with_local_image_auto_resize(API_PATH, copy.deepcopy(body), image))
+        return (time.perf_counter() - start) / tasks
+
+    collector = instrumentation.StageCollector()
+    with MockDDSServer(num_objects=num_objects, image_size=resized_size, targets=("bbox", "mask")) as server:
+        client = _client(server)
+        measurements = {"tasks": tasks, "seconds_per_task": run(client)}
+        with instrumentation.instrumenting(collector):
+            measurements["instrumented_seconds_per_task"] = run(client)
+
+    for name, stats in sorted(collector.stats().items()):
+        measurements[f"{name}_count"] = stats["count"]
+        measurements[f"{name}_self_seconds"] = stats["self_seconds"] / tasks
+        measurements[f"{name}_cpu_seconds"] = stats["cpu_seconds"] / tasks
+    return measurements
+
+
+@scenario
+def rle_ops(width: int = 4000, height: int = 3000, num_objects: int = 50, repeat: int = 3) -> dict:
+    """Compare mask IoU and format conversion on run lengths with decoding the masks to dense arrays."""
+    masks = [
+        obj["mask"] for obj in
+        synthetic_result(num_objects=num_objects, image_size=(height, width), targets=("bbox", "mask"))["objects"]
+    ]
+    counts = [mask["counts"] for mask in masks]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        rle_iou(counts, counts)
+    iou_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        dense = np.stack([rle_to_array(c, height * width) for c in counts]).astype(np.float32)
+        intersection = dense @ dense.T
+        area = dense.sum(axis=1)
+        intersection / (area[:, None] + area[None, :] - intersection)
+    dense_iou_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for mask in masks:
+            dds_rle_to_coco_rle(mask)
+    convert_seconds = (time.perf_counter() - start) / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for mask in masks:
+            img = rle_to_array(mask["counts"], height * width).reshape(height, width)
+            maskUtils.encode(np.asfortranarray(img))
+    dense_convert_seconds = (time.perf_counter() - start) / repeat
+
+    return {
+        "iou_matrix_seconds": iou_seconds,
+        "dense_iou_matrix_seconds": dense_iou_seconds,
+        "to_coco_seconds": convert_seconds,
+        "dense_to_coco_seconds": dense_convert_seconds,
+    }
+
+
+@scenario
+def threshold_sweep(num_objects: int = 900, width: int = 1920, height: int = 1080, steps: int = 10) -> dict:
+    """Sweep score and NMS thresholds over one permissive result instead of running a task per threshold."""
+    result = synthetic_result(num_objects=num_objects, image_size=(height, width), targets=("bbox", "mask"))
+    thresholds = np.linspace(0.3, 0.8, steps)
+
+    start = time.perf_counter()
+    kept = [len(postprocess(result, min_score=t, iou_threshold=0.5, top_k=300)["objects"]) for t in thresholds]
+    box_seconds = (time.perf_counter() - start) / steps
+
+    start = time.perf_counter()
+    for t in thresholds:
+        postprocess(result, min_score=t, mask_iou_threshold=0.5)
+    mask_seconds = (time.perf_counter() - start) / steps
+
+    return {
+        "objects": num_objects,
+        "kept_min": min(kept),
+        "kept_max": max(kept),
+        "box_nms_seconds": box_seconds,
+        "mask_nms_seconds": mask_seconds,
+    }
+
+
+@scenario
+def coco_export(images: int = 200, num_objects: int = 30, width: int = 1920, height: int = 1080,
+                processes: int = 4) -> dict:
+    """Export mask results to COCO by decoding them to dense arrays, and by streaming them on run lengths."""
+    result = synthetic_result(num_objects=num_objects, image_size=(height, width), targets=("bbox", "mask"))
+
+    def dense(path: str, count: int):
+        annotations = []
+        for image_id in range(1, count + 1):
+            for obj in result["objects"]:
+                x0, y0, x1, y1 = obj["bbox"]
+                mask = rle_to_array(obj["mask"]["counts"], height * width).reshape(height, width)
+                rle = maskUtils.encode(np.asfortranarray(mask))
+                annotations.append({
+                    "id": len(annotations) + 1, "image_id": image_id, "category_id": 1, "iscrowd": 0,
+                    "bbox": [x0, y0, x1 - x0, y1 - y0], "area": int(maskUtils.area(rle)),
+                    "segmentation": {"size": rle["size"], "counts": rle["counts"].decode("utf-8")},
+                })
+        with open(path, "w") as f:
+            json.dump({"images": [], "annotations": annotations, "categories": []}, f)
+
+    def streaming(path: str, count: int, workers: int):
+        with CocoWriter(path) as writer:
+            export_results(writer, ((f"{i}.jpg", result) for i in range(count)), processes=workers)
+
+    methods = {
+        "dense": dense,
+        "streaming": functools.partial(streaming, workers=0),
+        f"streaming_{processes}_processes": functools.partial(streaming, workers=processes),
+    }
+    measurements = {"images": images}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, method in methods.items():
+            path = os.path.join(directory, f"{name}.json")
+            start = time.perf_counter()
+            method(path, images)
+            measurements[f"{name}_seconds"] = time.perf_counter() - start
+            # tracemalloc slows python code down, the memory is measured in a separate run
+            tracemalloc.start()
+            method(path, images // 4)
+            measurements[f"{name}_peak_bytes_{images // 4}_images"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return measurements
+
+
+def _preprocess(paths: list, cache_path: Optional[str]) -> float:
+    cache = SQLiteCache(cache_path) if cache_path else None
+    start = time.perf_counter()
+    for path in paths:
+        create_task_with_local_image_auto_resize(API_PATH, copy.deepcopy(API_BODY), path, cache=cache)
+    return time.perf_counter() - start
+
+
+@scenario
+def shared_image_cache(images: int = 10, processes: int = 4, width: int = 4000, height: int = 3000) -> dict:
+    """Preprocess the same images in several processes, each on its own or sharing a SQLite cache."""
+    measurements = {"images": images, "processes": processes}
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(images):
+            paths.append(os.path.join(directory, f"{i}.jpg"))
+            with open(paths[-1], "wb") as f:
+                f.write(synthetic_image(width, height))
+
+        cache_path = os.path.join(directory, "cache.db")
+        with multiprocessing.Pool(processes) as pool:
+            seconds = pool.starmap(_preprocess, [(paths, None)] * processes)
+            measurements["private_seconds_per_process"] = sum(seconds) / processes
+            # one process preprocesses the images, the others find them in the cache
+            measurements["shared_first_process_seconds"] = pool.apply(_preprocess, (paths, cache_path))
+            seconds = pool.starmap(_preprocess, [(paths, cache_path)] * (processes - 1))
+            measurements["shared_other_processes_seconds"] = sum(seconds) / (processes - 1)
+    return measurements
+
+
+@scenario
+def embedding_search(results: int = 200, num_objects: int = 50, embeddings: int = 200000, dim: int = 256,
+                     queries: int = 100, k: int = 10, nprobe: int = 16, pq_m: int = 32) -> dict:
+    """Collect embeddings from results, then search clustered embeddings exactly, in IVF lists and on PQ codes."""
+    result = synthetic_result(num_objects=num_objects, targets=("bbox", "embedding"), embedding_dim=dim)
+    start = time.perf_counter()
+    vectors, refs = collect_embeddings((i, result) for i in range(results))
+    measurements = {"collected_embeddings": len(refs), "collect_seconds": time.perf_counter() - start}
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((embeddings // 200, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), embeddings)] + 0.5 * rng.standard_normal((embeddings, dim), np.float32)
+    query = vectors[rng.integers(0, embeddings, queries)] + 0.1 * rng.standard_normal((queries, dim), np.float32)
+    measurements["embeddings"] = embeddings
+
+    start = time.perf_counter()
+    _, truth = FlatIndex(vectors).search(query, k)
+    measurements["flat_ms_per_query"] = (time.perf_counter() - start) / queries * 1000
+    for name, kwargs in (("ivf", {}), ("ivf_pq", {"pq_m": pq_m})):
+        start = time.perf_counter()
+        index = IVFIndex(vectors, nprobe=nprobe, **kwargs)
+        measurements[f"{name}_build_seconds"] = time.perf_counter() - start
+        start = time.perf_counter()
+        _, ids = index.search(query, k)
+        measurements[f"{name}_ms_per_query"] = (time.perf_counter() - start) / queries * 1000
+        measurements[f"{name}_recall"] = float(np.mean([len(set(a) & set(b)) / k for a, b in zip(truth, ids)]))
+    return measurements
+
+
+@scenario
+def memory(tasks: int = 200, width: int = 1920, height: int = 1080) -> dict:
+    """Measure the memory held by pending tasks built from local images."""
+    image = synthetic_image(width, height)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        batch = [
+            create_task_with_local_image_auto_resize(API_PATH, copy.deepcopy(API_BODY), image)
+            for _ in range(tasks)
+        ]
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "tasks": len(batch),
+        "bytes_per_task": (current - baseline) / tasks,
+        "peak_bytes": peak - baseline,
+    }
+
+
+@scenario
+def compact_tasks(tasks: int = 500, width: int = 640, height: int = 480) -> dict:
+    """Measure the memory held by triggered tasks waiting for the server, keeping or releasing their bodies."""
+    image = synthetic_image(width, height)
+    measurements = {}
+    with MockDDSServer(run_latency=60) as server:
+        for retention in (BodyRetention.Keep, BodyRetention.Release):
+            config = Config("benchmark", body_retention=retention)
+            config.endpoint = server.endpoint
+            client = Client(config)
+            tracemalloc.start()
+            try:
+                baseline = tracemalloc.get_traced_memory()[0]
+                batch = []
+                for _ in range(tasks):
+                    task = create_task_with_local_image_auto_resize(API_PATH, copy.deepcopy(API_BODY), image)
+                    client.trigger_task(task)
+                    batch.append(task)
+                current = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            measurements[f"{retention.value}_bytes_per_task"] = (current - baseline) / tasks
+    return {"tasks": tasks, **measurements}
+
+
+@scenario
+def keypoint_drawing(people: int = 300, width: int = 1920, height: int = 1080, repeat: int = 5) -> dict:
+    """Compare the vectorized pose and hand drawing with the per-keypoint reference implementation."""
+    objects = synthetic_result(
+        num_objects=people,
+        image_size=(height, width),
+        targets=("bbox", "pose_keypoints", "hand_keypoints"),
+        max_object_size=0.05,
+    )["objects"]
+    poses = [obj["pose"] for obj in objects]
+    hands = [obj["hand"] for obj in objects]
+    visualizer = ResultVisualizer([])
+    scene = np.zeros((height, width, 3), dtype=np.uint8)
+
+    reference_frame = scene.copy()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reference_frame = scene.copy()
+        for pose in poses:
+            reference.draw_pose(reference_frame, pose)
+        for hand in hands:
+            reference.draw_hand(reference_frame, hand)
+    reference_seconds = (time.perf_counter() - start) / repeat
+
+    vectorized_frame = scene.copy()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        vectorized_frame = scene.copy()
+        visualizer._draw_poses(vectorized_frame, poses)
+        visualizer._draw_hands(vectorized_frame, hands)
+    vectorized_seconds = (time.perf_counter() - start) / repeat
+
+    # Strokes are batched across people, so pixels may only differ where different people overlap
+    drawn = (reference_frame.any(axis=2) | vectorized_frame.any(axis=2)).sum()
+    differ = (reference_frame != vectorized_frame).any(axis=2).sum()
+    return {
+        "people": people,
+        "reference_seconds": reference_seconds,
+        "vectorized_seconds": vectorized_seconds,
+        "speedup": reference_seconds / vectorized_seconds,
+        "differing_pixel_ratio": float(differ / drawn) if drawn else 0.0,
+    }
+
+
+@scenario
+def resize_policy(width: int = 4000, height: int = 3000, repeat: int = 3) -> dict:
+    """Measure the payload of requests by target set, and the round trip of boxes through a resized region_vl task."""
+    image = synthetic_image(width, height)
+    measurements = {"full_resolution_bytes": len(image_to_base64(image))}
+    requests = {
+        "detection": ("/v2/task/dinox/detection", ["bbox", "mask"]),
+        "embedding": ("/v2/task/trex/detection", ["bbox", "embedding"]),
+        "caption": ("/v2/task/dinox/region_vl", ["caption"]),
+        "ocr": ("/v2/task/dinox/region_vl", ["caption", "roc", "ocr"]),
+    }
+    for name, (api_path, targets) in requests.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            task = create_task_with_local_image_auto_resize(api_path, {"targets": targets}, image)
+        measurements[f"{name}_seconds"] = (time.perf_counter() - start) / repeat
+        measurements[f"{name}_bytes"] = len(task.api_body["image"])
+        measurements[f"{name}_max_size"] = ResizeHelper.image_max_size(api_path, targets)
+
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, [width, height], (50, 2))
+    regions = np.concatenate([corners, corners + rng.uniform(16, 400, (50, 2))], axis=1).tolist()
+    body = {"targets": ["caption", "ocr"], "regions": regions}
+    task = create_task_with_local_image_auto_resize("/v2/task/dinox/region_vl", body, image)
+    # the server answers in the coordinates of the resized image, which the request regions now are in
+    result = {"objects": [
+        {"region": region, "caption": "text", "ocr": [{"text": "a", "polygon": [region[:2], region[2:]]}]}
+        for region in task.api_body["regions"]
+    ]}
+    result = task.format_result(result)
+    rescaled = np.array([obj["region"] for obj in result["objects"]])
+    polygons = np.array([np.ravel(obj["ocr"][0]["polygon"]) for obj in result["objects"]])
+    measurements["region_max_error"] = float(np.abs(rescaled - regions).max())
+    measurements["ocr_polygon_max_error"] = float(np.abs(polygons - regions).max())
+    return measurements
@@ -0,0 +1,193 @@
+"""
+Spread tasks over several endpoints and API tokens.
+
+A :class:`LoadBalancer` routes each trigger to the endpoint and token pair with the fewest tasks in flight,
+tracks the latency and error rate of every pair, and ejects the unhealthy ones for a while.
+Once triggered, a task checks its status on the same endpoint with the same token::
+
+    from dds_cloudapi_sdk import Config
+
+    config = Config(
+        "token-1",
+        endpoints=["api.deepdataspace.com", "api-sg.example.com"],
+        tokens=["token-1", "token-2", "token-3"],
+    )
+    client = Client(config)
+    client.run_tasks(tasks)  # triggers are balanced over the 6 endpoint and token pairs
+    print(config.balancer.stats())
+
+"""
+
+import itertools
+import logging
+import threading
+import time
+from typing import Dict
+from typing import List
+from typing import Sequence
+
+__all__ = [
+    "Backend",
+    "LoadBalancer",
+]
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+
+class Backend:
+    """
+    An endpoint and token pair and the health statistics of the requests sent with it.
+
+    :param endpoint: The endpoint of the DDS Cloud API.
+    :param token: The API token.
+    :param weight: The share of the tasks of this pair relative to the others, 1 by default.
+    """
+
+    def __init__(self, endpoint: str, token: str, weight: float = 1.0):
+        self.endpoint = endpoint
+        self.token = token
+        self.weight = weight
+
+        self.outstanding = 0  # tasks triggered and not finished yet
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None  # moving average of the request latency in seconds
+        self.error_rate = 0.0  # moving average of the request failures
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+    def __repr__(self):
+        return f"Backend<{self.endpoint}, token:...{self.token[-4:]}, outstanding:{self.outstanding}>"
+
+
+class LoadBalancer:
+    """
+    Route tasks to the least loaded healthy backend.
+
+    :param backends: The endpoint and token pairs to balance over.
+    :param alpha: The smoothing factor of the moving averages of latency and error rate.
+    :param max_error_rate: The moving error rate above which a backend is ejected.
+    :param max_consecutive_failures: The number of failures in a row after which a backend is ejected.
+    :param min_requests: The number of requests a backend must have served before its error rate is trusted.
+    :param ejection_time: The seconds of the first ejection, doubled on every ejection in a row up to 8 times.
+    :param max_ejected_ratio: The maximum fraction of the backends ejected at the same time.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[Backend],
+        alpha: float = 0.2,
+        max_error_rate: float = 0.5,
+        max_consecutive_failures: int = 5,
+        min_requests: int = 10,
+        ejection_time: float = 30.0,
+        max_ejected_ratio: float = 0.5,
+    ):
+        if not backends:
+            raise ValueError("A load balancer needs at least one backend")
+
+        self.backends: List[Backend] = list(backends)
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.min_requests = min_requests
+        self.ejection_time = ejection_time
+        self.max_ejected_ratio = max_ejected_ratio
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pools(cls, endpoints: Sequence[str], tokens: Sequence[str], **kwargs) -> "LoadBalancer":
+        """
+        Balance over every combination of the endpoints and tokens.
+        """
+        return cls([Backend(endpoint, token) for endpoint, token in itertools.product(endpoints, tokens)], **kwargs)
+
+    def acquire(self) -> Backend:
+        """
+        Pick the backend to trigger a task on and count the task as outstanding on it.
+        The task must be given back with :meth:`release` once it is finished.
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b.ejected_until <= now]
+            if not candidates:
+                # everything is ejected, the backend coming back first is the best bet
+                candidates = [min(self.backends, key=lambda b: b.ejected_until)]
+            backend = min(
+                candidates,
+                key=lambda b: (b.outstanding / b.weight, b.latency if b.latency is not None else 0.0),
+            )
+            backend.outstanding += 1
+            return backend
+
+    def release(self, backend: Backend):
+        """
+        Stop counting a finished task as outstanding on its backend.
+        """
+        with self._lock:
+            backend.outstanding -= 1
+
+    def record(self, backend: Backend, latency: float, ok: bool):
+        """
+        Record the outcome of a request sent to a backend, and eject the backend if it turns unhealthy.
+
+        :param backend: The backend the request was sent to.
+        :param latency: The seconds the request took.
+        :param ok: Whether the request succeeded, transient errors such as timeouts and HTTP 5xx count as failures.
+        """
+        with self._lock:
+            backend.requests += 1
+            backend.latency = latency if backend.latency is None else \
+                (1 - self.alpha) * backend.latency + self.alpha * latency
+            backend.error_rate = (1 - self.alpha) * backend.error_rate + self.alpha * (0.0 if ok else 1.0)
+            if ok:
+                backend.consecutive_failures = 0
+                if not backend.ejected:
+                    backend.ejections = 0
+                return
+
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            unhealthy = backend.consecutive_failures >= self.max_consecutive_failures or (
+                backend.requests >= self.min_requests and backend.error_rate > self.max_error_rate
+            )
+            if unhealthy and not backend.ejected:
+                self._eject(backend)
+
+    def _eject(self, backend: Backend):
+        ejected = sum(1 for b in self.backends if b.ejected)
+        if ejected + 1 > self.max_ejected_ratio * len(self.backends):
+            logger.warning(f"{backend} is unhealthy but too many backends are ejected already")
+            return
+
+        duration = self.ejection_time * 2 ** min(backend.ejections, 8)
+        backend.ejections += 1
+        backend.ejected_until = time.monotonic() + duration
+        # start over when the backend comes back
+        backend.consecutive_failures = 0
+        backend.error_rate = 0.0
+        backend.requests = 0
+        logger.warning(f"{backend} is ejected for {duration:.0f}s")
+
+    def stats(self) -> List[Dict[str, object]]:
+        """
+        The load and health of every backend.
+        """
+        with self._lock:
+            return [
+                {
+                    "endpoint": b.endpoint,
+                    "token": f"...{b.token[-4:]}",
+                    "outstanding": b.outstanding,
+                    "latency": b.latency,
+                    "error_rate": b.error_rate,
+                    "failures": b.failures,
+                    "ejected": b.ejected,
+                }
+                for b in self.backends
+            ]
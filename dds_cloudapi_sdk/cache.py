@@ -0,0 +1,444 @@
+"""
+Opt-in caching of task results, keyed by a canonical hash of the task's ``api_path`` and ``api_body``.
+
+When a :class:`Client <dds_cloudapi_sdk.client.Client>` is initialized with a cache, running a task whose request
+has been seen before returns the cached result without any network round-trip::
+
+    from dds_cloudapi_sdk import Client
+    from dds_cloudapi_sdk.cache import MemoryCache
+
+    cache = MemoryCache(max_entries=1024, ttl=3600)
+    client = Client(config, cache=cache)
+
+    client.run_task(task)  # hits the server
+    client.run_task(same_task)  # served from the cache
+    print(cache.stats.hit_ratio)  # 0.5
+
+"""
+
+import abc
+import base64
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+__all__ = [
+    "canonical_hash",
+    "CacheStats",
+    "BaseCache",
+    "MemoryCache",
+    "DiskCache",
+    "SQLiteCache",
+]
+
+_BASE64_MARK = ";base64,"
+
+
+def _canonicalize(value):
+    """Replace base64 data urls with the hash of the bytes they carry, recursively."""
+    if isinstance(value, dict):
+        return {k: _canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalize(v) for v in value]
+    if isinstance(value, str) and value.startswith("data:"):
+        mark = value.find(_BASE64_MARK)
+        if mark != -1:
+            data = base64.b64decode(value[mark + len(_BASE64_MARK):])
+            return {"sha256": hashlib.sha256(data).hexdigest()}
+    return value
+
+
+def canonical_hash(api_path: str, api_body: dict, **extra) -> str:
+    """
+    Compute a stable hash of a request.
+
+    Key order of the body does not matter, and embedded images are identified by the hash of their content
+    rather than by their base64 representation.
+
+    :param api_path: The api path of the task.
+    :param api_body: The request body of the task.
+    :param extra: Any extra values that affect the formatted result of the task.
+    :return: The hex digest of the request.
+    """
+    canonical = {"api_path": api_path, "api_body": _canonicalize(api_body or {})}
+    if extra:
+        canonical["extra"] = extra
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """Hit and miss counters of a cache."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __repr__(self):
+        return f"CacheStats<hits:{self.hits}, misses:{self.misses}, evictions:{self.evictions}, hit_ratio:{self.hit_ratio:.3f}>"
+
+
+class BaseCache(abc.ABC):
+    """
+    The interface of a result cache.
+
+    Values are stored serialized, so every :meth:`get` returns a fresh copy the caller is free to mutate.
+
+    :param ttl: The seconds an entry stays valid, None for no expiration.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _set(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[dict]:
+        data = self._get(key)
+        if data is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(data)
+
+    def set(self, key: str, value: dict):
+        self._set(key, json.dumps(value, separators=(",", ":")).encode("utf-8"))
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """
+        Get a raw value stored by :meth:`set_bytes`, such as an encoded image.
+        """
+        data = self._get(key)
+        if data is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return data
+
+    def set_bytes(self, key: str, data: bytes):
+        """
+        Store a raw value, without serializing it.
+        """
+        self._set(key, data)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl is not None and time.time() - stored_at > self.ttl
+
+
+class MemoryCache(BaseCache):
+    """
+    An in-process LRU cache.
+
+    :param max_entries: The maximum number of entries.
+    :param max_bytes: The maximum total size of the serialized entries, None for no limit.
+    :param ttl: The seconds an entry stays valid, None for no expiration.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, data = entry
+            if self._expired(stored_at):
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _set(self, key: str, data: bytes):
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.time(), data)
+            self._size += len(data)
+            while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._size > self.max_bytes):
+                self._pop(next(iter(self._entries)))
+                self.stats.evictions += 1
+
+    def _pop(self, key: str):
+        _, data = self._entries.pop(key)
+        self._size -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DiskCache(BaseCache):
+    """
+    A cache persisted as one file per entry under a directory, so it survives across runs.
+
+    | Entries expire by their modification time, which is the time they were stored.
+    | Entries are evicted in least-recently-used order, by their access time which is refreshed on every hit.
+
+    :param directory: The directory to store the entries in, created if not exists.
+    :param max_bytes: The maximum total size of the entries, None for no limit.
+    :param ttl: The seconds an entry stays valid, None for no expiration.
+    """
+
+    _suffix = ".json"
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None, ttl: Optional[float] = None):
+        super().__init__(ttl)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # estimated total size, recomputed by scanning when it goes over the limit
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + self._suffix)
+
+    def _get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if self._expired(stat.st_mtime):
+                os.remove(path)
+                return None
+            with open(path, "rb") as fp:
+                data = fp.read()
+            os.utime(path, (time.time(), stat.st_mtime))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _set(self, key: str, data: bytes):
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.max_bytes is not None:
+            try:
+                replaced = os.stat(path).st_size
+            except FileNotFoundError:
+                replaced = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp_path, path)
+
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(data) - replaced
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def _scan(self):
+        entries = []
+        for top, _, files in os.walk(self.directory):
+            for file in files:
+                if not file.endswith(self._suffix):
+                    continue
+                path = os.path.join(top, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._scan()
+            total = sum(size for _, size, _ in entries)
+            self._size = total
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.stats.evictions += 1
+            self._size = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._scan():
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._size = 0
+
+
+class SQLiteCache(BaseCache):
+    """
+    A cache in a SQLite database, shared by all the processes of a host that open the same file.
+
+    | The database runs in WAL mode, so readers never block each other nor the writer, and is memory-mapped,
+      so processes read the entries from the page cache of the OS instead of each keeping its own copy.
+    | Entries are evicted in least-recently-used order once the total size goes over ``max_bytes``.
+      The access time of an entry is refreshed at most every ``touch_interval`` seconds, to keep hits read-only.
+
+    :param path: The path of the database file, created if not exists.
+    :param max_bytes: The maximum total size of the entries, None for no limit.
+    :param ttl: The seconds an entry stays valid, None for no expiration.
+    :param mmap_size: The bytes of the database file memory-mapped by each process.
+    :param touch_interval: The seconds the access time of an entry may lag behind.
+    :param timeout: The seconds to wait for the lock held by a writer in another process.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        mmap_size: int = 1 << 30,
+        touch_interval: float = 10.0,
+        timeout: float = 30.0,
+    ):
+        super().__init__(ttl)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_size = mmap_size
+        self.touch_interval = touch_interval
+        self.timeout = timeout
+        self._local = threading.local()
+        self._size = None  # estimated total size, recomputed when it goes over the limit
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """The connection of the current thread, opened again in a forked process."""
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _get(self, key: str) -> Optional[bytes]:
+        db = self._connection()
+        row = db.execute("SELECT data, stored_at, accessed_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        data, stored_at, accessed_at = row
+        now = time.time()
+        if self._expired(stored_at):
+            with db:
+                db.execute("DELETE FROM entries WHERE key = ? AND stored_at = ?", (key, stored_at))
+            return None
+        if now - accessed_at > self.touch_interval:
+            with db:
+                db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return data
+
+    def _set(self, key: str, data: bytes):
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+
+        now = time.time()
+        db = self._connection()
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO entries (key, data, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), len(data), now, now),
+            )
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(data)
+            # other processes write too, the estimate is only a hint to recompute the real size
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        with self._lock:
+            db = self._connection()
+            with db:
+                db.execute("BEGIN IMMEDIATE")
+                if self.ttl is not None:
+                    self.stats.evictions += db.execute(
+                        "DELETE FROM entries WHERE stored_at < ?", (time.time() - self.ttl,)
+                    ).rowcount
+                total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    excess = total - self.max_bytes
+                    evicted, freed = 0, 0
+                    for key, size in db.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall():
+                        if freed >= excess:
+                            break
+                        db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                        evicted += 1
+                        freed += size
+                    total -= freed
+                    self.stats.evictions += evicted
+            self._size = total
+
+    def clear(self):
+        db = self._connection()
+        with db:
+            db.execute("DELETE FROM entries")
+        with self._lock:
+            self._size = 0
+
+    def close(self):
+        """
+        Close the connection of the current thread.
+        """
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
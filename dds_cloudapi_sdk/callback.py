@@ -0,0 +1,277 @@
+"""
+Learn about finished tasks from completion callbacks instead of polling their status.
+
+:class:`CallbackReceiver` is a small HTTP server running on an asyncio event loop in a background thread.
+When it is set on the client, every triggered task asks the server to post its status to the receiver,
+and waiting tasks are woken up as soon as their callback arrives::
+
+    from dds_cloudapi_sdk.callback import CallbackReceiver
+
+    receiver = CallbackReceiver(port=8765, public_url="https://my-host.example.com:8765/dds_callback")
+    with receiver:
+        client = Client(config, callback_receiver=receiver)
+        client.run_task(task)  # no status polling unless the callback is missed
+
+A task still checks its status once every ``fallback_interval`` seconds without a callback,
+so a lost callback delays it but never blocks it.
+"""
+
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+from typing import Dict
+from typing import Optional
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+__all__ = [
+    "CallbackReceiver",
+]
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+_TERMINAL_STATUSES = ("success", "failed")
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class CallbackReceiver:
+    """
+    Receive task completion callbacks and wake up the tasks waiting for them.
+
+    :param host: The host to listen on.
+    :param port: The port to listen on, 0 picks a free port.
+    :param path: The url path callbacks are posted to.
+    :param public_url: The url the DDS server posts callbacks to, which must reach this receiver.
+        Defaults to the address the receiver listens on, only reachable by local servers.
+    :param secret: A secret added to the callback url, callbacks without it are rejected.
+    :param fallback_interval: The seconds a task waits for its callback before checking its status by polling.
+    :param body_field: The field of the request body the callback url is sent in.
+    :param max_unmatched: The number of callbacks kept for tasks not waited yet,
+        such as tasks whose callback arrives before their trigger request returns.
+    :param unmatched_ttl: The seconds an unmatched callback is kept.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        path: str = "/dds_callback",
+        public_url: str = None,
+        secret: str = None,
+        fallback_interval: float = 10.0,
+        body_field: str = "callback_url",
+        max_unmatched: int = 10000,
+        unmatched_ttl: float = 300.0,
+    ):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.public_url = public_url
+        self.secret = secret
+        self.fallback_interval = fallback_interval
+        self.body_field = body_field
+        self.max_unmatched = max_unmatched
+        self.unmatched_ttl = unmatched_ttl
+
+        self.received = 0  # the number of accepted callbacks
+        self.unmatched = 0  # the number of callbacks of tasks nobody waited for in time
+
+        self._waiters: Dict[str, threading.Event] = {}
+        self._payloads: Dict[str, dict] = {}
+        self._early = collections.OrderedDict()  # task uuid -> (received at, task data)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The callback url sent to the server with each task."""
+        if self.public_url:
+            url = self.public_url
+        else:
+            url = f"http://{self.host}:{self.port}{self.path}"
+        if self.secret:
+            url += ("&" if "?" in url else "?") + f"secret={self.secret}"
+        return url
+
+    def start(self) -> "CallbackReceiver":
+        if self._thread is not None:
+            return self
+
+        started = threading.Event()
+        errors = []
+
+        def serve():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+                self.port = self._server.sockets[0].getsockname()[1]
+            except Exception as e:
+                errors.append(e)
+                started.set()
+                self._loop.close()
+                return
+            started.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                self._server.close()
+                # drop the idle keep-alive connections
+                pending = asyncio.all_tasks(self._loop)
+                for task in pending:
+                    task.cancel()
+                self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+                self._loop.run_until_complete(self._server.wait_closed())
+                self._loop.close()
+
+        self._thread = threading.Thread(target=serve, name="dds-callback-receiver", daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread = None
+            raise errors[0]
+        logger.info(f"callback receiver is listening on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def register(self, task_uuid: str):
+        """
+        Start waiting for the callback of a task, a callback received before is delivered at once.
+
+        :param task_uuid: The uuid of the task.
+        """
+        with self._lock:
+            event = self._waiters.setdefault(task_uuid, threading.Event())
+            early = self._early.pop(task_uuid, None)
+            if early is not None:
+                self._payloads[task_uuid] = early[1]
+                event.set()
+
+    def unregister(self, task_uuid: str):
+        """
+        Stop waiting for the callback of a task.
+
+        :param task_uuid: The uuid of the task.
+        """
+        with self._lock:
+            self._waiters.pop(task_uuid, None)
+            self._payloads.pop(task_uuid, None)
+
+    def wait(self, task_uuid: str, timeout: float = None) -> Optional[dict]:
+        """
+        Block until a callback of a registered task arrives.
+
+        :param task_uuid: The uuid of the task.
+        :param timeout: The seconds to wait at most.
+        :return: The task data of the callback, like the data of a task status response,
+            or None if no callback arrived in time.
+        """
+        event = self._waiters.get(task_uuid)
+        if event is None:
+            raise RuntimeError(f"Task {task_uuid} is not registered to the callback receiver")
+        if not event.wait(timeout):
+            return None
+        with self._lock:
+            event.clear()
+            return self._payloads.pop(task_uuid, None)
+
+    def deliver(self, task_data: dict) -> bool:
+        """
+        Hand the task data of a callback to the task waiting for it.
+
+        :param task_data: The task data, with the ``uuid`` and ``status`` of the task.
+        :return: Whether a task was waiting for it.
+        """
+        task_uuid = task_data.get("uuid") or task_data.get("task_uuid")
+        now = time.time()
+        with self._lock:
+            self.received += 1
+            event = self._waiters.get(task_uuid)
+            if event is not None:
+                # callbacks may arrive out of order, never replace a final status with an earlier one
+                current = self._payloads.get(task_uuid)
+                if current is None or current.get("status") not in _TERMINAL_STATUSES:
+                    self._payloads[task_uuid] = task_data
+                event.set()
+                return True
+
+            current = self._early.get(task_uuid)
+            if current is None or current[1].get("status") not in _TERMINAL_STATUSES:
+                self._early[task_uuid] = (now, task_data)
+                self._early.move_to_end(task_uuid)
+            while self._early:
+                received_at = next(iter(self._early.values()))[0]
+                if len(self._early) <= self.max_unmatched and now - received_at <= self.unmatched_ttl:
+                    break
+                self._early.popitem(last=False)
+                self.unmatched += 1
+            return False
+
+    def _accept(self, method: str, target: str, body: bytes) -> int:
+        url = urlsplit(target)
+        if url.path != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if self.secret and parse_qs(url.query).get("secret", [None])[0] != self.secret:
+            return 403
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400
+        # accept both a bare task data and a status response wrapping it
+        task_data = payload.get("data", payload) if isinstance(payload, dict) else None
+        if not isinstance(task_data, dict) or not (task_data.get("uuid") or task_data.get("task_uuid")):
+            return 400
+        self.deliver(task_data)
+        return 200
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                code = self._accept(method, target, body)
+                content = b'{"code": 0, "msg": "ok"}' if code == 200 else b'{"code": %d}' % code
+                writer.write(
+                    f"HTTP/1.1 {code} {_REASONS[code]}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n\r\n".encode("latin-1") + content
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logger.debug(f"callback connection closed: {e}")
+        except asyncio.CancelledError:
+            pass  # the receiver is stopping
+        finally:
+            writer.close()
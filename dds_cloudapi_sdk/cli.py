@@ -0,0 +1,384 @@
+"""
+The ``dds-cloudapi`` command, running a task on every image of a directory or of a manifest.
+
+A manifest is a JSONL file with an object per line, whose ``image`` is a local path, a URL or a data URL,
+with an optional ``id``, ``api_path`` and ``body`` overriding those of the command line::
+
+    {"id": "cat-1", "image": "images/cat.jpg", "api_path": "/v2/task/dinox/detection", "body": {"prompt": ...}}
+
+Local images are resized and encoded in a process pool while the tasks run, and every finished task is appended
+to the output as a JSON line with its ``id``, ``status`` and ``result`` or ``error``::
+
+    export DDS_CLOUDAPI_TOKEN="Your API Token Here"
+    dds-cloudapi run images/ -o results.jsonl --api-path /v2/task/dinox/detection \\
+        --body '{"model": "DINO-X-1.0", "prompt": {"type": "text", "text": "person.car"}, "targets": ["bbox"]}' \\
+        --concurrency 16 --rate 10
+
+Running the same command again resumes an interrupted run: the items already succeeded in the output are skipped,
+the failed ones are run again and their new line is appended, so the last line of an ``id`` is the one that counts.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from dds_cloudapi_sdk.client import Client
+from dds_cloudapi_sdk.config import Config
+from dds_cloudapi_sdk.deadline import CancellationToken
+from dds_cloudapi_sdk.image_resizer import image_to_base64
+from dds_cloudapi_sdk.metrics import LatencyHistogram
+from dds_cloudapi_sdk.tasks.base import TaskStatus
+from dds_cloudapi_sdk.tasks.v2_task import V2Task
+from dds_cloudapi_sdk.tasks.v2_task import create_task_with_local_image_auto_resize
+
+__all__ = [
+    "main",
+]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+
+class _Item:
+    __slots__ = ("id", "image", "api_path", "body")
+
+    def __init__(self, id: str, image: str, api_path: str, body: dict):
+        self.id = id
+        self.image = image
+        self.api_path = api_path
+        self.body = body
+
+
+def _is_remote(image: str) -> bool:
+    return image.startswith(("http://", "https://", "data:"))
+
+
+def _directory_items(directory: str, api_path: str, body: dict) -> Tuple[int, Iterator[_Item]]:
+    paths = []
+    for top, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(top, f) for f in sorted(files) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+    def items():
+        for path in paths:
+            yield _Item(os.path.relpath(path, directory).replace(os.sep, "/"), path, api_path, body)
+
+    return len(paths), items()
+
+
+def _manifest_items(manifest: str, api_path: str, body: dict) -> Tuple[int, Iterator[_Item]]:
+    with open(manifest, "rb") as f:
+        total = sum(1 for line in f if line.strip())
+    base = os.path.dirname(os.path.abspath(manifest))
+
+    def items():
+        with open(manifest, "r", encoding="utf8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                image = entry["image"]
+                id = str(entry.get("id") or (f"line-{number}" if image.startswith("data:") else image))
+                if not _is_remote(image) and not os.path.isabs(image):
+                    image = os.path.join(base, image)  # relative to the manifest
+                item_path = entry.get("api_path") or api_path
+                if not item_path:
+                    raise ValueError(f"{manifest}:{number} has no api_path and none is given on the command line")
+                yield _Item(id, image, item_path, {**body, **entry.get("body", {})})
+
+    return total, items()
+
+
+def _done_ids(output: str) -> Set[str]:
+    """The ids of the items already succeeded in an output, a line cut by an interruption is ignored."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, "r", encoding="utf8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == TaskStatus.Success.value:
+                done.add(record["id"])
+            else:
+                done.discard(record.get("id"))
+    return done
+
+
+def _prepare(api_path: str, body: dict, image: str, resize: bool, max_size: Optional[int]) -> V2Task:
+    """Create the task of an item, in a worker process for local images."""
+    body = {k: v for k, v in body.items() if k != "image"}
+    if _is_remote(image):
+        return V2Task(api_path, {**body, "image": image})
+    if resize:
+        return create_task_with_local_image_auto_resize(api_path, body, image, max_size)
+    return V2Task(api_path, {**body, "image": image_to_base64(image)})
+
+
+class _RateLimiter:
+    """Space out calls to at most ``rate`` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self, cancel_token: CancellationToken):
+        with self._lock:
+            now = time.monotonic()
+            at = max(self._next, now)
+            self._next = at + self.interval
+        if at > now:
+            cancel_token.sleep(at - now)
+
+
+class _Progress:
+    """The live throughput and latency readout, on one line rewritten in place on a terminal."""
+
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.skipped = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.latency = LatencyHistogram()
+        self.started_at = time.monotonic()
+        self._recent = collections.deque()  # completion times of the last 10 seconds
+        self._tty = stream.isatty()
+
+    def record(self, ok: bool, seconds: float):
+        if ok:
+            self.succeeded += 1
+            self.latency.record(seconds)
+        else:
+            self.failed += 1
+        self._recent.append(time.monotonic())
+
+    def line(self, in_flight: int) -> str:
+        now = time.monotonic()
+        while self._recent and self._recent[0] < now - 10:
+            self._recent.popleft()
+        rate = len(self._recent) / max(min(10.0, now - self.started_at), 1e-3)
+        done = self.skipped + self.succeeded + self.failed
+        eta = f"{(self.total - done) / rate:.0f}s" if rate > 0 else "-"
+        latency = "-"
+        if self.succeeded:
+            latency = f"p50 {self.latency.percentile(50):.2f}s p99 {self.latency.percentile(99):.2f}s"
+        return (f"{done}/{self.total} done ({self.failed} failed, {self.skipped} skipped), {rate:.1f} tasks/s, "
+                f"latency {latency}, {in_flight} in flight, eta {eta}")
+
+    def show(self, in_flight: int, final: bool = False):
+        if self._tty:
+            self.stream.write(f"\r\033[K{self.line(in_flight)}" + ("\n" if final else ""))
+        else:
+            self.stream.write(self.line(in_flight) + "\n")
+        self.stream.flush()
+
+
+class _Prepared:
+    """The preparation of an item done in the main process, with the interface of a future."""
+
+    def __init__(self, func, *args):
+        try:
+            self._result, self._error = func(*args), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+    def cancel(self) -> bool:
+        return False
+
+
+def _record(item: _Item, task: Optional[V2Task], error: Optional[BaseException], seconds: float) -> dict:
+    record = {"id": item.id, "image": None if item.image.startswith("data:") else item.image,
+              "api_path": item.api_path, "seconds": round(seconds, 3)}
+    if task is not None:
+        record["task_uuid"] = task.task_uuid
+    if error is None and task.status == TaskStatus.Success:
+        record["status"] = TaskStatus.Success.value
+        record["result"] = task.pop_result()
+    else:
+        record["status"] = TaskStatus.Failed.value
+        record["error"] = str(error if error is not None else task.error)
+    return record
+
+
+def run(args: argparse.Namespace) -> int:
+    body = {}
+    if args.body_file:
+        with open(args.body_file, "r", encoding="utf8") as f:
+            body = json.load(f)
+    if args.body:
+        body.update(json.loads(args.body))
+
+    if os.path.isdir(args.input):
+        if not args.api_path:
+            raise SystemExit("--api-path is required to run the images of a directory")
+        total, items = _directory_items(args.input, args.api_path, body)
+    else:
+        total, items = _manifest_items(args.input, args.api_path, body)
+
+    token = args.token or os.environ.get("DDS_CLOUDAPI_TOKEN")
+    if not token:
+        raise SystemExit("An API token is required, with --token or the DDS_CLOUDAPI_TOKEN environment variable")
+    config = Config(token)
+    if args.endpoint:
+        config.endpoint = args.endpoint
+    client = Client(config)
+    client.warmup(min(args.concurrency, 32))
+
+    progress = _Progress(total)
+    done = _done_ids(args.output)
+
+    def remaining() -> Iterator[_Item]:
+        for item in items:
+            if item.id in done:
+                progress.skipped += 1
+            else:
+                yield item
+
+    todo = remaining()
+    limiter = _RateLimiter(args.rate) if args.rate else None
+    cancel_token = CancellationToken()
+
+    def run_one(preparation) -> Tuple[Optional[V2Task], Optional[BaseException], float]:
+        start = time.monotonic()
+        task = None
+        try:
+            task = preparation.result()
+            if limiter is not None:
+                limiter.wait(cancel_token)
+            start = time.monotonic()
+            client.run_task(task, args.timeout, cancel_token)
+            return task, None, time.monotonic() - start
+        except Exception as e:
+            return task, e, time.monotonic() - start
+
+    # the output may end with a line cut by an interruption
+    with open(args.output, "ab") as f:
+        if f.tell() > 0:
+            with open(args.output, "rb") as r:
+                r.seek(-1, os.SEEK_END)
+                if r.read(1) != b"\n":
+                    f.write(b"\n")
+
+    processes = None
+    if args.processes:
+        # Ctrl-C interrupts the whole process group, only the main process handles it
+        processes = ProcessPoolExecutor(
+            args.processes, initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN)
+        )
+    threads = ThreadPoolExecutor(args.concurrency, thread_name_prefix="dds-cli")
+    prepared = collections.deque()  # the items being prepared, in order
+    pending = {}  # the future of each task started -> its item
+    interrupted = False
+    try:
+        with open(args.output, "a", encoding="utf8") as output:
+
+            def prepare_more():
+                # prepare ahead of the runs to keep the process pool busy
+                while len(prepared) < 2 * (args.processes or 1):
+                    item = next(todo, None)
+                    if item is None:
+                        return
+                    prepare_args = (item.api_path, item.body, item.image, not args.no_resize, args.max_size)
+                    if processes is None or _is_remote(item.image):
+                        prepared.append((item, _Prepared(_prepare, *prepare_args)))
+                    else:
+                        prepared.append((item, processes.submit(_prepare, *prepare_args)))
+
+            def start_more():
+                prepare_more()
+                while prepared and len(pending) < 2 * args.concurrency:
+                    item, preparation = prepared.popleft()
+                    pending[threads.submit(run_one, preparation)] = item
+                    prepare_more()
+
+            start_more()
+            last_shown = time.monotonic()
+            while pending:
+                finished, _ = wait(pending, timeout=args.progress_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    item = pending.pop(future)
+                    task, error, seconds = future.result()
+                    record = _record(item, task, error, seconds)
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    progress.record(record["status"] == TaskStatus.Success.value, seconds)
+                start_more()
+                if time.monotonic() - last_shown >= args.progress_interval:
+                    progress.show(len(pending))
+                    last_shown = time.monotonic()
+    except KeyboardInterrupt:
+        interrupted = True
+        cancel_token.cancel("interrupted")
+    finally:
+        # don't start what is still queued, shutdown(cancel_futures=True) needs Python 3.9
+        for future in pending:
+            future.cancel()
+        for _, preparation in prepared:
+            preparation.cancel()
+        threads.shutdown(wait=True)
+        if processes is not None:
+            processes.shutdown(wait=True)
+
+    progress.show(0, final=True)
+    if interrupted:
+        sys.stderr.write(f"Interrupted, run the same command again to resume from {args.output}\n")
+        return 130
+    return 1 if progress.failed else 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="dds-cloudapi", description="Run DDS Cloud API tasks in bulk.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a task on every image of a directory or a JSONL manifest")
+    run_parser.add_argument("input", help="a directory of images, or a JSONL manifest of images")
+    run_parser.add_argument("-o", "--output", required=True, help="the JSONL file the results are appended to")
+    run_parser.add_argument("--api-path", help="the api path of the tasks, e.g. /v2/task/dinox/detection")
+    run_parser.add_argument("--body", help="the request body of the tasks without the image, as JSON")
+    run_parser.add_argument("--body-file", help="a JSON file of the request body, --body is merged into it")
+    run_parser.add_argument("--token", help="the API token, $DDS_CLOUDAPI_TOKEN by default")
+    run_parser.add_argument("--endpoint", help="the endpoint of the API, $DDS_CLOUDAPI_ENDPOINT by default")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="the number of tasks run at a time")
+    run_parser.add_argument("--rate", type=float, help="the maximum number of tasks started per second")
+    run_parser.add_argument("--processes", type=int, default=os.cpu_count(),
+                            help="the processes resizing and encoding images, 0 to do it in the main process")
+    run_parser.add_argument("--no-resize", action="store_true", help="upload the images at their full resolution")
+    run_parser.add_argument("--max-size", type=int, help="the maximum size of the longest edge of the images")
+    run_parser.add_argument("--timeout", type=float, help="the maximum seconds of each task")
+    run_parser.add_argument("--progress-interval", type=float, default=1.0, help="the seconds between readouts")
+    run_parser.add_argument("--verbose", action="store_true", help="show the logs of the SDK")
+    run_parser.set_defaults(func=run)
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
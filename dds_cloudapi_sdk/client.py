@@ -18,12 +18,39 @@ A simple example illustrating the major interface::
 
 """
 
+import copy
 import os.path
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
 
 import requests
 
+from dds_cloudapi_sdk.balancer import LoadBalancer
+from dds_cloudapi_sdk.cache import BaseCache
+from dds_cloudapi_sdk.callback import CallbackReceiver
+from dds_cloudapi_sdk.coalescing import SingleFlight
 from dds_cloudapi_sdk.config import Config
+from dds_cloudapi_sdk.connection import KeepAlive
+from dds_cloudapi_sdk.connection import warmup
+from dds_cloudapi_sdk.deadline import CancellationToken
+from dds_cloudapi_sdk.deadline import DeadlineExceeded
+from dds_cloudapi_sdk.deadline import TaskCancelled
+from dds_cloudapi_sdk.metrics import TaskMetrics
+from dds_cloudapi_sdk.pipeline import PipelinedExecutor
+from dds_cloudapi_sdk.retry import RetryPolicy
+from dds_cloudapi_sdk.scheduler import Priority
+from dds_cloudapi_sdk.scheduler import Scheduler
 from dds_cloudapi_sdk.tasks.base import BaseTask
+from dds_cloudapi_sdk.tasks.base import TaskStatus
+from dds_cloudapi_sdk.tasks.base import http_session
 
 __all__ = [
     "Client"
@@ -39,19 +66,63 @@ class Client:
     - 2. run tasks and wait for the results
 
     :param config: The :class:`Config <dds_cloudapi_sdk.config.Config>` object.
+    :param retry_policy: The :class:`RetryPolicy <dds_cloudapi_sdk.retry.RetryPolicy>` overriding the one of the config.
+    :param cache: The :class:`cache <dds_cloudapi_sdk.cache.BaseCache>` of task results, results are not cached if not provided.
+    :param coalesce: Whether to run identical tasks submitted concurrently only once and share the result among them.
+    :param metrics: The :class:`TaskMetrics <dds_cloudapi_sdk.metrics.TaskMetrics>` to record the phase latencies of tasks in.
+    :param callback_receiver: The :class:`CallbackReceiver <dds_cloudapi_sdk.callback.CallbackReceiver>` overriding the one of the config.
+    :param balancer: The :class:`LoadBalancer <dds_cloudapi_sdk.balancer.LoadBalancer>` overriding the one of the config.
+    :param scheduler: The :class:`Scheduler <dds_cloudapi_sdk.scheduler.Scheduler>` admitting tasks to the server by priority, tasks run as soon as they are submitted if not provided.
 
     """
 
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        retry_policy: RetryPolicy = None,
+        cache: BaseCache = None,
+        coalesce: bool = False,
+        metrics: TaskMetrics = None,
+        callback_receiver: CallbackReceiver = None,
+        balancer: LoadBalancer = None,
+        scheduler: Scheduler = None,
+    ):
+        if retry_policy is not None or callback_receiver is not None or balancer is not None:
+            # the overrides are the client's own, other clients and tasks sharing the config keep theirs
+            config = copy.copy(config)
         self.config = config
+        self.cache = cache
+        self.single_flight = SingleFlight() if coalesce else None
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self._outstanding = {}  # task uuid -> the balancer backend of a task triggered with trigger_task
+        if retry_policy is not None:
+            self.config.retry_policy = retry_policy
+        if callback_receiver is not None:
+            self.config.callback_receiver = callback_receiver
+        if balancer is not None:
+            self.config.balancer = balancer
 
     def trigger_task(self, task: BaseTask):
         """
         Trigger a task and return immediately without waiting for the result.
 
+        | With a pool of endpoints or tokens, the task is triggered on the backend picked by the load balancer,
+          and counted as outstanding on it until :meth:`check_task` or :meth:`wait_task` sees it finished.
+
         :param task: The task to trigger.
         """
-        return task.trigger(self.config)
+        if self.config.balancer is None:
+            return task.trigger(self.config)
+        backend = task._trigger_balanced(self.config)
+        if backend is not None:
+            self._outstanding[task.task_uuid] = backend
+
+    def _release_backend(self, task: BaseTask):
+        if task.status in (TaskStatus.Success, TaskStatus.Failed):
+            backend = self._outstanding.pop(task.task_uuid, None)
+            if backend is not None:
+                self.config.balancer.release(backend)
 
     def check_task(self, task: BaseTask):
         """
@@ -59,22 +130,248 @@ class Client:
 
         :param task: The task to check.
         """
-        return task.check()
+        try:
+            return task.check()
+        finally:
+            self._release_backend(task)
 
-    def wait_task(self, task: BaseTask):
+    def wait_task(self, task: BaseTask, timeout: float = None, cancel_token: CancellationToken = None):
         """
         | Wait for the task to complete.
-        | This blocks the current thread until the task is done.
+        | This blocks the current thread until the task is done, the timeout runs out or the token is cancelled.
 
         :param task: The task to wait.
+        :param timeout: The maximum seconds to wait.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the wait with.
         """
-        return task.wait()
+        try:
+            return task.wait(timeout, cancel_token)
+        finally:
+            self._release_backend(task)
+            if self.metrics is not None:
+                self.metrics.record(task)
 
-    def run_task(self, task: BaseTask):
+    def run_task(
+        self,
+        task: BaseTask,
+        timeout: float = None,
+        cancel_token: CancellationToken = None,
+        priority: int = Priority.Normal,
+        tenant: str = None,
+    ):
         """
         | Trigger a task and wait for it to complete.
-        | This blocks the current thread until the task is done.
+        | This blocks the current thread until the task is done, the timeout runs out or the token is cancelled.
 
         :param task: The task to run.
+        :param timeout: The maximum seconds to spend on the task, including the time waiting for the scheduler,
+            :class:`DeadlineExceeded <dds_cloudapi_sdk.deadline.DeadlineExceeded>` is raised when it runs out.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the task with.
+        :param priority: The :class:`Priority <dds_cloudapi_sdk.scheduler.Priority>` class of the task in the scheduler.
+        :param tenant: The tenant the task is fairly scheduled as, its api path by default.
+        """
+        token = CancellationToken.combine(timeout, cancel_token)
+        slot = (priority, tenant or task.api_path)
+        if self.cache is None and self.single_flight is None:
+            return self._run(task, token, slot)
+
+        key = task.cache_key()
+        if self.cache is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                task.config = self.config
+                task.set_result(result)
+                return
+
+        if self.single_flight is None:
+            self._run_and_cache(task, key, token, slot)
+            return
+
+        # followers wait for the leader until their own deadline, and one of them runs the task
+        # if the leader is abandoned, whose deadline or cancellation doesn't apply to them
+        leader, shared = self.single_flight.do(
+            key, self._run_and_cache, task, key, token, slot,
+            cancel_token=token, takeover=(DeadlineExceeded, TaskCancelled),
+        )
+        if shared:
+            task.config = leader.config
+            task.task_uuid = leader.task_uuid
+            task.set_result(copy.deepcopy(leader.result))
+
+    def run_tasks(
+        self,
+        tasks: List[BaseTask],
+        max_workers: int = 8,
+        timeout: float = None,
+        task_timeout: float = None,
+        cancel_token: CancellationToken = None,
+        priority: int = Priority.Batch,
+        tenant: str = None,
+    ) -> List[Optional[Exception]]:
+        """
+        | Run many tasks concurrently and wait for all of them.
+        | Once the batch is cancelled, or the time left is shorter than the typical duration of its tasks,
+          the remaining tasks are not triggered any more. Running tasks are abandoned when the deadline passes.
+
+        :param tasks: The tasks to run.
+        :param max_workers: The number of tasks run at the same time.
+        :param timeout: The maximum seconds to spend on the whole batch.
+        :param task_timeout: The maximum seconds to spend on each task.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the batch with.
+        :param priority: The :class:`Priority <dds_cloudapi_sdk.scheduler.Priority>` class of the tasks in the scheduler.
+        :param tenant: The tenant the tasks are fairly scheduled as, their api path by default.
+        :return: The error of each task in the order of ``tasks``, None for the tasks that succeeded.
         """
-        return task.run(self.config)
+        batch_token = CancellationToken.combine(timeout, cancel_token)
+        lock = threading.Lock()
+        expected = [None]  # the moving average of the seconds a task takes
+
+        def run_one(task: BaseTask):
+            if batch_token is not None:
+                batch_token.raise_if_done("batch")
+                remaining = batch_token.remaining()
+                if remaining is not None and expected[0] is not None and remaining < expected[0]:
+                    raise DeadlineExceeded(
+                        f"{task} is not triggered, {remaining:.2f}s left in the batch but tasks take {expected[0]:.2f}s"
+                    )
+
+            start = time.monotonic()
+            self.run_task(task, task_timeout, batch_token, priority, tenant)
+            elapsed = time.monotonic() - start
+            with lock:
+                expected[0] = elapsed if expected[0] is None else 0.8 * expected[0] + 0.2 * elapsed
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dds-run-tasks") as executor:
+            futures = [executor.submit(run_one, task) for task in tasks]
+            return [future.exception() for future in futures]
+
+    def stream_tasks(
+        self,
+        tasks: Iterable[BaseTask],
+        max_workers: int = 8,
+        cancel_token: CancellationToken = None,
+        priority: int = Priority.Batch,
+        tenant: str = None,
+    ) -> Iterator[Tuple[BaseTask, Optional[Exception]]]:
+        """
+        | Run tasks pulled from an iterable and yield each of them as soon as it is done.
+        | Tasks are pulled only when a worker is about to be free, so a generator of millions of tasks
+          has at most ``2 * max_workers`` of them alive at a time. Consume the results with
+          :meth:`pop_result <dds_cloudapi_sdk.tasks.base.BaseTask.pop_result>` to not keep them around.
+
+        :param tasks: The tasks to run, typically a generator.
+        :param max_workers: The number of tasks run at the same time.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the tasks with.
+        :param priority: The :class:`Priority <dds_cloudapi_sdk.scheduler.Priority>` class of the tasks in the scheduler.
+        :param tenant: The tenant the tasks are fairly scheduled as, their api path by default.
+        :return: An iterator of each task and its error, None if it succeeded, in completion order.
+        """
+        iterator = iter(tasks)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dds-stream-tasks") as executor:
+
+            def submit() -> bool:
+                task = next(iterator, None)
+                if task is None:
+                    return False
+                pending[executor.submit(self.run_task, task, None, cancel_token, priority, tenant)] = task
+                return True
+
+            try:
+                while len(pending) < 2 * max_workers and submit():
+                    pass
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task = pending.pop(future)
+                        submit()
+                        yield task, future.exception()
+            finally:
+                # the consumer stopped early, don't start the queued tasks
+                for future in pending:
+                    future.cancel()
+
+    def pipeline(
+        self,
+        upload_workers: int = 2,
+        trigger_workers: int = 4,
+        poll_workers: int = 2,
+        post_workers: int = 2,
+        max_in_flight: int = 64,
+        queue_size: int = 16,
+        poll_interval: float = 0.5,
+    ) -> PipelinedExecutor:
+        """
+        | Create an executor running tasks through separate upload, trigger, poll and post-process stages.
+        | Unlike :meth:`run_tasks`, a slow upload never keeps a worker from polling the tasks already triggered,
+          and the occupancy of each stage tells which one to give more workers to.
+
+        :param upload_workers: The workers creating tasks and serializing their request bodies.
+        :param trigger_workers: The workers sending the trigger requests.
+        :param poll_workers: The workers checking the status of the triggered tasks.
+        :param post_workers: The workers formatting the results of the finished tasks.
+        :param max_in_flight: The maximum number of tasks triggered and not finished yet.
+        :param queue_size: The capacity of the queue in front of each stage.
+        :param poll_interval: The seconds between two status checks of a task.
+        :return: The :class:`PipelinedExecutor <dds_cloudapi_sdk.pipeline.PipelinedExecutor>`, run tasks with its ``map``.
+        """
+        return PipelinedExecutor(
+            self,
+            upload_workers=upload_workers,
+            trigger_workers=trigger_workers,
+            poll_workers=poll_workers,
+            post_workers=post_workers,
+            max_in_flight=max_in_flight,
+            queue_size=queue_size,
+            poll_interval=poll_interval,
+        )
+
+    def _endpoint_urls(self) -> List[str]:
+        endpoints = [self.config.endpoint]
+        if self.config.balancer is not None:
+            endpoints = list(dict.fromkeys(b.endpoint for b in self.config.balancer.backends))
+        return [e if e.startswith("http") else f"https://{e}" for e in endpoints]
+
+    def warmup(self, connections: int = 4, timeout: float = 10.0) -> int:
+        """
+        | Open keep-alive connections to every endpoint before the first tasks, so their triggers don't pay
+          the DNS, TCP and TLS handshakes.
+        | Failures are logged and not raised.
+
+        :param connections: The number of connections to open per endpoint, the number of tasks triggered
+            at the same time is a good fit.
+        :param timeout: The seconds to wait for each connection.
+        :return: The number of connections opened.
+        """
+        return warmup(http_session, self._endpoint_urls(), connections, timeout)
+
+    def keepalive(self, interval: float = 30.0, connections: int = 4) -> KeepAlive:
+        """
+        Start refreshing the connections to every endpoint from a background thread whenever no request was sent
+        for ``interval`` seconds, so the next burst of tasks finds them open.
+
+        :param interval: The idle seconds after which the connections are refreshed,
+            shorter than the idle timeout of the server.
+        :param connections: The number of connections kept open per endpoint.
+        :return: The started :class:`KeepAlive <dds_cloudapi_sdk.connection.KeepAlive>`, stop it with ``stop``.
+        """
+        return KeepAlive(http_session, self._endpoint_urls(), interval, connections).start()
+
+    def _run(self, task: BaseTask, cancel_token: CancellationToken = None, slot: tuple = None):
+        try:
+            if self.scheduler is None:
+                task.run(self.config, cancel_token=cancel_token)
+            else:
+                priority, tenant = slot or (Priority.Normal, task.api_path)
+                with self.scheduler.slot(priority, tenant, cancel_token):
+                    task.run(self.config, cancel_token=cancel_token)
+        finally:
+            if self.metrics is not None:
+                self.metrics.record(task)
+
+    def _run_and_cache(self, task: BaseTask, key: str, cancel_token: CancellationToken = None,
+                       slot: tuple = None) -> BaseTask:
+        self._run(task, cancel_token, slot)
+        if self.cache is not None and task.status == TaskStatus.Success:
+            self.cache.set(key, task.result)
+        return task
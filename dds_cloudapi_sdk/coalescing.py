@@ -0,0 +1,105 @@
+"""
+Request coalescing for identical in-flight calls.
+
+:class:`SingleFlight` lets concurrent callers sharing the same key wait on a single execution of a function
+instead of running it once each. The :class:`Client <dds_cloudapi_sdk.client.Client>` uses it with
+``coalesce=True`` to trigger identical tasks only once::
+
+    client = Client(config, coalesce=True)
+
+    # identical tasks submitted from many threads at once are triggered and polled only once,
+    # and every caller gets a copy of the single result
+    client.run_task(task)
+
+"""
+
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+from typing import Type
+
+from dds_cloudapi_sdk.deadline import CancellationToken
+
+__all__ = [
+    "SingleFlight",
+]
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls by key.
+
+    The first caller of a key, the leader, runs the function; callers arriving while it runs wait for it
+    and share its return value or exception, unless the exception is one to take over on, in which case
+    one of them becomes the leader and runs the function again. Once the call is done the key is forgotten,
+    so later callers run the function again.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.shared = 0  # the number of calls served by another caller's execution
+
+    def in_flight(self) -> int:
+        """The number of keys being executed."""
+        return len(self._calls)
+
+    def do(self, key: str, func: Callable, *args, cancel_token: CancellationToken = None,
+           takeover: Tuple[Type[BaseException], ...] = (), **kwargs) -> Tuple[Any, bool]:
+        """
+        Run ``func`` once for all concurrent callers of ``key``.
+
+        :param key: The key identifying duplicated calls.
+        :param func: The function to call.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` bounding
+            the wait of this caller for the leader, its own error is raised when it is cancelled or expires.
+        :param takeover: The errors of the leader after which a waiting caller runs the function itself rather than
+            sharing the error, such as the leader running out of its own time.
+        :return: A tuple of the return value of ``func`` and whether it was shared with the leader.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is not None:
+                    self.shared += 1
+                    leader = False
+                else:
+                    call = self._calls[key] = _Call()
+                    leader = True
+
+            if leader:
+                break
+
+            if cancel_token is None:
+                call.done.wait()
+            else:
+                # wake up regularly to notice the cancellation of the token
+                while not call.done.wait(cancel_token.limit(0.25)):
+                    cancel_token.raise_if_done("coalesced call")
+            if isinstance(call.error, takeover):
+                with self._lock:
+                    self.shared -= 1
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        try:
+            call.value = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value, False
@@ -9,8 +9,16 @@ This process involves creating an instance of the :class:`Config <dds_cloudapi_s
 
 """
 
+import copy
 import enum
 import os
+import tempfile
+from typing import List
+
+from dds_cloudapi_sdk.balancer import Backend
+from dds_cloudapi_sdk.balancer import LoadBalancer
+from dds_cloudapi_sdk.callback import CallbackReceiver
+from dds_cloudapi_sdk.retry import RetryPolicy
 
 
 class ServerEnv(enum.Enum):
@@ -25,6 +33,12 @@ class ServerEndpoint(enum.Enum):
     Prd = "api.deepdataspace.com"
 
 
+class BodyRetention(enum.Enum):
+    Keep = "keep"  # tasks keep their request body
+    Release = "release"  # tasks drop their request body once triggered
+    Spill = "spill"  # tasks move their request body to a file once triggered, until they succeed
+
+
 def _choose_endpoint():
     endpoint = os.environ.get("DDS_CLOUDAPI_ENDPOINT", ServerEndpoint.Prd.value)
     return endpoint
@@ -35,13 +49,55 @@ class Config:
     The configuration representation for the SDK client.
 
     :param token: The API token of your DDS account. Currently, you can apply for an API token with `this form <https://deepdataspace.com/request_api>`_.
+    :param retry_policy: The :class:`RetryPolicy <dds_cloudapi_sdk.retry.RetryPolicy>` of tasks, a default policy is used if not provided.
+    :param callback_receiver: The :class:`CallbackReceiver <dds_cloudapi_sdk.callback.CallbackReceiver>` tasks wait for completion callbacks with, tasks poll their status if not provided.
+    :param endpoints: A pool of endpoints to spread tasks over, see :class:`LoadBalancer <dds_cloudapi_sdk.balancer.LoadBalancer>`.
+    :param tokens: A pool of API tokens to spread tasks over, every token must be valid on every endpoint.
+    :param body_retention: What triggered tasks do with their request body, see :class:`BodyRetention`.
+        Releasing it keeps bulk jobs with large base64 images from holding every image in memory.
+    :param spill_dir: The directory request bodies are spilled to, a temporary directory by default.
 
     """
 
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        retry_policy: RetryPolicy = None,
+        callback_receiver: CallbackReceiver = None,
+        endpoints: List[str] = None,
+        tokens: List[str] = None,
+        body_retention: BodyRetention = BodyRetention.Keep,
+        spill_dir: str = None,
+    ):
         """
         Initialize a configuration with API token.
         """
 
         self.endpoint: str = _choose_endpoint()
         self.token: str = token
+        self.retry_policy: RetryPolicy = retry_policy or RetryPolicy()
+        self.callback_receiver: CallbackReceiver = callback_receiver
+        self.balancer: LoadBalancer = None
+        self.backend: Backend = None  # the backend a task is pinned to, see pin()
+        self.body_retention: BodyRetention = body_retention
+        self.spill_dir: str = spill_dir
+        if body_retention == BodyRetention.Spill:
+            self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="dds_task_bodies_")
+            os.makedirs(self.spill_dir, exist_ok=True)
+        # a pool of one entry is just the endpoint or the token to use
+        if endpoints and len(endpoints) == 1:
+            self.endpoint = endpoints[0]
+        if tokens and len(tokens) == 1:
+            self.token = tokens[0]
+        if len(endpoints or []) > 1 or len(tokens or []) > 1:
+            self.balancer = LoadBalancer.from_pools(endpoints or [self.endpoint], tokens or [self.token])
+
+    def pin(self, backend: Backend) -> "Config":
+        """
+        A copy of the config sending every request to the endpoint and with the token of a backend.
+        """
+        config = copy.copy(self)
+        config.endpoint = backend.endpoint
+        config.token = backend.token
+        config.backend = backend
+        return config
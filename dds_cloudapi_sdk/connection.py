@@ -0,0 +1,239 @@
+"""
+Keep the connections to the DDS Cloud API open, and cheap to open again.
+
+Every request of the SDK goes through one :class:`requests.Session` with a :class:`KeepAliveAdapter` mounted.
+The adapter pools keep-alive connections, enables TCP keepalive on them, and resumes the TLS session of the last
+connection to a host on the next one, which skips the certificate exchange and verification of a full handshake.
+
+A worker can open its connections before its first tasks, and keep them open between bursts of tasks::
+
+    client = Client(config)
+    client.warmup(connections=8)  # DNS, TCP and TLS handshakes happen here rather than on the first triggers
+    keepalive = client.keepalive(interval=30)
+    ...
+    keepalive.stop()
+
+To trust another certificate authority, such as the one of a proxy, mount an adapter with its own context::
+
+    from dds_cloudapi_sdk.connection import configure_session
+    from dds_cloudapi_sdk.connection import create_ssl_context
+    from dds_cloudapi_sdk.tasks.base import http_session
+
+    configure_session(http_session, create_ssl_context(cafile="proxy-ca.pem"))
+
+"""
+
+import logging
+import socket
+import ssl
+import threading
+import time
+import weakref
+from typing import Dict
+from typing import Sequence
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+from urllib3.connection import HTTPConnection
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+__all__ = [
+    "KeepAlive",
+    "KeepAliveAdapter",
+    "ResumingSSLContext",
+    "configure_session",
+    "create_ssl_context",
+    "warmup",
+]
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    | A client SSL context resuming the TLS session of the last connection to a host on the next connection to it.
+    | With TLS 1.3, the session ticket of a connection arrives after its handshake, it is picked up
+      when the next connection is opened.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self._sockets: Dict[str, weakref.ref] = {}  # host -> the last socket connected to it
+        self._sessions: Dict[str, ssl.SSLSession] = {}  # host -> the session to resume
+        self.handshakes = 0
+        self.resumed = 0
+
+    def _session_of(self, host: str):
+        with self._lock:
+            ref = self._sockets.get(host)
+            sock = ref() if ref is not None else None
+            session = getattr(sock, "session", None) if sock is not None else None
+            if session is not None and (session.has_ticket or session.id):
+                self._sessions[host] = session
+            session = self._sessions.get(host)
+            if session is not None and time.time() >= session.time + session.timeout:
+                del self._sessions[host]
+                session = None
+            return session
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        if server_side:
+            return super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                       server_hostname, session)
+
+        host = server_hostname or "%s:%s" % sock.getpeername()[:2]
+        if session is None:
+            session = self._session_of(host)
+        ssl_sock = super().wrap_socket(sock, server_side, do_handshake_on_connect, suppress_ragged_eofs,
+                                       server_hostname, session)
+        with self._lock:
+            self.handshakes += 1
+            self.resumed += ssl_sock.session_reused
+            self._sockets[host] = weakref.ref(ssl_sock)
+        return ssl_sock
+
+
+def create_ssl_context(cafile: str = None) -> ResumingSSLContext:
+    """
+    Create the client SSL context of a :class:`KeepAliveAdapter`.
+
+    :param cafile: The certificate authorities to trust, those of certifi like requests by default.
+    """
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_verify_locations(cafile or DEFAULT_CA_BUNDLE_PATH)
+    return context
+
+
+def _socket_options() -> list:
+    options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    # probe idle connections every 30s so NAT gateways and load balancers don't forget them
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30), (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 30)]
+    return options
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """
+    An HTTP adapter with TCP keepalive and TLS session resumption, which records when it was last used.
+
+    :param ssl_context: The SSL context of the HTTPS connections, :func:`create_ssl_context` by default.
+    :param pool_maxsize: The number of connections kept open per host.
+    :param kwargs: The other arguments of :class:`requests.adapters.HTTPAdapter`.
+    """
+
+    def __init__(self, ssl_context: ssl.SSLContext = None, pool_maxsize: int = 32, **kwargs):
+        self.ssl_context = ssl_context or create_ssl_context()
+        self.last_used = 0.0  # the monotonic time of the last request
+        super().__init__(pool_maxsize=pool_maxsize, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs.setdefault("ssl_context", self.ssl_context)
+        pool_kwargs.setdefault("socket_options", _socket_options())
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs.setdefault("ssl_context", self.ssl_context)
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+    def send(self, request, **kwargs):
+        self.last_used = time.monotonic()
+        return super().send(request, **kwargs)
+
+
+def configure_session(session: requests.Session, ssl_context: ssl.SSLContext = None,
+                      pool_maxsize: int = 32) -> KeepAliveAdapter:
+    """
+    Mount a :class:`KeepAliveAdapter` on a session for both HTTP and HTTPS.
+
+    :param session: The session to configure.
+    :param ssl_context: The SSL context of the HTTPS connections, :func:`create_ssl_context` by default.
+    :param pool_maxsize: The number of connections kept open per host.
+    :return: The mounted adapter.
+    """
+    adapter = KeepAliveAdapter(ssl_context, pool_maxsize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return adapter
+
+
+def warmup(session: requests.Session, urls: Sequence[str], connections: int = 4, timeout: float = 10.0) -> int:
+    """
+    Open keep-alive connections to the hosts of some URLs, left in the pool of the session for the next requests.
+
+    | Each connection sends a HEAD request, whose response is held until all the connections to the host are open,
+      so every request opens a connection of its own rather than reusing the one of the previous request.
+    | Failures are logged and not raised, a warmup must not keep a worker from starting.
+
+    :param session: The session to warm up.
+    :param urls: A URL on each host to connect to.
+    :param connections: The number of connections to open per host, at most the pool size of the session.
+    :param timeout: The seconds to wait for each request.
+    :return: The number of connections open in the pool.
+    """
+    opened = 0
+    for url in urls:
+        responses = []
+        try:
+            for _ in range(connections):
+                responses.append(session.head(url, timeout=timeout, stream=True, allow_redirects=False))
+        except requests.RequestException as e:
+            logger.warning(f"failed to warm up the connections to {url}: {e}")
+        finally:
+            for rsp in responses:
+                # reading the empty body gives the connection back to the pool
+                rsp.content
+        opened += len(responses)
+    return opened
+
+
+class KeepAlive:
+    """
+    Keep the pooled connections of a session open between bursts of requests.
+
+    | Servers close keep-alive connections idle for some time, a minute or so, and the next burst of requests
+      pays the handshakes again. A background thread warms the connections up again whenever the session has
+      not sent any request for ``interval`` seconds, which must be shorter than the idle timeout of the server.
+
+    :param session: The session to keep alive, its adapters must be :class:`KeepAliveAdapter`.
+    :param urls: A URL on each host to keep connections to.
+    :param interval: The idle seconds after which the connections are refreshed.
+    :param connections: The number of connections kept open per host.
+    """
+
+    def __init__(self, session: requests.Session, urls: Sequence[str], interval: float = 30.0, connections: int = 4):
+        self.session = session
+        self.urls = list(urls)
+        self.interval = interval
+        self.connections = connections
+        self.refreshes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _last_used(self) -> float:
+        return max((getattr(adapter, "last_used", 0.0) for adapter in self.session.adapters.values()), default=0.0)
+
+    def _loop(self):
+        while not self._stop.wait(min(self.interval / 4, 1.0)):
+            if time.monotonic() - self._last_used() >= self.interval:
+                warmup(self.session, self.urls, self.connections)
+                self.refreshes += 1
+
+    def start(self) -> "KeepAlive":
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="dds-keepalive", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
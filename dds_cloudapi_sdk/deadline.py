@@ -0,0 +1,141 @@
+"""
+Deadlines and cooperative cancellation of tasks.
+
+A :class:`CancellationToken` is shared between the code running tasks and the code that may abandon them.
+Tasks check it between requests and wake up from their sleeps as soon as it is cancelled or expires::
+
+    from dds_cloudapi_sdk.deadline import CancellationToken
+    from dds_cloudapi_sdk.deadline import DeadlineExceeded
+
+    token = CancellationToken(timeout=30)  # expires in 30 seconds
+    try:
+        client.run_task(task, cancel_token=token)
+    except DeadlineExceeded:
+        ...
+
+    # from another thread
+    token.cancel("user pressed stop")
+
+Tokens can be nested: a child token expires with its parent, so a per-task timeout never outlives the
+deadline of the batch it belongs to.
+"""
+
+import threading
+import time
+import weakref
+from typing import Optional
+
+__all__ = [
+    "CancellationToken",
+    "DeadlineExceeded",
+    "TaskCancelled",
+]
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a task or a batch of tasks runs out of time.
+    """
+
+
+class TaskCancelled(RuntimeError):
+    """
+    Raised when a task is abandoned through its :class:`CancellationToken`.
+    """
+
+
+class CancellationToken:
+    """
+    A flag to cancel work from another thread, with an optional deadline.
+
+    :param timeout: The seconds from now after which the token expires, None for no deadline.
+    :param parent: A token whose cancellation and deadline also apply to this one.
+    """
+
+    def __init__(self, timeout: Optional[float] = None, parent: "CancellationToken" = None):
+        self._event = threading.Event()
+        self._children = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.deadline: Optional[float] = time.monotonic() + timeout if timeout is not None else None
+
+        if parent is not None:
+            if parent.deadline is not None and (self.deadline is None or parent.deadline < self.deadline):
+                self.deadline = parent.deadline
+            with parent._lock:
+                parent._children.add(self)
+            if parent.cancelled:
+                self.cancel(parent.reason)
+
+    @classmethod
+    def combine(cls, timeout: Optional[float] = None, parent: "CancellationToken" = None) -> Optional["CancellationToken"]:
+        """
+        A token for the given timeout and parent, or None if neither is given.
+        """
+        if timeout is None and parent is None:
+            return None
+        return cls(timeout, parent)
+
+    def cancel(self, reason: str = "cancelled"):
+        """
+        Cancel the token and all its children.
+
+        :param reason: Why the work is cancelled, reported by :class:`TaskCancelled`.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            children = list(self._children)
+        for child in children:
+            child.cancel(reason)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self) -> Optional[float]:
+        """
+        The seconds left before the deadline, None if there is no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def raise_if_done(self, what: str = "task"):
+        """
+        Raise :class:`TaskCancelled` if the token is cancelled, or :class:`DeadlineExceeded` if it expired.
+
+        :param what: The work being done, used in the error message.
+        """
+        if self.cancelled:
+            raise TaskCancelled(f"{what} is cancelled: {self.reason}")
+        if self.expired:
+            raise DeadlineExceeded(f"{what} exceeded its deadline")
+
+    def sleep(self, seconds: float) -> bool:
+        """
+        Sleep for some seconds, waking up early if the token is cancelled or expires.
+
+        :param seconds: The seconds to sleep.
+        :return: Whether the token is still usable after the sleep.
+        """
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(seconds)
+        return not (self.cancelled or self.expired)
+
+    def limit(self, seconds: float) -> float:
+        """
+        Cap a duration, such as a request timeout, to the time left before the deadline.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return seconds
+        return max(min(seconds, remaining), 0.001)
@@ -0,0 +1,410 @@
+"""
+Search the object embeddings of task results locally, for visual retrieval and deduplication.
+
+Tasks with ``"targets": ["embedding"]`` return an embedding per object. :func:`collect_embeddings` gathers them
+into a float32 matrix, memory-mapped from a ``.npy`` file for collections larger than memory, and the indexes
+answer batched top-k queries with matrix products::
+
+    from dds_cloudapi_sdk.embedding_index import FlatIndex
+    from dds_cloudapi_sdk.embedding_index import IVFIndex
+    from dds_cloudapi_sdk.embedding_index import collect_embeddings
+
+    vectors, refs = collect_embeddings(((path, task.result) for path, task in zip(paths, tasks)), "embeddings.npy")
+    index = FlatIndex(vectors)  # exact
+    index = IVFIndex(vectors, nprobe=16, pq_m=32)  # approximate, for millions of embeddings
+    scores, ids = index.search(queries, k=10)
+    print(refs[ids[0, 0]])  # (path, index of the object in the result) of the best match of the first query
+
+Scores are cosine similarities by default, inner products with ``metric="ip"``
+and squared euclidean distances, ranked in ascending order, with ``metric="l2"``.
+"""
+
+import abc
+import json
+import os
+import tempfile
+from typing import Any
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import numpy as np
+
+__all__ = [
+    "FlatIndex",
+    "IVFIndex",
+    "collect_embeddings",
+]
+
+_METRICS = ("cosine", "ip", "l2")
+
+
+def collect_embeddings(items: Iterable[Tuple[Any, dict]], path: str = None) -> Tuple[np.ndarray, List[Tuple[Any, int]]]:
+    """
+    Gather the object embeddings of results into a float32 matrix.
+
+    :param items: Tuples of a reference, such as the image path, and a task result, typically a generator.
+    :param path: A ``.npy`` file to write the matrix to, which is then memory-mapped instead of held in memory.
+    :return: The (N, D) matrix and the reference and object index of each row.
+    """
+    refs = []
+    dim = None
+    rows = []
+    spool = tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(path))) if path else None
+    try:
+        for ref, result in items:
+            embeddings = [(i, obj["embedding"]) for i, obj in enumerate(result.get("objects") or [])
+                          if obj.get("embedding")]
+            if not embeddings:
+                continue
+            block = np.array([embedding for _, embedding in embeddings], dtype=np.float32)
+            if dim is None:
+                dim = block.shape[1]
+            elif block.shape[1] != dim:
+                raise ValueError(f"The embeddings of {ref} have {block.shape[1]} dimensions, expected {dim}")
+            refs.extend((ref, i) for i, _ in embeddings)
+            if spool is None:
+                rows.append(block)
+            else:
+                spool.write(block.tobytes())
+
+        if spool is None:
+            return (np.concatenate(rows) if rows else np.zeros((0, dim or 0), dtype=np.float32)), refs
+
+        matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(refs), dim or 0))
+        spool.seek(0)
+        chunk = 65536
+        for start in range(0, len(refs), chunk):
+            count = min(chunk, len(refs) - start)
+            matrix[start:start + count] = np.frombuffer(spool.read(count * dim * 4), dtype=np.float32).reshape(-1, dim)
+        matrix.flush()
+        del matrix
+        return np.load(path, mmap_mode="r"), refs
+    finally:
+        if spool is not None:
+            spool.close()
+
+
+def _top_k(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k highest scores of each row and their ids, in descending order."""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores, ids = np.take_along_axis(scores, part, 1), np.take_along_axis(ids, part, 1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, 1), np.take_along_axis(ids, order, 1)
+
+
+def _kmeans(x: np.ndarray, k: int, iters: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means of the rows of x, k must not exceed the number of rows."""
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind="stable")
+        nonempty = counts > 0
+        sums = np.add.reduceat(x[order], np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty], axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        # restart the empty clusters from random points
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def _assign(x: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """The index of the nearest centroid of each row of x, by euclidean distance."""
+    half_norms = 0.5 * (centroids * centroids).sum(axis=1)
+    labels = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        block = np.asarray(x[start:start + chunk], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T - half_norms, axis=1)
+    return labels
+
+
+class _Index(abc.ABC):
+    """
+    The interface of an embedding index.
+
+    :param vectors: The (N, D) float32 embeddings, possibly memory-mapped.
+    :param metric: Either cosine, ip or l2.
+    :param chunk_size: The number of rows multiplied at a time.
+    """
+
+    def __init__(self, vectors: np.ndarray, metric: str = "cosine", chunk_size: int = 65536):
+        if metric not in _METRICS:
+            raise ValueError(f"Unsupported metric: {metric}, expected one of {_METRICS}")
+        if vectors.ndim != 2:
+            raise ValueError(f"Expected an (N, D) matrix of embeddings, got shape {vectors.shape}")
+        self.vectors = vectors
+        self.metric = metric
+        self.chunk_size = chunk_size
+
+        # cosine divides by the norms, l2 subtracts half the squared norms: the vectors themselves are left as is
+        norms = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), chunk_size):
+            block = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            norms[start:start + len(block)] = np.sqrt((block * block).sum(axis=1))
+        self._norms = norms
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _queries(self, queries: np.ndarray) -> np.ndarray:
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if queries.shape[1] != self.vectors.shape[1]:
+            raise ValueError(f"Expected queries of {self.vectors.shape[1]} dimensions, got {queries.shape[1]}")
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        return queries
+
+    def _rank_scores(self, products: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        """Turn the inner products of queries with the rows ``ids`` into scores where higher is better."""
+        if self.metric == "cosine":
+            return products / np.maximum(self._norms[ids], 1e-12)
+        if self.metric == "l2":
+            return products - 0.5 * self._norms[ids] ** 2
+        return products
+
+    def _output(self, queries: np.ndarray, scores: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.metric == "l2":
+            # ||q - x||^2 = ||q||^2 - 2 (q.x - ||x||^2 / 2)
+            scores = (queries * queries).sum(axis=1, keepdims=True) - 2 * scores
+            scores[ids < 0] = np.inf
+        return scores, ids
+
+    @abc.abstractmethod
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest embeddings of each query.
+
+        :param queries: A (Q, D) matrix, or a single embedding.
+        :param k: The number of neighbors of each query.
+        :return: The (Q, k) scores and row ids of the neighbors, best first. Missing neighbors have the id -1.
+        """
+        raise NotImplementedError
+
+    def duplicates(self, threshold: float, k: int = 10, batch_size: int = 1024) -> List[Tuple[int, int, float]]:
+        """
+        Find the pairs of near-duplicate embeddings in the index.
+
+        :param threshold: The minimum score of duplicates, or the maximum distance with the l2 metric.
+        :param k: The maximum number of duplicates found per embedding.
+        :param batch_size: The number of embeddings searched at a time.
+        :return: The (i, j, score) of each pair with i < j.
+        """
+        pairs = []
+        for start in range(0, len(self.vectors), batch_size):
+            queries = np.asarray(self.vectors[start:start + batch_size], dtype=np.float32)
+            scores, ids = self.search(queries, k + 1)
+            rows = np.arange(start, start + len(queries))[:, None]
+            close = scores <= threshold if self.metric == "l2" else scores >= threshold
+            mask = close & (ids > rows)
+            for i, j, score in zip(np.broadcast_to(rows, ids.shape)[mask], ids[mask], scores[mask]):
+                pairs.append((int(i), int(j), float(score)))
+        return pairs
+
+
+class FlatIndex(_Index):
+    """
+    Exact search by multiplying the queries with all the embeddings, chunk by chunk.
+
+    :param vectors: The (N, D) float32 embeddings, possibly memory-mapped.
+    :param metric: Either cosine, ip or l2.
+    :param chunk_size: The number of embeddings multiplied at a time.
+    """
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        queries = self._queries(queries)
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), self.chunk_size):
+            block = np.asarray(self.vectors[start:start + self.chunk_size], dtype=np.float32)
+            ids = np.arange(start, start + len(block))
+            scores = self._rank_scores(queries @ block.T, ids)
+            best_scores, best_ids = _top_k(
+                np.concatenate([best_scores, scores], axis=1),
+                np.concatenate([best_ids, np.broadcast_to(ids, scores.shape)], axis=1),
+                k,
+            )
+        return self._output(queries, *_pad(best_scores, best_ids, k))
+
+
+def _pad(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    missing = k - scores.shape[1]
+    if missing <= 0:
+        return scores, ids
+    return (np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf),
+            np.pad(ids, ((0, 0), (0, missing)), constant_values=-1))
+
+
+class IVFIndex(_Index):
+    """
+    Approximate search in the inverted lists of the clusters nearest to each query, optionally on
+    product-quantized codes.
+
+    | The embeddings are clustered by k-means into ``nlist`` inverted lists, a query only scores the embeddings
+      of its ``nprobe`` nearest clusters.
+    | With ``pq_m``, the residual of each embedding to its cluster centroid is also encoded as ``pq_m`` bytes,
+      one 256-centroid code per subspace, and candidates are scored from lookup tables before the best
+      ``rerank * k`` are scored exactly.
+
+    :param vectors: The (N, D) float32 embeddings, possibly memory-mapped.
+    :param nlist: The number of clusters, ``4 * sqrt(N)`` by default.
+    :param nprobe: The number of clusters searched per query.
+    :param metric: Either cosine, ip or l2.
+    :param pq_m: The number of subspaces of the product quantization, which must divide D. No quantization if None.
+    :param rerank: The multiple of k of quantized candidates scored exactly, 0 to return the approximate scores.
+    :param train_size: The number of embeddings sampled to train the clusters and the codebooks.
+    :param iters: The k-means iterations.
+    :param seed: The seed of the sampling.
+    :param chunk_size: The number of embeddings processed at a time while building.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        nlist: int = None,
+        nprobe: int = 8,
+        metric: str = "cosine",
+        pq_m: int = None,
+        rerank: int = 20,
+        train_size: int = 100000,
+        iters: int = 10,
+        seed: int = 0,
+        chunk_size: int = 65536,
+    ):
+        super().__init__(vectors, metric, chunk_size)
+        n, dim = vectors.shape
+        if pq_m is not None and dim % pq_m:
+            raise ValueError(f"pq_m must divide the {dim} dimensions of the embeddings, got {pq_m}")
+        self.nlist = max(1, min(nlist or int(4 * np.sqrt(n)), n))
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.rerank = rerank
+
+        rng = np.random.default_rng(seed)
+        sample = self._normalized(np.asarray(vectors[np.sort(rng.choice(n, min(n, train_size), replace=False))]))
+        self.centroids = _kmeans(sample, self.nlist, iters, rng)
+
+        labels = np.empty(n, dtype=np.int64)
+        self.codebooks = self.codes = None
+        if pq_m is not None:
+            sub = dim // pq_m
+            # each subspace of the residuals is quantized to at most 256 centroids, one byte per subspace,
+            # and 64 points per centroid are plenty to train them
+            residuals = sample[:256 * 64] - self.centroids[_assign(sample[:256 * 64], self.centroids)]
+            self.codebooks = np.stack([
+                _kmeans(np.ascontiguousarray(residuals[:, j * sub:(j + 1) * sub]), min(256, len(residuals)), iters, rng)
+                for j in range(pq_m)
+            ])
+            self.codes = np.empty((n, pq_m), dtype=np.uint8)
+        for start in range(0, n, chunk_size):
+            block = self._normalized(np.asarray(vectors[start:start + chunk_size], dtype=np.float32))
+            block_labels = labels[start:start + len(block)] = _assign(block, self.centroids)
+            if pq_m is not None:
+                block = block - self.centroids[block_labels]
+                for j in range(pq_m):
+                    self.codes[start:start + len(block), j] = _assign(block[:, j * sub:(j + 1) * sub], self.codebooks[j])
+
+        # the inverted lists, as the row ids sorted by cluster and the offset of each cluster
+        self.list_ids = np.argsort(labels, kind="stable")
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=self.nlist))])
+
+    def _normalized(self, block: np.ndarray) -> np.ndarray:
+        """Cosine clusters the directions of the embeddings, the other metrics the embeddings themselves."""
+        block = block.astype(np.float32, copy=False)
+        if self.metric == "cosine":
+            return block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+        return block
+
+    def _candidates(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The row ids in the lists of the clusters nearest to the query, and their cluster."""
+        probes = min(self.nprobe, self.nlist)
+        scores = query @ self.centroids.T - 0.5 * (self.centroids * self.centroids).sum(axis=1)
+        lists = np.argpartition(-scores, probes - 1)[:probes]
+        sizes = self.list_offsets[lists + 1] - self.list_offsets[lists]
+        ids = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+        order = np.argsort(ids)  # sorted ids read a memory-mapped matrix in order
+        return ids[order], np.repeat(lists, sizes)[order]
+
+    def _exact(self, query: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        return self._rank_scores(np.asarray(self.vectors[ids], dtype=np.float32) @ query, ids)
+
+    def _quantized(self, query: np.ndarray, ids: np.ndarray, lists: np.ndarray) -> np.ndarray:
+        sub = query.shape[0] // self.pq_m
+        # q.x = q.c + q.r, with a table of the inner product of each subvector of the query with each
+        # centroid of its subspace for the residual r
+        tables = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.pq_m, sub))
+        products = (self.centroids @ query)[lists] + tables[np.arange(self.pq_m), self.codes[ids]].sum(axis=1)
+        if self.metric == "cosine":
+            return products  # the encoded embeddings are normalized already
+        return self._rank_scores(products, ids)
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        queries = self._queries(queries)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        for q, query in enumerate(queries):
+            ids, lists = self._candidates(query)
+            if len(ids) == 0:
+                continue
+            if self.codes is None:
+                scores = self._exact(query, ids)
+            else:
+                scores = self._quantized(query, ids, lists)
+                if self.rerank:
+                    scores, ids = _top_k(scores[None], ids[None], self.rerank * k)
+                    ids = np.sort(ids[0])
+                    scores = self._exact(query, ids)
+            scores, ids = _top_k(scores[None], ids[None], k)
+            all_scores[q, :ids.shape[1]], all_ids[q, :ids.shape[1]] = scores[0], ids[0]
+        return self._output(queries, all_scores, all_ids)
+
+    def save(self, directory: str):
+        """
+        Save the index, but not the embeddings, as ``.npy`` files that :meth:`load` memory-maps.
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"centroids": self.centroids, "list_ids": self.list_ids, "list_offsets": self.list_offsets,
+                  "norms": self._norms}
+        if self.codes is not None:
+            arrays.update(codebooks=self.codebooks, codes=self.codes)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), array)
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({"metric": self.metric, "nlist": self.nlist, "nprobe": self.nprobe, "pq_m": self.pq_m,
+                       "rerank": self.rerank, "chunk_size": self.chunk_size}, f)
+
+    @classmethod
+    def load(cls, directory: str, vectors: np.ndarray) -> "IVFIndex":
+        """
+        Load an index saved by :meth:`save`.
+
+        :param directory: The directory of the index.
+        :param vectors: The embeddings the index was built on.
+        """
+        with open(os.path.join(directory, "index.json")) as f:
+            meta = json.load(f)
+
+        def array(name: str) -> Optional[np.ndarray]:
+            path = os.path.join(directory, f"{name}.npy")
+            return np.load(path, mmap_mode="r") if os.path.exists(path) else None
+
+        index = cls.__new__(cls)
+        index.vectors = vectors
+        index.metric = meta["metric"]
+        index.chunk_size = meta["chunk_size"]
+        index.nlist = meta["nlist"]
+        index.nprobe = meta["nprobe"]
+        index.pq_m = meta["pq_m"]
+        index.rerank = meta["rerank"]
+        index.centroids = np.asarray(array("centroids"))
+        index.list_ids = array("list_ids")
+        index.list_offsets = np.asarray(array("list_offsets"))
+        index._norms = array("norms")
+        index.codebooks = array("codebooks")
+        index.codes = array("codes")
+        if len(index._norms) != len(vectors):
+            raise ValueError(f"The index was built on {len(index._norms)} embeddings, got {len(vectors)}")
+        return index
@@ -0,0 +1,380 @@
+"""
+Export task results as COCO, LVIS or YOLO datasets, streaming them to disk.
+
+Writers append each image and its annotations to disk as soon as it is added, so exporting thousands of results
+takes about the same memory as exporting one. Masks are converted from dds_rle to coco_rle on their run lengths,
+without decoding them, and :func:`export_results` spreads the conversion over a process pool::
+
+    from dds_cloudapi_sdk.export import CocoWriter
+    from dds_cloudapi_sdk.export import export_results
+
+    with CocoWriter("annotations.json") as writer:
+        export_results(writer, ((path, task.result) for path, task in zip(paths, tasks)), processes=4)
+
+Every item is a file name and a result, optionally followed by the width and height of the image.
+Without them, the size is taken from the masks of the result, or read from the header of the image file.
+"""
+
+import collections
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from dds_cloudapi_sdk.rle_util import dds_rle_to_coco_rle
+from dds_cloudapi_sdk.rle_util import rle_area
+from dds_cloudapi_sdk.rle_util import rle_fr_string
+from dds_cloudapi_sdk.rle_util import rle_to_string
+
+__all__ = [
+    "CocoWriter",
+    "LvisWriter",
+    "YoloWriter",
+    "convert_result",
+    "export_results",
+]
+
+
+def _image_size(file_name: str, objects: List[dict], width: Optional[int], height: Optional[int]) -> Tuple[int, int]:
+    if width is not None and height is not None:
+        return width, height
+    for obj in objects:
+        if obj.get("mask"):
+            height, width = obj["mask"]["size"]
+            return width, height
+    if os.path.exists(file_name):
+        with Image.open(file_name) as img:  # only reads the header
+            return img.size
+    raise ValueError(f"The size of {file_name} is unknown, pass its width and height")
+
+
+def convert_result(file_name: str, result: dict, width: int = None, height: int = None) -> Tuple[int, int, List[dict]]:
+    """
+    Convert the objects of a result to COCO annotations, without the image and category ids.
+
+    :param file_name: The file name of the image.
+    :param result: The result of a task, with its detections in ``objects``.
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :return: The width and height of the image and its annotations, whose ``category`` is the category name.
+    """
+    objects = [obj for obj in (result.get("objects") or []) if obj.get("bbox")]
+    width, height = _image_size(file_name, objects, width, height)
+    if not objects:
+        return width, height, []
+
+    boxes = np.array([obj["bbox"] for obj in objects], dtype=np.float64).reshape(-1, 4)
+    boxes[:, 2:] -= boxes[:, :2]  # xyxy -> xywh
+    box_areas = boxes[:, 2] * boxes[:, 3]
+    annotations = []
+    for obj, box, box_area in zip(objects, boxes.round(2).tolist(), box_areas.tolist()):
+        annotation = {"category": obj.get("category"), "bbox": box, "area": box_area, "iscrowd": 0}
+        if "score" in obj:
+            annotation["score"] = obj["score"]
+        mask = obj.get("mask")
+        if mask:
+            counts = mask["counts"]
+            if isinstance(counts, (str, bytes)):
+                counts = rle_fr_string(counts)
+            annotation["area"] = rle_area(counts)
+            if mask.get("format", "dds_rle") == "dds_rle":
+                segmentation = dds_rle_to_coco_rle({"counts": counts, "size": mask["size"]})
+            else:
+                segmentation = {"counts": rle_to_string(counts), "size": mask["size"]}
+            annotation["segmentation"] = {"size": list(segmentation["size"]), "counts": segmentation["counts"]}
+        annotations.append(annotation)
+    return width, height, annotations
+
+
+def _convert(item: Sequence) -> Tuple[str, int, int, List[dict]]:
+    file_name, result, *size = item
+    return (file_name, *convert_result(file_name, result, *size))
+
+
+class CocoWriter:
+    """
+    Write a COCO annotation file incrementally.
+
+    Images and annotations are spooled to temporary files while they are added,
+    and assembled into the annotation file by :meth:`close`.
+
+    :param path: The path of the annotation file.
+    :param categories: The category names, in the order of their ids starting at 1.
+        Categories met in the results and not listed are appended.
+    :param info: The ``info`` section of the file.
+    """
+
+    def __init__(self, path: str, categories: Sequence[str] = None, info: Dict[str, Any] = None):
+        self.path = path
+        self.info = info or {"description": "exported by dds_cloudapi_sdk"}
+        self.category_ids: Dict[str, int] = {}
+        for name in categories or []:
+            self._category_id(name)
+
+        self.images = 0
+        self.annotations = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        self._images_file = tempfile.TemporaryFile("w+", dir=directory, suffix=".images")
+        self._annotations_file = tempfile.TemporaryFile("w+", dir=directory, suffix=".annotations")
+        self._closed = False
+
+    def _category_id(self, name) -> int:
+        name = str(name)
+        category_id = self.category_ids.get(name)
+        if category_id is None:
+            category_id = self.category_ids[name] = len(self.category_ids) + 1
+        return category_id
+
+    def _image_record(self, image_id: int, file_name: str, width: int, height: int, annotations: List[dict]) -> dict:
+        return {"id": image_id, "file_name": file_name, "width": width, "height": height}
+
+    def _category_record(self, name: str, category_id: int) -> dict:
+        return {"id": category_id, "name": name, "supercategory": name}
+
+    @staticmethod
+    def _append(file, record: dict, first: bool):
+        if not first:
+            file.write(",\n")
+        file.write(json.dumps(record, separators=(",", ":")))
+
+    def add(self, file_name: str, result: dict, width: int = None, height: int = None) -> int:
+        """
+        Add an image and the objects of its result.
+
+        :param file_name: The file name of the image.
+        :param result: The result of a task, with its detections in ``objects``.
+        :param width: The width of the image.
+        :param height: The height of the image.
+        :return: The id of the image.
+        """
+        return self.add_converted(file_name, *convert_result(file_name, result, width, height))
+
+    def add_converted(self, file_name: str, width: int, height: int, annotations: List[dict]) -> int:
+        """
+        Add an image and its annotations converted by :func:`convert_result`.
+
+        :return: The id of the image.
+        """
+        if self._closed:
+            raise RuntimeError(f"{self.path} is already written")
+        self.images += 1
+        image_id = self.images
+        self._append(self._images_file, self._image_record(image_id, file_name, width, height, annotations),
+                     image_id == 1)
+        for annotation in annotations:
+            self.annotations += 1
+            record = {"id": self.annotations, "image_id": image_id}
+            record.update(annotation)
+            record["category_id"] = self._category_id(record.pop("category"))
+            self._append(self._annotations_file, record, self.annotations == 1)
+        return image_id
+
+    def close(self):
+        """
+        Write the annotation file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        categories = [self._category_record(name, category_id) for name, category_id in self.category_ids.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f'{{"info":{json.dumps(self.info)},"licenses":[],"images":[\n')
+            self._images_file.seek(0)
+            shutil.copyfileobj(self._images_file, f)
+            f.write('\n],"annotations":[\n')
+            self._annotations_file.seek(0)
+            shutil.copyfileobj(self._annotations_file, f)
+            f.write(f'\n],"categories":{json.dumps(categories)}}}\n')
+        os.replace(tmp_path, self.path)
+        self._images_file.close()
+        self._annotations_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # don't leave a partial dataset behind
+            self._closed = True
+            self._images_file.close()
+            self._annotations_file.close()
+
+
+class LvisWriter(CocoWriter):
+    """
+    Write an LVIS annotation file incrementally, a COCO file with the LVIS image and category fields.
+
+    Categories are given the LVIS frequency of their image count: rare up to 10 images,
+    common up to 100 and frequent above.
+    """
+
+    def __init__(self, path: str, categories: Sequence[str] = None, info: Dict[str, Any] = None):
+        self.image_counts = collections.Counter()
+        self.instance_counts = collections.Counter()
+        super().__init__(path, categories, info)
+
+    def _image_record(self, image_id: int, file_name: str, width: int, height: int, annotations: List[dict]) -> dict:
+        names = [str(annotation["category"]) for annotation in annotations]
+        self.instance_counts.update(names)
+        self.image_counts.update(set(names))
+        record = super()._image_record(image_id, file_name, width, height, annotations)
+        record["neg_category_ids"] = []
+        record["not_exhaustive_category_ids"] = []
+        return record
+
+    def _category_record(self, name: str, category_id: int) -> dict:
+        image_count = self.image_counts[name]
+        frequency = "r" if image_count <= 10 else "c" if image_count <= 100 else "f"
+        return {
+            "id": category_id,
+            "name": name,
+            "synset": name,
+            "frequency": frequency,
+            "image_count": image_count,
+            "instance_count": self.instance_counts[name],
+        }
+
+
+class YoloWriter:
+    """
+    Write YOLO labels incrementally, a file of normalized boxes per image and the category names in ``classes.txt``.
+
+    | The label file of an image mirrors its path relative to the image root under ``labels``,
+      ``a/0001.jpg`` is labelled in ``labels/a/0001.txt``.
+    | Two images mapped to the same label file raise a ``ValueError`` rather than overwrite each other's labels.
+
+    :param directory: The directory of the dataset.
+    :param categories: The category names, in the order of their class ids starting at 0.
+        Categories met in the results and not listed are appended.
+    :param image_root: The directory absolute image paths are made relative to, the images directly under
+        ``labels`` if not provided.
+    """
+
+    def __init__(self, directory: str, categories: Sequence[str] = None, image_root: str = None):
+        self.directory = directory
+        self.image_root = image_root
+        self.class_ids: Dict[str, int] = {}
+        for name in categories or []:
+            self._class_id(name)
+        self.images = 0
+        self.annotations = 0
+        self._label_paths: Dict[str, str] = {}  # label path -> the image labelled in it
+        os.makedirs(os.path.join(directory, "labels"), exist_ok=True)
+
+    def _label_path(self, file_name: str) -> str:
+        path = file_name
+        if "://" in path:
+            path = os.path.basename(path.split("?", 1)[0])
+        elif os.path.isabs(path):
+            relative = os.path.relpath(path, self.image_root) if self.image_root is not None else ".."
+            path = os.path.basename(path) if relative.startswith("..") else relative
+        path = os.path.normpath(path)
+        if path.startswith(".."):
+            path = os.path.basename(path)
+        label_path = os.path.join(self.directory, "labels", os.path.splitext(path)[0] + ".txt")
+
+        other = self._label_paths.setdefault(label_path, file_name)
+        if other != file_name:
+            raise ValueError(f"{file_name} and {other} have the same label file {label_path}, set image_root")
+        return label_path
+
+    def _class_id(self, name) -> int:
+        name = str(name)
+        class_id = self.class_ids.get(name)
+        if class_id is None:
+            class_id = self.class_ids[name] = len(self.class_ids)
+        return class_id
+
+    def add(self, file_name: str, result: dict, width: int = None, height: int = None) -> int:
+        """
+        Add an image and the objects of its result, see :meth:`CocoWriter.add`.
+        """
+        return self.add_converted(file_name, *convert_result(file_name, result, width, height))
+
+    def add_converted(self, file_name: str, width: int, height: int, annotations: List[dict]) -> int:
+        """
+        Add an image and its annotations converted by :func:`convert_result`.
+
+        :return: The index of the image.
+        """
+        label_path = self._label_path(file_name)
+        self.images += 1
+        lines = []
+        if annotations:
+            boxes = np.array([annotation["bbox"] for annotation in annotations], dtype=np.float64)
+            # xywh -> normalized center xywh
+            boxes[:, :2] += boxes[:, 2:] / 2
+            boxes /= [width, height, width, height]
+            classes = [self._class_id(annotation["category"]) for annotation in annotations]
+            lines = [f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}" for c, (x, y, w, h) in zip(classes, boxes.tolist())]
+            self.annotations += len(lines)
+        os.makedirs(os.path.dirname(label_path), exist_ok=True)
+        with open(label_path, "w") as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+        return self.images
+
+    def close(self):
+        """
+        Write the category names.
+        """
+        with open(os.path.join(self.directory, "classes.txt"), "w") as f:
+            f.write("".join(f"{name}\n" for name in self.class_ids))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def export_results(writer, items: Iterable[Sequence], processes: int = None, max_pending: int = None) -> int:
+    """
+    Convert results in a process pool and add them to a writer, in the order of the items.
+
+    :param writer: A :class:`CocoWriter`, :class:`LvisWriter` or :class:`YoloWriter`.
+    :param items: Tuples of a file name and a result, optionally followed by the width and height of the image,
+        typically a generator.
+    :param processes: The number of worker processes, the number of CPUs by default. 0 converts in this process.
+    :param max_pending: The maximum number of results converting at a time, ``4 * processes`` by default.
+        Items are pulled only when a result is done, so memory stays bounded.
+    :return: The number of images added.
+    """
+    if processes == 0:
+        count = 0
+        for item in items:
+            writer.add_converted(*_convert(item))
+            count += 1
+        return count
+
+    processes = processes or os.cpu_count() or 1
+    max_pending = max_pending or 4 * processes
+    pending = collections.deque()
+    count = 0
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        try:
+            for item in items:
+                if len(pending) >= max_pending:
+                    writer.add_converted(*pending.popleft().result())
+                    count += 1
+                pending.append(executor.submit(_convert, item))
+            while pending:
+                writer.add_converted(*pending.popleft().result())
+                count += 1
+        finally:
+            for future in pending:
+                future.cancel()
+    return count
@@ -1,10 +1,14 @@
 import base64
+import hashlib
+import os
 from io import BytesIO
 from typing import Tuple
 from typing import Union
 
 from PIL import Image
 
+from dds_cloudapi_sdk.instrumentation import instrumented
+
 
 def _open_image(image_input: Union[str, bytes, BytesIO]) -> Image.Image:
     """Open image from file path, bytes or BytesIO object"""
@@ -13,17 +17,17 @@ def _open_image(image_input: Union[str, bytes, BytesIO]) -> Image.Image:
     return Image.open(BytesIO(image_input) if isinstance(image_input, bytes) else image_input)
 
 
-def _save_to_bytesio(img: Image.Image) -> BytesIO:
-    """Save image to BytesIO object"""
+def _save_to_bytesio(img: Image.Image, format: str = None) -> BytesIO:
+    """Save image to BytesIO object, in the given format or the one of the image"""
     output = BytesIO()
-    format = img.format or 'PNG'
+    format = format or img.format or 'PNG'
 
     if img.mode not in ('RGB', 'L'):
         img = img.convert('RGB')
 
     try:
         img.save(output, format=format)
-    except OSError:
+    except (OSError, KeyError):  # KeyError: a format PIL reads but cannot write
         output = BytesIO()
         img.save(output, format='PNG')
 
@@ -43,6 +47,7 @@ def _get_original_bytesio(image_input: Union[str, bytes, BytesIO]) -> BytesIO:
         return BytesIO(image_input.getvalue())
 
 
+@instrumented("resize_image", nbytes=lambda result: result[0].getbuffer().nbytes)
 def resize_image(
     image_input: Union[str, bytes, BytesIO],
     max_size: int = 1536
@@ -65,7 +70,9 @@ def resize_image(
     new_height = int(height * ratio)
     resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-    return _save_to_bytesio(resized_img), {'ratio': ratio, 'original_width': width, 'original_height': height}
+    # a resized image has no format, keep the one of the original so a JPEG isn't uploaded as a larger PNG
+    resize_info = {'ratio': ratio, 'original_width': width, 'original_height': height}
+    return _save_to_bytesio(resized_img, img.format), resize_info
 
 
 def resize_and_save_image(
@@ -80,6 +87,7 @@ def resize_and_save_image(
     return scale_info
 
 
+@instrumented("image_to_base64", nbytes=len)
 def image_to_base64(image_input: Union[str, bytes, BytesIO]) -> str:
     """Convert image to base64 string with data URL format"""
     img = _open_image(image_input)
@@ -89,3 +97,17 @@ def image_to_base64(image_input: Union[str, bytes, BytesIO]) -> str:
     base64_str = base64.b64encode(output.getvalue()).decode('utf-8')
 
     return f"data:image/{format.lower()};base64,{base64_str}"
+
+
+def image_cache_key(image_input: Union[str, bytes, BytesIO], max_size: int = None) -> str:
+    """
+    Key of the encoded image in a cache, a file is identified by its path, size and modification time
+    so it isn't read on a hit, bytes are identified by their content.
+    """
+    if isinstance(image_input, str):
+        stat = os.stat(image_input)
+        source = f"file:{os.path.abspath(image_input)}:{stat.st_size}:{stat.st_mtime_ns}"
+    else:
+        data = image_input if isinstance(image_input, bytes) else image_input.getvalue()
+        source = f"sha256:{hashlib.sha256(data).hexdigest()}"
+    return "image:" + hashlib.sha256(f"{source}:{max_size}".encode("utf-8")).hexdigest()
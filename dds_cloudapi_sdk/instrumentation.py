@@ -0,0 +1,408 @@
+"""
+Measure where the client side time goes: image resizing and encoding, JSON encoding, result formatting,
+RLE decoding and encoding, and visualization.
+
+These stages report to the registered :class:`Instrument` objects. Spans nest through :mod:`contextvars`,
+so a stage run inside another one, such as ``rle_to_array`` in ``format_result``, knows its parent.
+:class:`StageCollector` aggregates the wall time, CPU time and bytes of every stage::
+
+    from dds_cloudapi_sdk import instrumentation
+
+    collector = instrumentation.StageCollector()
+    with instrumentation.instrumenting(collector):
+        client.run_tasks(tasks)
+    print(collector.report())
+
+:class:`ProfileCapture` profiles whole stages, a sample of the ``task`` stages by default, with :mod:`cProfile`
+and optionally :mod:`tracemalloc`, to diagnose a regression in production::
+
+    capture = instrumentation.ProfileCapture(sample_rate=0.01, memory=True)
+    instrumentation.add_instrument(capture)
+    ...
+    for c in capture.captures:
+        print(c.report(limit=20))
+
+Without any instrument registered, a stage costs a single check.
+Threads don't inherit the spans of the thread that started them, their stages are roots.
+"""
+
+import collections
+import contextlib
+import contextvars
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+__all__ = [
+    "Capture",
+    "Instrument",
+    "ProfileCapture",
+    "Span",
+    "StageCollector",
+    "add_instrument",
+    "current_span",
+    "instrumented",
+    "instrumenting",
+    "remove_instrument",
+    "stage",
+]
+
+# replaced rather than mutated, so stages read it without a lock
+_instruments = ()
+_instruments_lock = threading.Lock()
+_current_span = contextvars.ContextVar("dds_cloudapi_sdk_span", default=None)
+
+
+class Span:
+    """
+    A run of a stage.
+
+    :param name: The name of the stage.
+    :param parent: The span the stage runs in, if any.
+    :param attrs: Attributes describing the run, such as the ``api_path`` of a task.
+    """
+    __slots__ = ("name", "parent", "attrs", "bytes", "error", "start", "end", "cpu_start", "cpu_end",
+                 "children_wall", "data")
+
+    def __init__(self, name: str, parent: "Span" = None, attrs: dict = None):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs or {}
+        self.bytes = 0  # the bytes processed by the stage
+        self.error = None  # the exception type name if the stage raised
+        self.start = self.end = 0.0
+        self.cpu_start = self.cpu_end = 0.0
+        self.children_wall = 0.0  # the wall time of the direct child spans
+        self.data = None  # the private state of instruments
+
+    @property
+    def wall(self) -> float:
+        return self.end - self.start
+
+    @property
+    def cpu(self) -> float:
+        """The CPU seconds of the thread running the stage."""
+        return self.cpu_end - self.cpu_start
+
+    @property
+    def self_wall(self) -> float:
+        """The wall seconds spent in the stage itself rather than in its child stages."""
+        return self.wall - self.children_wall
+
+    def add_bytes(self, nbytes: int):
+        self.bytes += nbytes
+
+    def __repr__(self):
+        return f"Span<{self.name}, wall:{self.wall:.6f}s, cpu:{self.cpu:.6f}s, bytes:{self.bytes}>"
+
+
+class Instrument:
+    """
+    Callbacks on the start and the end of every stage, to be subclassed.
+    The callbacks run in the thread of the stage and must be fast and thread-safe.
+    """
+
+    def on_stage_start(self, span: Span):
+        pass
+
+    def on_stage_end(self, span: Span):
+        pass
+
+
+def add_instrument(instrument: Instrument):
+    global _instruments
+    with _instruments_lock:
+        _instruments = _instruments + (instrument,)
+
+
+def remove_instrument(instrument: Instrument):
+    global _instruments
+    with _instruments_lock:
+        _instruments = tuple(i for i in _instruments if i is not instrument)
+
+
+@contextlib.contextmanager
+def instrumenting(*instruments: Instrument):
+    """
+    Register instruments for the duration of a with block.
+    """
+    for instrument in instruments:
+        add_instrument(instrument)
+    try:
+        yield
+    finally:
+        for instrument in instruments:
+            remove_instrument(instrument)
+
+
+def current_span() -> Optional[Span]:
+    """The innermost stage running in this context, None outside of stages or without instruments."""
+    return _current_span.get()
+
+
+class _NullStage:
+    """What a stage yields when no instrument is registered."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add_bytes(self, nbytes: int):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("span", "instruments", "token")
+
+    def __init__(self, span: Span, instruments: tuple):
+        self.span = span
+        self.instruments = instruments
+
+    def __enter__(self) -> Span:
+        span = self.span
+        self.token = _current_span.set(span)
+        for instrument in self.instruments:
+            try:
+                instrument.on_stage_start(span)
+            except Exception:
+                logger.exception(f"{instrument} failed on the start of {span.name}")
+        span.cpu_start = time.thread_time()
+        span.start = time.perf_counter()
+        return span
+
+    def __exit__(self, exc_type, exc, tb):
+        span = self.span
+        span.end = time.perf_counter()
+        span.cpu_end = time.thread_time()
+        if exc_type is not None:
+            span.error = exc_type.__name__
+        if span.parent is not None:
+            span.parent.children_wall += span.wall
+        _current_span.reset(self.token)
+        for instrument in reversed(self.instruments):
+            try:
+                instrument.on_stage_end(span)
+            except Exception:
+                logger.exception(f"{instrument} failed on the end of {span.name}")
+        return False
+
+
+def stage(name: str, **attrs):
+    """
+    Measure a block of code as a stage::
+
+        with stage("decode", api_path=path) as span:
+            data = decode(payload)
+            span.add_bytes(len(payload))
+
+    :param name: The name of the stage, the stages of the same name are aggregated together.
+    :param attrs: Attributes of this run of the stage, given to the instruments in :attr:`Span.attrs`.
+    :return: A context manager yielding the :class:`Span`.
+    """
+    instruments = _instruments
+    if not instruments:
+        return _NULL_STAGE
+    return _Stage(Span(name, _current_span.get(), attrs), instruments)
+
+
+def instrumented(name: str, nbytes: Callable[[object], int] = None):
+    """
+    Decorate a function to run it as a stage.
+
+    :param name: The name of the stage.
+    :param nbytes: A function of the return value giving the bytes processed, no bytes are counted if None.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _instruments:
+                return func(*args, **kwargs)
+            with stage(name) as span:
+                result = func(*args, **kwargs)
+                if nbytes is not None:
+                    span.add_bytes(nbytes(result))
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+class StageCollector(Instrument):
+    """
+    Aggregate the count, wall time, CPU time and bytes of every stage.
+    """
+
+    _FIELDS = ("count", "errors", "wall_seconds", "self_seconds", "cpu_seconds", "max_wall_seconds", "bytes")
+
+    def __init__(self):
+        self._stats: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def on_stage_end(self, span: Span):
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = [0, 0, 0.0, 0.0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += span.error is not None
+            stats[2] += span.wall
+            stats[3] += span.self_wall
+            stats[4] += span.cpu
+            stats[5] = max(stats[5], span.wall)
+            stats[6] += span.bytes
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        The totals of every stage, and their throughput in MB per wall second.
+        """
+        with self._lock:
+            stats = {name: dict(zip(self._FIELDS, values)) for name, values in self._stats.items()}
+        for values in stats.values():
+            values["mb_per_second"] = values["bytes"] / values["wall_seconds"] / 1e6 if values["wall_seconds"] else 0.0
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def report(self) -> str:
+        """
+        The stats as a table, by descending wall time.
+        """
+        lines = [f"{'stage':<24}{'count':>8}{'wall s':>10}{'self s':>10}{'cpu s':>10}{'max ms':>10}{'MB':>10}{'MB/s':>10}"]
+        for name, s in sorted(self.stats().items(), key=lambda item: -item[1]["wall_seconds"]):
+            lines.append(
+                f"{name:<24}{s['count']:>8}{s['wall_seconds']:>10.3f}{s['self_seconds']:>10.3f}{s['cpu_seconds']:>10.3f}"
+                f"{s['max_wall_seconds'] * 1000:>10.2f}{s['bytes'] / 1e6:>10.2f}{s['mb_per_second']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+class Capture:
+    """
+    The profile of a run of a stage captured by :class:`ProfileCapture`.
+
+    :param span: The profiled span.
+    :param profile: The cProfile statistics, None if another profiler was already running in the thread.
+    :param memory_peak: The peak of the memory traced during the stage above its start, in bytes,
+        None without memory tracing. Allocations of other threads running at the same time are counted too.
+    :param memory_top: The lines allocating the most memory still held at the end of the stage.
+    """
+
+    def __init__(self, span: Span, profile: Optional[pstats.Stats], memory_peak: Optional[int],
+                 memory_top: List[tracemalloc.Statistic]):
+        self.name = span.name
+        self.attrs = span.attrs
+        self.wall = span.wall
+        self.cpu = span.cpu
+        self.profile = profile
+        self.memory_peak = memory_peak
+        self.memory_top = memory_top
+
+    def report(self, limit: int = 20, sort: str = "cumulative") -> str:
+        """
+        The top functions of the profile and the top allocating lines as text.
+        """
+        out = io.StringIO()
+        out.write(f"{self.name} {self.attrs}: wall {self.wall:.3f}s, cpu {self.cpu:.3f}s\n")
+        if self.profile is not None:
+            self.profile.stream = out
+            self.profile.sort_stats(sort).print_stats(limit)
+        if self.memory_peak is not None:
+            out.write(f"memory peak: {self.memory_peak / 1e6:.2f} MB\n")
+            for statistic in self.memory_top[:limit]:
+                out.write(f"  {statistic}\n")
+        return out.getvalue()
+
+    def dump(self, path: str):
+        """
+        Save the profile for ``python -m pstats`` or snakeviz.
+        """
+        if self.profile is not None:
+            self.profile.dump_stats(path)
+
+
+class ProfileCapture(Instrument):
+    """
+    Profile a sample of the runs of some stages.
+
+    :param stages: The names of the stages to profile, the ``task`` stage of :meth:`BaseTask.run` by default.
+    :param sample_rate: The fraction of the runs profiled.
+    :param memory: Whether to trace memory allocations with tracemalloc as well, which slows everything down.
+        Tracing is started on the first sampled run and stopped after the last one.
+    :param max_captures: The number of most recent captures kept in :attr:`captures`.
+    """
+
+    def __init__(self, stages=("task",), sample_rate: float = 1.0, memory: bool = False, max_captures: int = 20):
+        self.stages = frozenset(stages)
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.captures = collections.deque(maxlen=max_captures)
+        self._lock = threading.Lock()
+        self._tracing = 0  # the sampled runs tracing memory
+        self._started_tracing = False
+
+    def on_stage_start(self, span: Span):
+        if span.name not in self.stages or random.random() >= self.sample_rate:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # only one profiler can run per thread, an enclosing stage is profiled already
+            profile = None
+        memory_start = None
+        if self.memory:
+            with self._lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started_tracing = True
+                self._tracing += 1
+                if hasattr(tracemalloc, "reset_peak"):
+                    tracemalloc.reset_peak()
+                # without reset_peak (Python 3.8), the peak is only attributed to the stage if it rises during it
+                memory_start = tracemalloc.get_traced_memory()
+        span.data = {**(span.data or {}), self: (profile, memory_start)}
+
+    def on_stage_end(self, span: Span):
+        if not span.data or self not in span.data:
+            return
+        profile, memory_start = span.data.pop(self)
+        stats = None
+        if profile is not None:
+            profile.disable()
+            stats = pstats.Stats(profile)
+        memory_peak = None
+        memory_top = []
+        if memory_start is not None:
+            with self._lock:
+                current, peak = tracemalloc.get_traced_memory()
+                if peak == memory_start[1]:
+                    peak = current
+                memory_peak = max(0, peak - memory_start[0])
+                memory_top = tracemalloc.take_snapshot().statistics("lineno")[:50]
+                self._tracing -= 1
+                if self._tracing == 0 and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+        self.captures.append(Capture(span, stats, memory_peak, memory_top))
@@ -0,0 +1,263 @@
+"""
+Latency metrics of the trigger, queue, run and post-process phases of tasks.
+
+Every task records the :class:`TaskPhase <dds_cloudapi_sdk.tasks.base.TaskPhase>` timestamps of its life cycle.
+A :class:`TaskMetrics` given to the :class:`Client <dds_cloudapi_sdk.client.Client>` aggregates them into
+latency histograms per ``api_path``, which can be exported with callbacks or in the Prometheus text format::
+
+    from dds_cloudapi_sdk import Client
+    from dds_cloudapi_sdk.metrics import TaskMetrics
+
+    metrics = TaskMetrics()
+    client = Client(config, metrics=metrics)
+    client.run_task(task)
+
+    print(metrics.histogram("/v2/task/dinox/detection", "queue").percentile(99))
+    metrics.serve(port=9108)  # serve http://localhost:9108/metrics for Prometheus to scrape
+
+"""
+
+import http.server
+import logging
+import threading
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from dds_cloudapi_sdk.tasks.base import BaseTask
+from dds_cloudapi_sdk.tasks.base import TaskPhase
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+__all__ = [
+    "LatencyHistogram",
+    "TaskMetrics",
+    "task_phases",
+]
+
+# phase name -> (start timestamp, end timestamps in order of preference)
+PHASES = {
+    "trigger": (TaskPhase.TriggerStart, (TaskPhase.TriggerEnd,)),
+    "queue": (TaskPhase.TriggerEnd, (TaskPhase.Running, TaskPhase.Finished)),
+    "run": (TaskPhase.Running, (TaskPhase.Finished,)),
+    "post_process": (TaskPhase.FormatStart, (TaskPhase.FormatEnd,)),
+    "total": (TaskPhase.TriggerStart, (TaskPhase.FormatEnd, TaskPhase.Finished)),
+}
+
+
+def task_phases(task: BaseTask) -> Dict[str, float]:
+    """
+    Compute the durations in seconds of the phases a task went through.
+
+    :param task: The task to measure.
+    :return: A dict of phase name to duration, phases not reached by the task are omitted.
+    """
+    timestamps = task.timestamps
+    phases = {}
+    for phase, (start, ends) in PHASES.items():
+        if start not in timestamps:
+            continue
+        for end in ends:
+            if end in timestamps:
+                phases[phase] = max(0.0, timestamps[end] - timestamps[start])
+                break
+    return phases
+
+
+class LatencyHistogram:
+    """
+    A log-linear histogram in the spirit of HdrHistogram.
+
+    | Values are recorded in microseconds into buckets whose width grows with their magnitude,
+      so the relative error of any percentile is bounded by ``2 ** -precision_bits`` whatever the range.
+    | Recording is O(1) and memory only grows with the number of distinct buckets hit.
+
+    :param precision_bits: The number of significant bits kept of each value, 7 bits is below 1% of error.
+    """
+
+    def __init__(self, precision_bits: int = 7):
+        self.precision_bits = precision_bits
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._buckets: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, micros: int) -> int:
+        shift = max(0, micros.bit_length() - self.precision_bits)
+        return ((shift + 1) << self.precision_bits) + (micros >> shift) if shift else micros
+
+    def _bucket_value(self, bucket: int) -> float:
+        """The midpoint in seconds of a bucket."""
+        if bucket < 1 << self.precision_bits:
+            return bucket / 1e6
+        shift = (bucket >> self.precision_bits) - 1
+        low = (bucket & ((1 << self.precision_bits) - 1)) << shift
+        return (low + (1 << shift) / 2) / 1e6
+
+    def record(self, seconds: float):
+        micros = max(0, int(seconds * 1e6))
+        bucket = self._bucket(micros)
+        with self._lock:
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+            self.count += 1
+            self.sum += seconds
+            self.min = seconds if self.min is None else min(self.min, seconds)
+            self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.precision_bits != self.precision_bits:
+            raise ValueError("Can't merge histograms of different precision")
+        with self._lock:
+            for bucket, count in other._buckets.items():
+                self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+            self.count += other.count
+            self.sum += other.sum
+            if other.count:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+                self.max = other.max if self.max is None else max(self.max, other.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """
+        The value in seconds below which ``p`` percent of the recorded values fall.
+        """
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = max(1, int(round(p / 100 * self.count)))
+            seen = 0
+            for bucket in sorted(self._buckets):
+                seen += self._buckets[bucket]
+                if seen >= rank:
+                    return min(max(self._bucket_value(bucket), self.min), self.max)
+            return self.max
+
+    def __repr__(self):
+        return (f"LatencyHistogram<count:{self.count}, mean:{self.mean:.4f}, "
+                f"p50:{self.percentile(50):.4f}, p99:{self.percentile(99):.4f}, max:{self.max}>")
+
+
+class TaskMetrics:
+    """
+    Aggregate the phase latencies of tasks per ``api_path``.
+
+    :param quantiles: The quantiles reported by :meth:`export_prometheus`.
+    :param precision_bits: The precision of the histograms, see :class:`LatencyHistogram`.
+    """
+
+    def __init__(self, quantiles: Tuple[float, ...] = (0.5, 0.9, 0.99), precision_bits: int = 7):
+        self.quantiles = quantiles
+        self.precision_bits = precision_bits
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._statuses: Dict[Tuple[str, str], int] = {}
+        self._callbacks: List[Callable[[BaseTask, Dict[str, float]], None]] = []
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[BaseTask, Dict[str, float]], None]):
+        """
+        Register a function called with the task and its phase durations every time a task is recorded.
+        """
+        self._callbacks.append(callback)
+
+    def histogram(self, api_path: str, phase: str) -> LatencyHistogram:
+        key = (api_path, phase)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, LatencyHistogram(self.precision_bits))
+        return histogram
+
+    def record(self, task: BaseTask):
+        phases = task_phases(task)
+        for phase, seconds in phases.items():
+            self.histogram(task.api_path, phase).record(seconds)
+
+        status = task.status.value if task.status else "unknown"
+        with self._lock:
+            key = (task.api_path, status)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+        for callback in self._callbacks:
+            try:
+                callback(task, phases)
+            except Exception:
+                logger.exception(f"Metrics callback {callback} failed on {task}")
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """
+        Summarize the histograms as ``{api_path: {phase: {count, mean, max, p50, ...}}}``.
+        """
+        summary = {}
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (api_path, phase), histogram in histograms:
+            stats = {"count": histogram.count, "mean": histogram.mean, "max": histogram.max or 0.0}
+            for q in self.quantiles:
+                stats[f"p{q * 100:g}"] = histogram.percentile(q * 100)
+            summary.setdefault(api_path, {})[phase] = stats
+        return summary
+
+    def export_prometheus(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = [
+            "# HELP dds_task_phase_seconds Latency of task phases.",
+            "# TYPE dds_task_phase_seconds summary",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            statuses = sorted(self._statuses.items())
+        for (api_path, phase), histogram in histograms:
+            labels = f'api_path="{_escape(api_path)}",phase="{phase}"'
+            for q in self.quantiles:
+                lines.append(f'dds_task_phase_seconds{{{labels},quantile="{q:g}"}} {histogram.percentile(q * 100):.6f}')
+            lines.append(f"dds_task_phase_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"dds_task_phase_seconds_count{{{labels}}} {histogram.count}")
+
+        lines.append("# HELP dds_tasks_total Tasks recorded by final status.")
+        lines.append("# TYPE dds_tasks_total counter")
+        for (api_path, status), count in statuses:
+            lines.append(f'dds_tasks_total{{api_path="{_escape(api_path)}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> http.server.HTTPServer:
+        """
+        Serve :meth:`export_prometheus` at ``/metrics`` from a daemon thread.
+
+        :param port: The port to listen on.
+        :param host: The address to bind, only the loopback interface by default since the metrics name the api
+            paths and count the tasks of the host. Pass ``"0.0.0.0"`` for a scraper running on another host.
+        :return: The server, call its ``shutdown()`` to stop serving.
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.export_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="dds-metrics", daemon=True).start()
+        return server
+
+
+def _escape(value: Optional[str]) -> str:
+    return (value or "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
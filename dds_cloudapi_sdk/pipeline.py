@@ -0,0 +1,458 @@
+"""
+Run many tasks as a pipeline of upload, trigger, poll and post-process stages.
+
+:meth:`Client.run_tasks <dds_cloudapi_sdk.client.Client.run_tasks>` runs each task from start to end on one worker,
+which idles while the request body is sent and again while the server queue drains. A :class:`PipelinedExecutor`
+gives every stage its own workers and bounded queue instead, so encoding and uploading the next images
+overlaps with polling the tasks already on the server::
+
+    from functools import partial
+
+    from dds_cloudapi_sdk.tasks.v2_task import create_task_with_local_image_auto_resize
+
+    pipeline = client.pipeline(upload_workers=4, trigger_workers=8, max_in_flight=64)
+    items = (partial(create_task_with_local_image_auto_resize, api_path, dict(body), path) for path in paths)
+    for task, error in pipeline.map(items):
+        print(task.result if error is None else error)
+    print(pipeline.stats())  # how busy each stage was
+
+Items are either tasks or callables returning a task, which are called by the upload workers so image
+resizing and base64 encoding run in the pipeline too.
+"""
+
+import contextlib
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from dds_cloudapi_sdk.deadline import CancellationToken
+from dds_cloudapi_sdk.scheduler import Priority
+from dds_cloudapi_sdk.tasks.base import BaseTask
+from dds_cloudapi_sdk.tasks.base import TaskStatus
+
+__all__ = [
+    "PipelinedExecutor",
+    "StageStats",
+]
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+_FINISHED = (TaskStatus.Success, TaskStatus.Failed)
+
+
+class StageStats:
+    """
+    The occupancy of the workers of a pipeline stage.
+
+    :param name: The name of the stage.
+    :param workers: The number of workers of the stage.
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.busy = 0  # workers busy right now
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def working(self):
+        start = time.monotonic()
+        with self._lock:
+            self.busy += 1
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.busy -= 1
+                self.processed += 1
+                self.busy_seconds += time.monotonic() - start
+
+    def occupancy(self, elapsed: float) -> float:
+        """
+        The fraction of the time the workers of the stage were busy.
+
+        :param elapsed: The seconds the stage has been running.
+        """
+        if elapsed <= 0:
+            return 0.0
+        return min(self.busy_seconds / (self.workers * elapsed), 1.0)
+
+
+class _Job:
+    __slots__ = ("item", "task", "key", "payload", "in_flight", "ticket", "backend", "last_status",
+                 "poll_failures", "poll_failed_since")
+
+    def __init__(self, item):
+        self.item = item
+        self.task: Optional[BaseTask] = None
+        self.key: Optional[str] = None  # the cache key, computed before the body can be released
+        self.payload: Optional[str] = None
+        self.in_flight = False  # whether the job holds a slot of max_in_flight
+        self.ticket = None  # the scheduler slot held from trigger to finish
+        self.backend = None  # the balancer backend held from trigger to finish
+        self.last_status = 0.0
+        self.poll_failures = 0  # the consecutive failed status checks
+        self.poll_failed_since = 0.0
+
+
+class PipelinedExecutor:
+    """
+    Run tasks through separate upload, trigger, poll and post-process stages.
+
+    :param client: The :class:`Client <dds_cloudapi_sdk.client.Client>` whose config, cache, metrics,
+        scheduler and balancer are used.
+    :param upload_workers: The workers creating tasks and serializing their request bodies.
+    :param trigger_workers: The workers sending the trigger requests, the upload of the bodies.
+    :param poll_workers: The workers checking the status of the triggered tasks.
+    :param post_workers: The workers formatting the results of the finished tasks.
+    :param max_in_flight: The maximum number of tasks triggered and not finished yet.
+    :param queue_size: The capacity of the queue in front of each stage.
+    :param poll_interval: The seconds between two status checks of a task.
+    """
+
+    def __init__(
+        self,
+        client,
+        upload_workers: int = 2,
+        trigger_workers: int = 4,
+        poll_workers: int = 2,
+        post_workers: int = 2,
+        max_in_flight: int = 64,
+        queue_size: int = 16,
+        poll_interval: float = 0.5,
+    ):
+        if min(upload_workers, trigger_workers, poll_workers, post_workers, max_in_flight, queue_size) < 1:
+            raise ValueError("Every stage needs at least one worker, one queue slot and one task in flight")
+
+        self.client = client
+        self.workers = {
+            "upload": upload_workers,
+            "trigger": trigger_workers,
+            "poll": poll_workers,
+            "post": post_workers,
+        }
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+
+        self.stages: Dict[str, StageStats] = {}
+        self._queues: Dict[str, queue.Queue] = {}
+        self._polling = []  # heap of (next check time, sequence, job)
+        self._polling_cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._in_flight = None
+        self._started_at = None
+        self._finished_at = None
+        self._running = threading.Lock()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        The occupancy, queue depth and counters of each stage of the current or last :meth:`map`.
+        """
+        if self._started_at is None:
+            return {}
+        elapsed = (self._finished_at or time.monotonic()) - self._started_at
+        stats = {}
+        for name, stage in self.stages.items():
+            if name == "poll":
+                with self._polling_cond:
+                    queued = len(self._polling)
+            else:
+                queued = self._queues[name].qsize()
+            stats[name] = {
+                "workers": stage.workers,
+                "busy": stage.busy,
+                "queued": queued,
+                "processed": stage.processed,
+                "errors": stage.errors,
+                "occupancy": stage.occupancy(elapsed),
+            }
+        return stats
+
+    def map(
+        self,
+        items: Iterable[Union[BaseTask, Callable[[], BaseTask]]],
+        cancel_token: CancellationToken = None,
+        priority: int = Priority.Batch,
+        tenant: str = None,
+    ) -> Iterator[Tuple[BaseTask, Optional[Exception]]]:
+        """
+        Run tasks through the pipeline and yield each of them as soon as it is done.
+
+        :param items: The tasks, or callables creating them, typically a generator.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the tasks with.
+        :param priority: The :class:`Priority <dds_cloudapi_sdk.scheduler.Priority>` class of the tasks in the scheduler.
+        :param tenant: The tenant the tasks are fairly scheduled as, their api path by default.
+        :return: An iterator of each task and its error, None if it succeeded, in completion order.
+            A task whose creation failed is yielded as None.
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("The pipeline is already running, create another executor to run tasks concurrently")
+
+        # the token is cancelled when the consumer stops early, which wakes up every stage
+        token = CancellationToken(parent=cancel_token)
+        self.stages = {name: StageStats(name, workers) for name, workers in self.workers.items()}
+        self._queues = {name: queue.Queue(maxsize=self.queue_size) for name in ("upload", "trigger", "post", "done")}
+        self._polling = []
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        self._started_at = time.monotonic()
+        self._finished_at = None
+        fed = [0, False]  # the number of items fed, whether the items are exhausted
+
+        def feed():
+            try:
+                for item in items:
+                    if not self._put("upload", _Job(item), token):
+                        return
+                    fed[0] += 1
+            except Exception as e:
+                logger.exception(f"Failed to pull the items of the pipeline, e:{e}")
+            finally:
+                fed[1] = True
+
+        stages = {
+            "upload": lambda job: self._upload(job, token),
+            "trigger": lambda job: self._trigger(job, token, priority, tenant),
+            "post": lambda job: self._post(job, token),
+        }
+        threads = [threading.Thread(target=feed, name="dds-pipeline-feed", daemon=True)]
+        for name, handler in stages.items():
+            for i in range(self.workers[name]):
+                threads.append(threading.Thread(
+                    target=self._serve, args=(name, handler, token), name=f"dds-pipeline-{name}-{i}", daemon=True,
+                ))
+        for i in range(self.workers["poll"]):
+            threads.append(threading.Thread(
+                target=self._poll_loop, args=(token,), name=f"dds-pipeline-poll-{i}", daemon=True,
+            ))
+        for thread in threads:
+            thread.start()
+
+        done = 0
+        try:
+            while not (fed[1] and done >= fed[0]):
+                try:
+                    job = self._queues["done"].get(timeout=0.1)
+                except queue.Empty:
+                    if token.cancelled:
+                        # the stages stopped, the tasks left in them won't be reported
+                        token.raise_if_done("pipeline")
+                    continue
+                done += 1
+                yield job
+        finally:
+            token.cancel("pipeline closed")
+            with self._polling_cond:
+                self._polling_cond.notify_all()
+            for thread in threads:
+                thread.join()
+            # give back the capacity held by the tasks abandoned in the stages
+            for job in [job for _, _, job in self._polling] + list(self._queues["trigger"].queue) + \
+                    list(self._queues["post"].queue):
+                self._release(job)
+            self._finished_at = time.monotonic()
+            self._running.release()
+
+    def _put(self, stage: str, item, token: CancellationToken) -> bool:
+        """Put an item in the queue of a stage, blocking while it is full. False if the pipeline stops meanwhile."""
+        q = self._queues[stage]
+        while not token.cancelled:
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _serve(self, stage: str, handler: Callable, token: CancellationToken):
+        q = self._queues[stage]
+        while not token.cancelled:
+            try:
+                job = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                with self.stages[stage].working():
+                    handler(job)
+            except Exception as e:
+                self._finish(job, e, token)
+
+    def _release(self, job: _Job):
+        """Give back the server capacity held by the job."""
+        if job.ticket is not None:
+            self.client.scheduler.release(job.ticket)
+            job.ticket = None
+        if job.backend is not None:
+            self.client.config.balancer.release(job.backend)
+            job.backend = None
+        if job.in_flight:
+            self._in_flight.release()
+            job.in_flight = False
+
+    def _finish(self, job: _Job, error: Optional[Exception], token: CancellationToken):
+        """Give back what the job holds and hand it to the consumer."""
+        self._release(job)
+        if job.task is not None:
+            job.task._cancel_token = None
+            if job.task.config is not None and job.task.config.callback_receiver is not None and job.task.task_uuid:
+                job.task.config.callback_receiver.unregister(job.task.task_uuid)
+        job.payload = None
+        self._put("done", (job.task, error), token)
+
+    def _upload(self, job: _Job, token: CancellationToken):
+        token.raise_if_done("pipeline")
+        job.task = job.item() if callable(job.item) else job.item
+        job.item = None
+
+        cache = self.client.cache
+        if cache is not None:
+            job.key = job.task.cache_key()
+            result = cache.get(job.key)
+            if result is not None:
+                job.task.config = self.client.config
+                job.task.set_result(result)
+                self._finish(job, None, token)
+                return
+
+        job.payload = job.task.build_payload(self.client.config)
+        self._put("trigger", job, token)
+
+    def _trigger(self, job: _Job, token: CancellationToken, priority: int, tenant: str):
+        config = self.client.config
+        task = job.task
+        scheduler = self.client.scheduler
+        if scheduler is not None:
+            job.ticket = scheduler.acquire(priority, tenant or task.api_path, token)
+
+        # the slot is taken before the trigger, so the server never has more than max_in_flight tasks
+        while not self._in_flight.acquire(timeout=0.1):
+            token.raise_if_done("pipeline")
+        job.in_flight = True
+        task._cancel_token = token
+        if config.balancer is None:
+            config.retry_policy.call("trigger", task.trigger, config, job.payload, cancel_token=token)
+        else:
+            job.backend = config.retry_policy.call(
+                "trigger", task._trigger_balanced, config, job.payload, cancel_token=token
+            )
+        job.payload = None
+
+        if config.callback_receiver is not None:
+            config.callback_receiver.register(task.task_uuid)
+        job.last_status = time.monotonic()
+        self._schedule_poll(job, time.monotonic() + self.poll_interval)
+
+    def _schedule_poll(self, job: _Job, at: float):
+        with self._polling_cond:
+            heapq.heappush(self._polling, (at, next(self._sequence), job))
+            self._polling_cond.notify()
+
+    def _poll_loop(self, token: CancellationToken):
+        while not token.cancelled:
+            with self._polling_cond:
+                if not self._polling:
+                    self._polling_cond.wait(0.1)
+                    continue
+                at, _, job = self._polling[0]
+                delay = at - time.monotonic()
+                if delay > 0:
+                    self._polling_cond.wait(min(delay, 0.1))
+                    continue
+                heapq.heappop(self._polling)
+
+            try:
+                with self.stages["poll"].working():
+                    self._poll(job, token)
+            except Exception as e:
+                self._finish(job, e, token)
+
+    def _poll(self, job: _Job, token: CancellationToken):
+        token.raise_if_done(str(job.task))
+        task = job.task
+        receiver = task.config.callback_receiver
+        if receiver is not None:
+            task_data = receiver.wait(task.task_uuid, 0)
+            if task_data is not None:
+                task._apply_status(task_data, defer_format=True)
+                job.last_status = time.monotonic()
+            elif time.monotonic() - job.last_status >= receiver.fallback_interval:
+                logger.info(f"{task} got no callback in {receiver.fallback_interval}s, checking its status")
+                if not self._check(job, token):
+                    return
+                job.last_status = time.monotonic()
+        elif not self._check(job, token):
+            return
+
+        if task.status not in _FINISHED:
+            self._schedule_poll(job, time.monotonic() + self.poll_interval)
+            return
+
+        # the server capacity is free as soon as the task is finished, formatting happens after
+        self._release(job)
+        self._put("post", job, token)
+
+    def _check(self, job: _Job, token: CancellationToken) -> bool:
+        """
+        Check the status of a task once. A transient failure reschedules the poll after the backoff of the retry
+        policy rather than sleeping, so the poll workers keep polling the other tasks meanwhile.
+
+        :return: Whether the status was checked, False if the poll is rescheduled.
+        """
+        task = job.task
+        policy = task.config.retry_policy
+        backoff = policy.backoff("poll")
+        if job.poll_failures == 0 and policy.budget is not None:
+            policy.budget.deposit()
+        try:
+            task.check(True)
+        except Exception as e:
+            now = time.monotonic()
+            if job.poll_failures == 0:
+                job.poll_failed_since = now
+            job.poll_failures += 1
+            if not policy.is_retryable(e) or job.poll_failures >= backoff.max_attempts:
+                raise
+            delay = backoff.delay(job.poll_failures)
+            if policy.max_elapsed is not None and now - job.poll_failed_since + delay > policy.max_elapsed:
+                raise
+            remaining = token.remaining()
+            if remaining is not None and remaining < delay:
+                raise
+            if policy.budget is not None and not policy.budget.withdraw():
+                logger.warning(f"Retry budget exhausted, giving up poll after {job.poll_failures} attempts, e:{e}")
+                raise
+            logger.warning(f"Failed to poll, times: {job.poll_failures}, retry in {delay:.2f}s, e:{e}")
+            self._schedule_poll(job, now + delay)
+            return False
+        job.poll_failures = 0
+        return True
+
+    def _post(self, job: _Job, token: CancellationToken):
+        task = job.task
+        try:
+            if task.status == TaskStatus.Failed:
+                raise RuntimeError(f"{task}  is failed, error: {task.error}")
+            task.format_raw_result()
+            if self.client.cache is not None:
+                self.client.cache.set(job.key, task.result)
+        finally:
+            if self.client.metrics is not None:
+                self.client.metrics.record(task)
+        self._finish(job, None, token)
@@ -0,0 +1,185 @@
+"""
+Filter the objects of a result locally: score and category filters, class-aware NMS, mask NMS and top-k.
+
+Ask the server for a permissive result once, for instance with a low ``bbox_threshold`` and a high
+``iou_threshold`` in the body, then try thresholds on it in milliseconds instead of running the task again::
+
+    from dds_cloudapi_sdk.postprocess import postprocess
+
+    client.run_task(task)  # with {"bbox_threshold": 0.05, "iou_threshold": 0.95, ...} in the body
+    for min_score in (0.2, 0.3, 0.4):
+        result = postprocess(task.result, min_score=min_score, iou_threshold=0.5, top_k=100)
+        print(min_score, len(result["objects"]))
+
+Results are never modified in place, so the same cached result can be swept again and again.
+"""
+
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+import numpy as np
+
+from dds_cloudapi_sdk.rle_util import coco_rle_to_dds_rle
+from dds_cloudapi_sdk.rle_util import rle_bbox
+from dds_cloudapi_sdk.rle_util import rle_fr_string
+from dds_cloudapi_sdk.rle_util import rle_iou
+
+__all__ = [
+    "box_iou",
+    "mask_nms",
+    "nms",
+    "postprocess",
+]
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    The intersection over union of each box of ``boxes1`` with each box of ``boxes2``.
+
+    :param boxes1: An (N, 4) array of [x0, y0, x1, y1] boxes.
+    :param boxes2: An (M, 4) array of [x0, y0, x1, y1] boxes.
+    :return: An (N, M) array.
+    """
+    boxes1 = np.asarray(boxes1, dtype=np.float64).reshape(-1, 4)
+    boxes2 = np.asarray(boxes2, dtype=np.float64).reshape(-1, 4)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]).clip(0) * (boxes1[:, 3] - boxes1[:, 1]).clip(0)
+    area2 = (boxes2[:, 2] - boxes2[:, 0]).clip(0) * (boxes2[:, 3] - boxes2[:, 1]).clip(0)
+    width = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2]) - np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    height = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3]) - np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    intersection = width.clip(0) * height.clip(0)
+    union = area1[:, None] + area2[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+
+
+def _greedy(order: np.ndarray, overlaps, iou_threshold: float) -> np.ndarray:
+    """Keep the candidates in order, each suppressing the later ones it overlaps by more than the threshold."""
+    suppressed = np.zeros(len(order), dtype=bool)
+    keep = []
+    for rank, i in enumerate(order):
+        if suppressed[rank]:
+            continue
+        keep.append(i)
+        rest = rank + 1
+        if rest < len(order):
+            suppressed[rest:] |= overlaps(i, order[rest:]) > iou_threshold
+    return np.array(keep, dtype=np.int64)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float,
+        categories: Sequence = None) -> np.ndarray:
+    """
+    Non-maximum suppression of boxes, within each category if categories are given.
+
+    :param boxes: An (N, 4) array of [x0, y0, x1, y1] boxes.
+    :param scores: The N scores of the boxes.
+    :param iou_threshold: Boxes overlapping a box of a higher score by more than this IoU are suppressed.
+    :param categories: The N categories of the boxes, boxes of different categories never suppress each other.
+    :return: The indices of the kept boxes, by descending score.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if categories is not None:
+        # move each category to its own region, so boxes of different categories never overlap
+        _, labels = np.unique(np.asarray([str(c) for c in categories]), return_inverse=True)
+        span = boxes.max() - min(boxes.min(), 0) + 1
+        boxes = boxes + (labels * span)[:, None]
+
+    order = np.argsort(-scores, kind="stable")
+    return _greedy(order, lambda i, rest: box_iou(boxes[i], boxes[rest])[0], iou_threshold)
+
+
+def mask_nms(masks: Sequence[dict], scores: np.ndarray, iou_threshold: float,
+             categories: Sequence = None) -> np.ndarray:
+    """
+    Non-maximum suppression of masks by their IoU, computed on their run lengths.
+
+    :param masks: The N masks, in dds_rle or coco_rle, of the same size.
+    :param scores: The N scores of the masks.
+    :param iou_threshold: Masks overlapping a mask of a higher score by more than this IoU are suppressed.
+    :param categories: The N categories of the masks, masks of different categories never suppress each other.
+    :return: The indices of the kept masks, by descending score.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if len(masks) == 0:
+        return np.zeros(0, dtype=np.int64)
+    formats = {mask.get("format", "dds_rle") for mask in masks}
+    if len(formats) > 1:
+        masks = [coco_rle_to_dds_rle(m) if m.get("format") == "coco_rle" else m for m in masks]
+    column_major = masks[0].get("format") == "coco_rle"
+    counts = [rle_fr_string(m["counts"]) if isinstance(m["counts"], str) else m["counts"] for m in masks]
+    # masks whose boxes don't intersect can't overlap, their IoU is never computed
+    boxes = np.array([rle_bbox(c, m["size"], column_major) or [0, 0, 0, 0] for c, m in zip(counts, masks)],
+                     dtype=np.float64)
+    labels = None if categories is None else np.asarray([str(c) for c in categories])
+
+    def overlaps(i, rest):
+        width = np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0])
+        height = np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1])
+        candidates = (width > 0) & (height > 0)
+        if labels is not None:
+            candidates &= labels[rest] == labels[i]
+        ious = np.zeros(len(rest), dtype=np.float64)
+        if candidates.any():
+            ious[candidates] = rle_iou([counts[i]], [counts[j] for j in rest[candidates]])[0]
+        return ious
+
+    order = np.argsort(-scores, kind="stable")
+    return _greedy(order, overlaps, iou_threshold)
+
+
+def postprocess(
+    result: dict,
+    min_score: float = None,
+    categories: Iterable[str] = None,
+    iou_threshold: float = None,
+    mask_iou_threshold: float = None,
+    class_agnostic: bool = False,
+    top_k: int = None,
+) -> dict:
+    """
+    Filter the objects of a task result, in this order: score, category, box NMS, mask NMS and top-k.
+
+    :param result: The result of a task, with its detections in ``objects``.
+    :param min_score: The minimum score of the kept objects.
+    :param categories: The categories of the kept objects, all by default.
+    :param iou_threshold: The box IoU above which the object of the lower score is suppressed, no box NMS if None.
+    :param mask_iou_threshold: The mask IoU above which the object of the lower score is suppressed,
+        no mask NMS if None. Objects without a mask are kept by the mask NMS.
+    :param class_agnostic: Whether objects of different categories suppress each other.
+    :param top_k: The maximum number of objects kept, those of the highest scores.
+    :return: A copy of the result with the kept objects, by descending score.
+    """
+    objects: List[dict] = list(result.get("objects") or [])
+    scores = np.array([obj.get("score", 0.0) for obj in objects], dtype=np.float64)
+    keep = np.arange(len(objects))
+
+    if min_score is not None:
+        keep = keep[scores[keep] >= min_score]
+    if categories is not None:
+        wanted = set(categories)
+        keep = keep[np.array([objects[i].get("category") in wanted for i in keep], dtype=bool)]
+
+    def category_of(indices: np.ndarray) -> Optional[list]:
+        return None if class_agnostic else [objects[i].get("category") for i in indices]
+
+    if iou_threshold is not None:
+        with_box = keep[np.array([bool(objects[i].get("bbox")) for i in keep], dtype=bool)]
+        without_box = np.setdiff1d(keep, with_box)
+        boxes = np.array([objects[i]["bbox"] for i in with_box], dtype=np.float64)
+        kept = with_box[nms(boxes, scores[with_box], iou_threshold, category_of(with_box))]
+        keep = np.concatenate([kept, without_box])
+    if mask_iou_threshold is not None:
+        with_mask = keep[np.array([bool(objects[i].get("mask")) for i in keep], dtype=bool)]
+        without_mask = np.setdiff1d(keep, with_mask)
+        masks = [objects[i]["mask"] for i in with_mask]
+        kept = with_mask[mask_nms(masks, scores[with_mask], mask_iou_threshold, category_of(with_mask))]
+        keep = np.concatenate([kept, without_mask])
+
+    keep = keep[np.argsort(-scores[keep], kind="stable")]
+    if top_k is not None:
+        keep = keep[:top_k]
+    return {**result, "objects": [objects[i] for i in keep]}
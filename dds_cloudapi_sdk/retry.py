@@ -0,0 +1,215 @@
+"""
+Retry policy used by tasks when talking to the DDS Cloud API.
+
+A :class:`RetryPolicy` decides which failures are transient, how long to back off between attempts,
+and how many retries may be spent in total. It is configured on the :class:`Config <dds_cloudapi_sdk.config.Config>`
+and shared by every task run with that config::
+
+    from dds_cloudapi_sdk import Config
+    from dds_cloudapi_sdk.retry import Backoff
+    from dds_cloudapi_sdk.retry import RetryPolicy
+
+    policy = RetryPolicy(
+        trigger=Backoff(max_attempts=5, base_delay=1, max_delay=20),
+        poll=Backoff(max_attempts=10, base_delay=0.5, max_delay=10),
+        max_elapsed=120,
+    )
+    config = Config(token, retry_policy=policy)
+
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+from typing import Type
+
+import requests
+
+from dds_cloudapi_sdk.deadline import CancellationToken
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+__all__ = [
+    "Retry",
+    "Backoff",
+    "RetryBudget",
+    "RetryPolicy",
+]
+
+
+class Retry(Exception):
+    """
+    Raised when the server asks the client to try again later.
+    It is always treated as retryable by :class:`RetryPolicy`.
+    """
+
+    def __init__(self, msg: str = "", status_code: int = None):
+        super().__init__(msg)
+        self.status_code = status_code
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter for one phase of a task.
+
+    :param max_attempts: The maximum number of attempts, including the first one.
+    :param base_delay: The delay in seconds before the first retry.
+    :param max_delay: The upper bound in seconds of a single delay.
+    :param multiplier: The growth factor of the delay between two retries.
+    :param jitter: The fraction of the delay that is randomized, 0 disables jitter and 1 is "full jitter".
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 2.0,
+        max_delay: float = 30.0,
+        multiplier: float = 2.0,
+        jitter: float = 0.5,
+    ):
+        if max_attempts < 1:
+            raise ValueError(f"max_attempts must be at least 1, got {max_attempts}")
+        if not 0 <= jitter <= 1:
+            raise ValueError(f"jitter must be in [0, 1], got {jitter}")
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        """
+        The delay in seconds to sleep after the given failed attempt, which starts from 1.
+        """
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay - random.uniform(0, delay * self.jitter)
+
+
+class RetryBudget:
+    """
+    A token bucket shared by all tasks of a config that caps the ratio of retries to requests.
+
+    | Every request deposits ``ratio`` tokens and every retry withdraws one token.
+    | When the bucket is empty, failures are raised immediately instead of being retried,
+      so an outage on the server side does not turn into a retry storm.
+
+    :param ratio: The number of retries allowed per request, e.g. 0.2 allows one retry every five requests.
+    :param min_tokens: The tokens available at startup, so that the first few failures can be retried.
+    :param max_tokens: The capacity of the bucket.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min(min_tokens, max_tokens)
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        return self._tokens
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """
+    The retry policy of the trigger and poll phases of a task.
+
+    :param trigger: The :class:`Backoff` used when triggering a task.
+    :param poll: The :class:`Backoff` used when checking the status of a triggered task.
+    :param max_elapsed: The maximum seconds spent on retrying a single call, None for no limit.
+    :param retryable_status_codes: The HTTP status codes considered transient.
+    :param retryable_errors: The exception classes considered transient.
+    :param budget: The :class:`RetryBudget` shared by all calls, None to disable the budget.
+    """
+
+    DEFAULT_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+    DEFAULT_RETRYABLE_ERRORS = (
+        Retry,
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+    )
+
+    def __init__(
+        self,
+        trigger: Backoff = None,
+        poll: Backoff = None,
+        max_elapsed: Optional[float] = None,
+        retryable_status_codes: Iterable[int] = DEFAULT_RETRYABLE_STATUS_CODES,
+        retryable_errors: Tuple[Type[BaseException], ...] = DEFAULT_RETRYABLE_ERRORS,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.trigger = trigger or Backoff(max_attempts=3, base_delay=2.0)
+        self.poll = poll or Backoff(max_attempts=5, base_delay=0.5, max_delay=8.0)
+        self.max_elapsed = max_elapsed
+        self.retryable_status_codes = frozenset(retryable_status_codes)
+        self.retryable_errors = tuple(retryable_errors)
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def backoff(self, phase: str) -> Backoff:
+        if phase == "trigger":
+            return self.trigger
+        elif phase == "poll":
+            return self.poll
+        raise ValueError(f"Unknown retry phase: {phase}")
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.retryable_status_codes
+
+    def is_retryable(self, error: BaseException) -> bool:
+        return isinstance(error, self.retryable_errors)
+
+    def call(self, phase: str, func: Callable, *args, cancel_token: CancellationToken = None, **kwargs):
+        """
+        Call ``func`` and retry it on transient errors according to the backoff of ``phase``.
+
+        :param phase: Either "trigger" or "poll".
+        :param func: The function to call.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>`
+            stopping the retries when it is cancelled or there is no time left for the next attempt.
+        :return: The return value of ``func``.
+        """
+        backoff = self.backoff(phase)
+        start = time.monotonic()
+        attempt = 0
+        if self.budget is not None:
+            self.budget.deposit()
+        while True:
+            attempt += 1
+            if cancel_token is not None:
+                cancel_token.raise_if_done(phase)
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_retryable(e) or attempt >= backoff.max_attempts:
+                    raise
+
+                delay = backoff.delay(attempt)
+                if self.max_elapsed is not None and time.monotonic() - start + delay > self.max_elapsed:
+                    raise
+                if cancel_token is not None and cancel_token.remaining() is not None and cancel_token.remaining() < delay:
+                    raise
+                if self.budget is not None and not self.budget.withdraw():
+                    logger.warning(f"Retry budget exhausted, giving up {phase} after {attempt} attempts, e:{e}")
+                    raise
+
+                logger.warning(f"Failed to {phase}, times: {attempt}, retry in {delay:.2f}s, e:{e}")
+                if cancel_token is not None:
+                    cancel_token.sleep(delay)
+                else:
+                    time.sleep(delay)
@@ -1,5 +1,7 @@
 import numpy as np
 
+from dds_cloudapi_sdk.instrumentation import instrumented
+
 
 def mask_to_rle(img, encode=False):
     """
@@ -17,64 +19,327 @@ def mask_to_rle(img, encode=False):
     return counts
 
 
+@instrumented("rle_to_array", nbytes=lambda img: img.nbytes)
 def rle_to_array(cnts, size, label=1):
     if isinstance(cnts, str):
         cnts = rle_fr_string(cnts)
+    cnts = np.asarray(cnts, dtype=np.int64)
+    values = np.zeros(len(cnts), dtype=np.uint8)
+    values[1::2] = label
+    pixels = np.repeat(values, cnts)
     img = np.zeros(size, dtype=np.uint8)
-    ps = 0
-    for i in range(0, len(cnts)):
-        if i & 1 == 0:
-            ps += cnts[i]
-            continue
-        img[ps:ps + cnts[i]] = label
-        ps += cnts[i]
+    n = min(len(pixels), img.size)
+    img.reshape(-1)[:n] = pixels[:n]
     return img
 
 
+def rle_to_indices(cnts):
+    """
+    cnts: run lengths starting with a background run, or their string form
+    Returns the flat indices of the foreground pixels, without decoding the whole mask
+    """
+    if isinstance(cnts, str):
+        cnts = rle_fr_string(cnts)
+    cnts = np.asarray(cnts, dtype=np.int64)
+    ends = np.cumsum(cnts)
+    starts = ends - cnts
+    starts, lengths = starts[1::2], cnts[1::2]
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    # index of each foreground pixel = start of its run + its offset in the run
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(total, dtype=np.int64)
+
+
+def rle_to_runs(cnts):
+    """
+    cnts: run lengths starting with a background run, or their string form
+    Returns the start and end (exclusive) flat indices of the foreground runs
+    """
+    if isinstance(cnts, str):
+        cnts = rle_fr_string(cnts)
+    cnts = np.asarray(cnts, dtype=np.int64)
+    ends = np.cumsum(cnts)
+    starts = ends - cnts
+    return starts[1::2], ends[1::2]
+
+
+def merge_runs(starts, ends):
+    """
+    starts, ends: foreground runs in any order, possibly overlapping
+    Returns the sorted, disjoint runs covering the same pixels, touching runs are joined
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # a new run begins where a start is past the furthest end seen so far
+    new = np.concatenate([[True], starts[1:] > ends[:-1]])
+    last = np.concatenate([new[1:], [True]])
+    return starts[new], ends[last]
+
+
+def runs_to_rle(starts, ends, total=None):
+    """
+    starts, ends: sorted, disjoint foreground runs
+    total: the number of pixels of the mask, the trailing background run is only added if given and not empty
+    Returns run lengths starting with a background run, like mask_to_rle
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    bounds = np.empty(len(starts) * 2 + 1, dtype=np.int64)
+    bounds[0] = 0
+    bounds[1::2] = starts
+    bounds[2::2] = ends
+    counts = np.diff(bounds)
+    if total is not None and total > bounds[-1]:
+        counts = np.append(counts, total - bounds[-1])
+    return [int(x) for x in counts]
+
+
+def rle_area(cnts):
+    """
+    cnts: run lengths starting with a background run, or their string form
+    Returns the number of foreground pixels
+    """
+    if isinstance(cnts, str):
+        cnts = rle_fr_string(cnts)
+    return int(np.sum(cnts[1::2], dtype=np.int64))
+
+
+def split_runs(starts, ends, stride):
+    """
+    starts, ends: foreground runs in a flat index space made of lines of ``stride`` pixels
+    Returns the line, start and end (exclusive) in the line of each piece of the runs, split where they wrap around
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    first, last = starts // stride, (ends - 1) // stride
+    lines = last - first + 1
+    run = np.repeat(np.arange(len(starts)), lines)
+    line = first[run] + np.arange(int(lines.sum())) - np.repeat(np.cumsum(lines) - lines, lines)
+    lo = np.maximum(starts[run] - line * stride, 0)
+    hi = np.minimum(ends[run] - line * stride, stride)
+    return line, lo, hi
+
+
+def _sweep(runs, weights, keep):
+    """
+    runs: (starts, ends) of several sorted, disjoint run lists, weights: the weight of each list
+    keep: a function of the summed weights covering a position, telling whether the position is kept
+    Returns the sorted, disjoint runs of the kept positions, touching runs are joined
+    """
+    positions = np.concatenate([np.concatenate([starts, ends]) for starts, ends in runs]).astype(np.int64)
+    deltas = np.concatenate([
+        np.concatenate([np.full(len(starts), w, dtype=np.int64), np.full(len(ends), -w, dtype=np.int64)])
+        for (starts, ends), w in zip(runs, weights)
+    ])
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    order = np.lexsort((deltas, positions))
+    positions, deltas = positions[order], deltas[order]
+    # the coverage after an event holds until the next event
+    inside = keep(np.cumsum(deltas))
+    before = np.concatenate([[False], inside[:-1]])
+    starts, ends = positions[inside & ~before], positions[~inside & before]
+    # events at the same position may leave empty runs and gaps
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+    if len(starts) > 1:
+        gap = starts[1:] > ends[:-1]
+        starts = starts[np.concatenate([[True], gap])]
+        ends = ends[np.concatenate([gap, [True]])]
+    return starts, ends
+
+
+def rle_union(rles, total=None):
+    """
+    rles: run lengths of masks of the same size and layout, or their string form
+    total: the number of pixels of the masks, the trailing background run is only added if given
+    Returns the run lengths of the pixels in any of the masks
+    """
+    runs = [rle_to_runs(cnts) for cnts in rles]
+    return runs_to_rle(*_sweep(runs, [1] * len(runs), lambda cover: cover > 0), total)
+
+
+def rle_intersection(rles, total=None):
+    """
+    rles: run lengths of masks of the same size and layout, or their string form
+    total: the number of pixels of the masks, the trailing background run is only added if given
+    Returns the run lengths of the pixels in all of the masks
+    """
+    runs = [rle_to_runs(cnts) for cnts in rles]
+    return runs_to_rle(*_sweep(runs, [1] * len(runs), lambda cover: cover == len(runs)), total)
+
+
+def _covered(starts, ends, areas, positions):
+    """The number of foreground pixels of the sorted, disjoint runs before each position."""
+    i = np.searchsorted(starts, positions, side="left") - 1
+    safe = np.maximum(i, 0)
+    covered = areas[safe] - np.maximum(ends[safe] - positions, 0)
+    return np.where(i >= 0, covered, 0)
+
+
+def rle_iou(dts, gts):
+    """
+    dts, gts: run lengths of masks of the same size and layout, or their string form
+    Returns the matrix of the intersection over union of each mask of dts with each mask of gts
+    """
+    dt_runs = [rle_to_runs(cnts) for cnts in dts]
+    gt_runs = [rle_to_runs(cnts) for cnts in gts]
+    ious = np.zeros((len(dt_runs), len(gt_runs)), dtype=np.float64)
+    if not dt_runs or not gt_runs:
+        return ious
+
+    # the runs of all gts in one array, offsets[j] is the index of the first run of gts[j]
+    gt_starts = np.concatenate([starts for starts, _ in gt_runs])
+    gt_ends = np.concatenate([ends for _, ends in gt_runs])
+    counts = np.array([len(starts) for starts, _ in gt_runs])
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    gt_areas = np.array([int((ends - starts).sum()) for starts, ends in gt_runs], dtype=np.float64)
+
+    for i, (starts, ends) in enumerate(dt_runs):
+        dt_area = float((ends - starts).sum())
+        if len(starts) == 0 or len(gt_starts) == 0:
+            continue
+        areas = np.cumsum(ends - starts)
+        # the pixels of dt inside each gt run, summed per gt
+        inside = _covered(starts, ends, areas, gt_ends) - _covered(starts, ends, areas, gt_starts)
+        intersection = np.zeros(len(gt_runs), dtype=np.float64)
+        nonempty = counts > 0
+        intersection[nonempty] = np.add.reduceat(inside, offsets[nonempty])
+        union = dt_area + gt_areas - intersection
+        ious[i] = np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+    return ious
+
+
+def rle_bbox(cnts, size, column_major=False):
+    """
+    cnts: run lengths starting with a background run, or their string form
+    size: the (height, width) of the mask
+    column_major: whether the pixels are counted column by column, like coco_rle, instead of row by row
+    Returns the [x0, y0, x1, y1] box of the foreground pixels, x1 and y1 exclusive, or None for an empty mask
+    """
+    height, width = size
+    starts, ends = rle_to_runs(cnts)
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+    if len(starts) == 0:
+        return None
+    stride = height if column_major else width
+    first, last = starts // stride, (ends - 1) // stride
+    single = first == last
+    # a run over several lines covers the whole span of the lines between them
+    lo = np.where(single, starts % stride, 0).min()
+    hi = np.where(single, (ends - 1) % stride, stride - 1).max() + 1
+    major_lo, major_hi = int(first.min()), int(last.max()) + 1
+    if column_major:
+        return [major_lo, int(lo), major_hi, int(hi)]
+    return [int(lo), major_lo, int(hi), major_hi]
+
+
+def _transpose_runs(starts, ends, stride, lines):
+    """
+    Turn the runs of a mask of ``lines`` lines of ``stride`` pixels into the runs of its transpose,
+    working on the edges of the runs so the cost follows the number of runs and not the number of pixels.
+    """
+    # a run of the transpose starts on the pixels whose previous line is background, and ends after
+    # the pixels whose next line is background
+    runs = (starts, ends)
+    tops = _sweep([runs, (starts + stride, ends + stride)], [1, 2], lambda cover: cover == 1)
+    bottoms = _sweep([runs, (starts - stride, ends - stride)], [1, 2], lambda cover: cover == 1)
+
+    def transposed(edges, shift):
+        line, lo, hi = split_runs(*edges, stride)
+        width = hi - lo
+        piece = np.repeat(np.arange(len(line)), width)
+        column = lo[piece] + np.arange(int(width.sum())) - np.repeat(np.cumsum(width) - width, width)
+        return np.sort(column * lines + line[piece] + shift)
+
+    new_starts, new_ends = transposed(tops, 0), transposed(bottoms, 1)
+    if len(new_starts) > 1:
+        # runs ending on the last line and starting on the first line of the next column touch
+        gap = new_starts[1:] > new_ends[:-1]
+        new_starts = new_starts[np.concatenate([[True], gap])]
+        new_ends = new_ends[np.concatenate([gap, [True]])]
+    return new_starts, new_ends
+
+
+def _counts_of(mask):
+    counts = mask["counts"]
+    if isinstance(counts, bytes):
+        counts = counts.decode("utf-8")
+    if isinstance(counts, str):
+        counts = rle_fr_string(counts)
+    return counts
+
+
+def dds_rle_to_coco_rle(mask):
+    """
+    mask: a dds_rle mask, {"counts": ..., "size": [height, width]} with the pixels counted row by row
+    Returns the same mask in coco_rle, with the pixels counted column by column, without decoding it
+    """
+    height, width = mask["size"]
+    starts, ends = _transpose_runs(*rle_to_runs(_counts_of(mask)), width, height)
+    return {"counts": rle_to_string(runs_to_rle(starts, ends, height * width)), "size": [height, width],
+            "format": "coco_rle"}
+
+
+def coco_rle_to_dds_rle(mask):
+    """
+    mask: a coco_rle mask, {"counts": ..., "size": [height, width]} with the pixels counted column by column
+    Returns the same mask in dds_rle, with the pixels counted row by row, without decoding it
+    """
+    height, width = mask["size"]
+    starts, ends = _transpose_runs(*rle_to_runs(_counts_of(mask)), height, width)
+    return {"counts": rle_to_string(runs_to_rle(starts, ends)), "size": [height, width], "format": "dds_rle"}
+
+
+@instrumented("rle_to_string", nbytes=len)
 def rle_to_string(cnts):
     # Similar to LEB128 but using 6 bits/char and ascii chars 48-111.
-    m = len(cnts)
-    p = 0
-    s = [''] * (m * 6)
-
-    for i in range(m):
-        x = cnts[i]
-        if i > 2:
-            x -= cnts[i - 2]
-        more = True
-
-        while more:
-            c = x & 0x1f
-            x >>= 5
-            more = x != -1 if (c & 0x10) else (x != 0)
-            if more:
-                c |= 0x20
-            c += 48
-            s[p] = chr(c)
-            p += 1
-    return ''.join(s)
+    x = np.array(cnts, dtype=np.int64)
+    if len(x) == 0:
+        return ''
+    if len(x) > 3:
+        x[3:] -= np.array(cnts[1:-2], dtype=np.int64)
+    # the number of 5 bit chars of each value, as a signed number the last char holds the sign in its 0x10 bit
+    magnitude = np.where(x < 0, ~x, x)
+    chars = np.ones(len(x), dtype=np.int64)
+    for n in range(1, 13):
+        chars += magnitude >= (1 << (5 * n - 1))
+    value = np.repeat(np.arange(len(x)), chars)
+    k = np.arange(len(value)) - np.repeat(np.cumsum(chars) - chars, chars)
+    c = (x[value] >> (5 * k)) & 0x1f
+    c[k < chars[value] - 1] |= 0x20
+    return (c + 48).astype(np.uint8).tobytes().decode('ascii')
 
 
+@instrumented("rle_fr_string")
 def rle_fr_string(s):
-    p = 0
-    cnts = []
-
-    while p < len(s) and s[p]:
-        x = 0
-        k = 0
-        more = 1
-
-        while more:
-            c = ord(s[p]) - 48
-            x |= (c & 0x1f) << 5 * k
-            more = c & 0x20
-            p += 1
-            k += 1
-
-            if not more and (c & 0x10):
-                x |= -1 << 5 * k
-
-        if len(cnts) > 2:
-            x += cnts[len(cnts) - 2]
-        cnts.append(x)
-    return cnts
+    if isinstance(s, bytes):
+        s = s.decode('ascii')
+    codes = np.frombuffer(s.encode('ascii'), dtype=np.uint8).astype(np.int64) - 48
+    if len(codes) == 0:
+        return []
+    # a value ends on a char without the 0x20 continuation bit
+    ends = np.flatnonzero((codes & 0x20) == 0)
+    if len(ends) == 0 or ends[-1] != len(codes) - 1:
+        ends = np.append(ends, len(codes) - 1)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts + 1
+    k = np.arange(len(codes)) - np.repeat(starts, lengths)
+    x = np.add.reduceat((codes & 0x1f) << (5 * k), starts)
+    # sign extension
+    negative = (codes[ends] & 0x10) != 0
+    x[negative] -= np.left_shift(1, 5 * lengths[negative])
+    # values after the third are deltas to the value two places before
+    if len(x) > 3:
+        x[1::2] = np.cumsum(x[1::2])
+        x[2::2] = np.cumsum(x[2::2])
+    return x.tolist()
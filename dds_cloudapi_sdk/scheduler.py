@@ -0,0 +1,190 @@
+"""
+Share one API quota between interactive calls and background batches.
+
+A :class:`Scheduler` given to the :class:`Client <dds_cloudapi_sdk.client.Client>` limits the number of tasks
+in flight on the server. Tasks waiting for a slot are served by priority class first, then fairly across
+tenants of the same class by weighted fair queuing, so a large batch never delays user facing calls
+behind its queued triggers::
+
+    from dds_cloudapi_sdk.scheduler import Priority
+    from dds_cloudapi_sdk.scheduler import Scheduler
+
+    scheduler = Scheduler(max_in_flight=16, class_limits={Priority.Batch: 12}, weights={"team-a": 2})
+    client = Client(config, scheduler=scheduler)
+
+    client.run_task(task, priority=Priority.Interactive)
+    client.run_tasks(tasks, priority=Priority.Batch, tenant="team-a")
+
+Tasks can't be preempted once triggered, ``class_limits`` keeps slots free for higher classes
+so they don't wait for long running batch tasks to finish.
+"""
+
+import contextlib
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+
+from dds_cloudapi_sdk.deadline import CancellationToken
+from dds_cloudapi_sdk.metrics import LatencyHistogram
+
+__all__ = [
+    "Priority",
+    "Scheduler",
+]
+
+
+class Priority:
+    """
+    The priority classes of tasks, a lower value is served first.
+    """
+    Interactive = 0  # a user is waiting for the result
+    Normal = 1  # the default
+    Batch = 2  # background work using the spare capacity
+
+
+class _Ticket:
+    def __init__(self, priority: int, tenant: str):
+        self.priority = priority
+        self.tenant = tenant
+        self.queued_at = time.monotonic()
+        self.granted = threading.Event()
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    Admit tasks to the server by priority class and weighted fair queuing across tenants.
+
+    :param max_in_flight: The maximum number of tasks triggered and not finished yet.
+    :param weights: The weight of each tenant, 1 by default. Within a priority class,
+        a tenant of weight 2 is admitted twice as often as a tenant of weight 1 when both have tasks waiting.
+    :param class_limits: The maximum number of tasks in flight of each priority class,
+        :attr:`max_in_flight` by default.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        weights: Dict[str, float] = None,
+        class_limits: Dict[int, int] = None,
+    ):
+        if max_in_flight < 1:
+            raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight}")
+
+        self.max_in_flight = max_in_flight
+        self.weights = dict(weights or {})
+        self.class_limits = dict(class_limits or {})
+        self.wait_times: Dict[int, LatencyHistogram] = {}  # priority -> seconds spent waiting for a slot
+
+        self._queues: Dict[int, list] = {}  # priority -> heap of (finish tag, sequence, ticket)
+        self._virtual_time: Dict[int, float] = {}  # priority -> finish tag of the last admitted ticket
+        self._finish_tags: Dict[tuple, float] = {}  # (priority, tenant) -> finish tag of its last queued ticket
+        self._class_in_flight: Dict[int, int] = {}
+        self._in_flight = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def queued(self, priority: int = None) -> int:
+        """
+        The number of tasks waiting for a slot, of a priority class or in total.
+        """
+        with self._lock:
+            queues = self._queues.values() if priority is None else [self._queues.get(priority, [])]
+            return sum(1 for queue in queues for _, _, ticket in queue if not ticket.cancelled)
+
+    def _admit(self):
+        """Grant free slots to the waiting tickets, the caller holds the lock."""
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            limit = self.class_limits.get(priority, self.max_in_flight)
+            while queue and self._in_flight < self.max_in_flight and self._class_in_flight.get(priority, 0) < limit:
+                tag, _, ticket = heapq.heappop(queue)
+                key = (priority, ticket.tenant)
+                if self._finish_tags.get(key, math.inf) <= tag:
+                    # the last ticket of the tenant, the virtual time of the class now orders its next ones
+                    del self._finish_tags[key]
+                if ticket.cancelled:
+                    continue
+                self._virtual_time[priority] = tag
+                self._in_flight += 1
+                self._class_in_flight[priority] = self._class_in_flight.get(priority, 0) + 1
+                ticket.granted.set()
+            if self._in_flight >= self.max_in_flight:
+                return
+
+    def acquire(self, priority: int = Priority.Normal, tenant: str = "default",
+                cancel_token: CancellationToken = None) -> _Ticket:
+        """
+        Block until a slot is granted, the slot must be given back with :meth:`release`.
+
+        :param priority: The :class:`Priority` class of the task.
+        :param tenant: The tenant sharing the capacity of its class fairly with the other tenants.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>`
+            to give up waiting with.
+        :return: The ticket holding the slot.
+        """
+        ticket = _Ticket(priority, tenant)
+        with self._lock:
+            # weighted fair queuing: a ticket finishes 1 / weight after the later of the
+            # class virtual time and the previous ticket of the same tenant
+            start = max(self._virtual_time.get(priority, 0.0), self._finish_tags.get((priority, tenant), 0.0))
+            tag = start + 1.0 / self.weights.get(tenant, 1.0)
+            self._finish_tags[(priority, tenant)] = tag
+            heapq.heappush(self._queues.setdefault(priority, []), (tag, next(self._sequence), ticket))
+            self._admit()
+
+        if cancel_token is None:
+            ticket.granted.wait()
+        else:
+            while not ticket.granted.wait(cancel_token.limit(0.25)):
+                if cancel_token.cancelled or cancel_token.expired:
+                    with self._lock:
+                        if not ticket.granted.is_set():
+                            ticket.cancelled = True
+                    if ticket.cancelled:
+                        cancel_token.raise_if_done(f"waiting for a slot of priority {priority}")
+
+        histogram = self.wait_times.get(priority)
+        if histogram is None:
+            histogram = self.wait_times.setdefault(priority, LatencyHistogram())
+        histogram.record(time.monotonic() - ticket.queued_at)
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        """
+        Give back the slot of a ticket and admit the next waiting task.
+        """
+        with self._lock:
+            self._in_flight -= 1
+            self._class_in_flight[ticket.priority] -= 1
+            self._admit()
+
+    @contextlib.contextmanager
+    def slot(self, priority: int = Priority.Normal, tenant: str = "default",
+             cancel_token: CancellationToken = None) -> Iterator[_Ticket]:
+        """
+        Hold a slot for the duration of a ``with`` block, see :meth:`acquire`.
+        """
+        ticket = self.acquire(priority, tenant, cancel_token)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """
+        The current occupancy and the p99 seconds waited for a slot per priority class.
+        """
+        stats = {"in_flight": self._in_flight, "queued": self.queued()}
+        for priority, histogram in sorted(self.wait_times.items()):
+            stats[f"wait_p99_priority_{priority}"] = histogram.percentile(99)
+        return stats
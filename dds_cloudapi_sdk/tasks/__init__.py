@@ -20,9 +20,11 @@ Here's how to utilize a task class effectively:
 """
 
 from dds_cloudapi_sdk.tasks.base import LabelTypes
+from dds_cloudapi_sdk.tasks.base import TaskPhase
 from dds_cloudapi_sdk.tasks.base import TaskStatus
 
 __all__ = [
     "TaskStatus",
+    "TaskPhase",
     "LabelTypes",
 ]
@@ -3,6 +3,7 @@ import enum
 import importlib
 import importlib.metadata
 import logging
+import os
 import time
 import uuid
 
@@ -10,7 +11,15 @@ import requests
 import sentry_sdk
 from flask import json
 
+from dds_cloudapi_sdk.cache import canonical_hash
+from dds_cloudapi_sdk.config import BodyRetention
 from dds_cloudapi_sdk.config import Config
+from dds_cloudapi_sdk.connection import configure_session
+from dds_cloudapi_sdk.deadline import CancellationToken
+from dds_cloudapi_sdk.deadline import DeadlineExceeded
+from dds_cloudapi_sdk.deadline import TaskCancelled
+from dds_cloudapi_sdk.instrumentation import stage
+from dds_cloudapi_sdk.retry import Retry
 
 logger = logging.getLogger("dds_cloudapi_sdk")
 if sentry_sdk.get_client() is None or not sentry_sdk.get_client().is_active():
@@ -24,6 +33,7 @@ if sentry_sdk.get_client() is None or not sentry_sdk.get_client().is_active():
         in_app_include=["dds_cloudapi_sdk"],
     )
 http_session = requests.Session()
+configure_session(http_session)
 
 
 class TaskStatus(enum.Enum):
@@ -34,6 +44,19 @@ class TaskStatus(enum.Enum):
     Failed = "failed"  # task is failed
 
 
+class TaskPhase:
+    """
+    The timestamps recorded in :attr:`BaseTask.timestamps` as a task goes through its life cycle.
+    Server side timestamps are observed by polling, so they are accurate to the polling interval.
+    """
+    TriggerStart = "trigger_start"  # start to encode and send the trigger request
+    TriggerEnd = "trigger_end"  # the server accepted the task
+    Running = "running"  # first observed running on the server
+    Finished = "finished"  # first observed success or failed on the server
+    FormatStart = "format_start"  # start to format the result locally
+    FormatEnd = "format_end"  # the result is formatted
+
+
 class LabelTypes(enum.Enum):
     BBox = "bbox"
     Mask = "mask"
@@ -43,13 +66,21 @@ class ErrCode:
     Retry = 202001
 
 
-class Retry(Exception):
-    pass
-
-
 class BaseTask(abc.ABC):
+    # tasks are held by the million in bulk jobs, keep them free of a __dict__
+    __slots__ = (
+        "config",
+        "task_uuid",
+        "status",
+        "error",
+        "_result",
+        "_idempotency_key",
+        "_request_timeout",
+        "timestamps",
+        "_cancel_token",
+    )
 
-    _request_timeout = 5
+    DEFAULT_REQUEST_TIMEOUT = 5
 
     def __init__(self):
         super().__init__()
@@ -59,7 +90,22 @@ class BaseTask(abc.ABC):
         self.status = None
         self.error = None
         self._result = None
-        self.trigger_idempotency_key = uuid.uuid4().hex
+        self._idempotency_key = None
+        self._request_timeout = self.DEFAULT_REQUEST_TIMEOUT
+        self.timestamps = {}  # phase name -> unix timestamp, see TaskPhase
+        self._cancel_token = None  # the CancellationToken of the current run or wait
+
+    @property
+    def trigger_idempotency_key(self) -> str:
+        # generated on first use, so tasks waiting to be triggered don't carry it
+        if self._idempotency_key is None:
+            self._idempotency_key = uuid.uuid4().hex
+        return self._idempotency_key
+
+    @trigger_idempotency_key.setter
+    def trigger_idempotency_key(self, key: str):
+        # re-submitting a task after a crash with its known key makes the server return the same task
+        self._idempotency_key = key
 
     @property
     @abc.abstractmethod
@@ -99,21 +145,76 @@ class BaseTask(abc.ABC):
     def set_request_timeout(self, timeout):
         self._request_timeout = timeout
 
-    def trigger(self, config: Config):
+    def _http_timeout(self) -> float:
+        if self._cancel_token is None:
+            return self._request_timeout
+        return self._cancel_token.limit(self._request_timeout)
+
+    def cache_key(self) -> str:
+        """
+        The canonical hash of the request, tasks with equal keys are expected to produce equal results.
+        """
+        return canonical_hash(self.api_path, self.api_body)
+
+    def set_result(self, result: dict):
+        """
+        Complete the task with an already formatted result, without talking to the server.
+        """
+        self._result = result
+        self.status = TaskStatus.Success
+
+    def pop_result(self) -> dict:
+        """
+        Take the result out of the task, so a task kept around after it is consumed holds no result.
+        """
+        result, self._result = self._result, None
+        return result
+
+    def release_body(self, spill_path: str = None):
+        """
+        Drop the request body of a triggered task, optionally keeping it in a file readable through :attr:`api_body`.
+        Tasks not supporting it keep their body.
+
+        :param spill_path: The file the body is spilled to, None to drop it.
+        """
+
+    def discard_spilled_body(self):
+        """
+        Delete the file the request body was spilled to, if any.
+        """
+
+    def build_payload(self, config: Config) -> str:
+        """
+        Serialize the trigger request body, which can be done ahead of :meth:`trigger`.
+        """
+        api_body = self.api_body
+        if config.callback_receiver is not None:
+            api_body = {**api_body, config.callback_receiver.body_field: config.callback_receiver.url}
+        with stage("json_encode") as span:
+            payload = json.dumps(api_body)
+            span.add_bytes(len(payload))
+        return payload
+
+    def trigger(self, config: Config, payload: str = None):
         if self.no_need_to_trigger():
             return
 
         self.config = config
         self.status = TaskStatus.Triggering
-        payload = json.dumps(self.api_body)
+        self.timestamps.setdefault(TaskPhase.TriggerStart, time.time())
+        if payload is None:
+            payload = self.build_payload(config)
 
         sentry_sdk.set_extra("request-size", len(payload))
-        rsp = http_session.post(
+        rsp = self._request(
+            "POST",
             self.api_trigger_url,
             data=payload,
             headers=self.trigger_headers,
-            timeout=self._request_timeout
+            timeout=self._http_timeout()
         )
+        if config.retry_policy.is_retryable_status(rsp.status_code):
+            raise Retry(f"Failed to trigger {self}, http status: {rsp.status_code}", rsp.status_code)
         rsp_json = rsp.json()
         sentry_sdk.set_extra("response-size", len(rsp.content))
         if rsp_json["code"] == ErrCode.Retry:
@@ -121,39 +222,160 @@ class BaseTask(abc.ABC):
         if rsp_json["code"] != 0:
             raise RuntimeError(f"Failed to trigger {self}, error: {rsp_json['msg']}")
         self.task_uuid = rsp_json["data"]["task_uuid"]
+        self.timestamps[TaskPhase.TriggerEnd] = time.time()
+        self._retain_body(config, payload if config.callback_receiver is None else None)
 
         logger.info(f"{self} is triggered successfully")
 
+    def _retain_body(self, config: Config, payload: str = None):
+        if config.body_retention == BodyRetention.Release:
+            self.release_body()
+        elif config.body_retention == BodyRetention.Spill:
+            spill_path = os.path.join(config.spill_dir, f"{self.trigger_idempotency_key}.json")
+            with open(spill_path, "w", encoding="utf8") as fp:
+                fp.write(payload if payload is not None else json.dumps(self.api_body))
+            self.release_body(spill_path)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, reporting its outcome to the load balancer when the task is pinned to a backend.
+        """
+        backend = self.config.backend
+        start = time.monotonic()
+        try:
+            rsp = http_session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            if backend is not None:
+                self.config.balancer.record(backend, time.monotonic() - start, False)
+            # the request timeout was capped to the deadline, which is what ran out
+            token = self._cancel_token
+            if isinstance(e, requests.Timeout) and token is not None and (token.expired or token.cancelled):
+                token.raise_if_done(str(self))
+            raise
+        if backend is not None:
+            ok = not self.config.retry_policy.is_retryable_status(rsp.status_code)
+            self.config.balancer.record(backend, time.monotonic() - start, ok)
+        return rsp
+
+    def _trigger_balanced(self, config: Config, payload: str = None):
+        """
+        Trigger the task on the backend picked by the load balancer, a retry may pick another one.
+
+        :return: The backend the task is outstanding on, None if the task was already triggered.
+        """
+        if self.no_need_to_trigger():
+            return None
+        backend = config.balancer.acquire()
+        try:
+            self.trigger(config.pin(backend), payload)
+        except Exception:
+            config.balancer.release(backend)
+            raise
+        return backend
+
     def no_need_to_trigger(self):
         return self.status in (TaskStatus.Success, TaskStatus.Failed, TaskStatus.Waiting, TaskStatus.Running)
 
-    def check(self):
+    def check(self, defer_format: bool = False):
+        """
+        Check the status of the task on the server.
+
+        :param defer_format: Keep the raw result of a successful task until :meth:`format_raw_result` is called,
+            so formatting can run elsewhere than the polling thread.
+        """
         if self.status is None:
             raise RuntimeError(f"{self} is not triggered, you can't check it's status")
 
         api = self.api_check_url
-        rsp = http_session.get(api, timeout=self._request_timeout, headers=self.headers)
+        rsp = self._request("GET", api, timeout=self._http_timeout(), headers=self.headers)
+        if self.config.retry_policy.is_retryable_status(rsp.status_code):
+            raise Retry(f"Failed to check {self}, http status: {rsp.status_code}", rsp.status_code)
         rsp_json = rsp.json()
         if rsp_json["code"] != 0:
             raise RuntimeError(f"Failed to check {self}, error: {rsp_json['msg']}")
 
-        task_data = rsp_json["data"]
+        self._apply_status(rsp_json["data"], defer_format)
+
+    def _apply_status(self, task_data: dict, defer_format: bool = False):
+        """
+        Update the task with the task data reported by a status check or a completion callback.
+        """
+        if self.status in (TaskStatus.Success, TaskStatus.Failed):
+            return
+
         self.status = TaskStatus(task_data["status"])
-        if self.status == TaskStatus.Success:
-            result = task_data["result"]
-            self._result = self.format_result(result)
+        if self.status == TaskStatus.Running:
+            self.timestamps.setdefault(TaskPhase.Running, time.time())
+        elif self.status == TaskStatus.Success:
+            self.timestamps[TaskPhase.Finished] = time.time()
+            self._result = task_data["result"]
+            if not defer_format:
+                self.format_raw_result()
+            self.discard_spilled_body()
         elif self.status == TaskStatus.Failed:
+            self.timestamps[TaskPhase.Finished] = time.time()
             self.error = task_data["error"]
 
-    def wait(self):
+    def format_raw_result(self):
+        """
+        Format the raw result kept by a check with ``defer_format``.
+        """
+        self.timestamps[TaskPhase.FormatStart] = time.time()
+        with stage("format_result", api_path=self.api_path):
+            self._result = self.format_result(self._result)
+        self.timestamps[TaskPhase.FormatEnd] = time.time()
+
+    def wait(self, timeout: float = None, cancel_token: CancellationToken = None):
+        """
+        Block until the task succeeds or fails.
+
+        :param timeout: The maximum seconds to wait, :class:`DeadlineExceeded <dds_cloudapi_sdk.deadline.DeadlineExceeded>`
+            is raised when it runs out. The task keeps its status and can be waited again.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon
+            the wait with, :class:`TaskCancelled <dds_cloudapi_sdk.deadline.TaskCancelled>` is raised when it is cancelled.
+        """
         if self.status is None:
             raise RuntimeError(f"{self} is not triggered, you can't wait for it's result")
 
+        token = CancellationToken.combine(timeout, cancel_token)
+        self._cancel_token = token
+        receiver = self.config.callback_receiver
+        try:
+            if receiver is not None and self.task_uuid is not None:
+                receiver.register(self.task_uuid)
+                try:
+                    return self._wait(receiver, token)
+                finally:
+                    receiver.unregister(self.task_uuid)
+            return self._wait(None, token)
+        finally:
+            self._cancel_token = None
+
+    def _wait(self, receiver, token: CancellationToken):
+        last_status = time.monotonic()
         while True:
             if self.status not in {TaskStatus.Triggering, TaskStatus.Waiting, TaskStatus.Running}:
                 return
+            if token is not None:
+                token.raise_if_done(str(self))
+
+            if receiver is None:
+                self.config.retry_policy.call("poll", self.check, cancel_token=token)
+            else:
+                wait_for = max(receiver.fallback_interval - (time.monotonic() - last_status), 0)
+                if token is not None:
+                    # wake up regularly to notice the cancellation of the token
+                    wait_for = token.limit(min(wait_for, 0.25))
+                task_data = receiver.wait(self.task_uuid, wait_for)
+                if task_data is not None:
+                    self._apply_status(task_data)
+                elif time.monotonic() - last_status >= receiver.fallback_interval:
+                    logger.info(f"{self} got no callback in {receiver.fallback_interval}s, checking its status")
+                    self.config.retry_policy.call("poll", self.check, cancel_token=token)
+                else:
+                    continue
+                last_status = time.monotonic()
 
-            self.check()
             if self.status == TaskStatus.Waiting:
                 logger.info(f"{self} is waiting")
             elif self.status == TaskStatus.Running:
@@ -164,27 +386,46 @@ class BaseTask(abc.ABC):
             elif self.status == TaskStatus.Failed:
                 logger.info(f"{self}  is failed")
                 raise RuntimeError(f"{self}  is failed, error: {self.error}")
-            time.sleep(0.5)
-
-    def run(self, config: Config):
-        for i in range(3):
+            if receiver is None:
+                if token is not None:
+                    token.sleep(0.5)
+                else:
+                    time.sleep(0.5)
+
+    def run(self, config: Config, timeout: float = None, cancel_token: CancellationToken = None):
+        """
+        Trigger the task and wait for it to finish.
+
+        :param config: The config to run the task with.
+        :param timeout: The maximum seconds to spend on triggering and waiting.
+        :param cancel_token: The :class:`CancellationToken <dds_cloudapi_sdk.deadline.CancellationToken>` to abandon the task with.
+        """
+        token = CancellationToken.combine(timeout, cancel_token)
+        backend = None
+        with stage("task", api_path=self.api_path):
             try:
                 with sentry_sdk.start_transaction(op="trigger_task", name=f"{self.api_path}"):
                     sentry_sdk.set_tag("model", self.api_body.get("model", ""))
                     sentry_sdk.set_tag("token", config.token)
-                    self.trigger(config)
-                self.wait()
-                return
-            except (Retry, requests.exceptions.ReadTimeout) as e:
-                logger.warning(f"Failed to trigger {self}, times: {i+1}, e:{e}")
-                if i < 2:
-                    time.sleep(2)
-                    continue
-                sentry_sdk.capture_exception(e)
-                raise e
+                    self._cancel_token = token
+                    try:
+                        if config.balancer is None:
+                            config.retry_policy.call("trigger", self.trigger, config, cancel_token=token)
+                        else:
+                            backend = config.retry_policy.call(
+                                "trigger", self._trigger_balanced, config, cancel_token=token
+                            )
+                    finally:
+                        self._cancel_token = None
+                self.wait(cancel_token=token)
+            except (DeadlineExceeded, TaskCancelled):
+                raise
             except Exception as e:
                 sentry_sdk.capture_exception(e)
                 raise
+            finally:
+                if backend is not None:
+                    config.balancer.release(backend)
 
     def __str__(self):
         return f"{self.__class__.__name__}<task_id:{self.task_uuid}, idemp_key:{self.trigger_idempotency_key}>"
@@ -1,14 +1,22 @@
+import json
 import logging
+import os
+import sys
 from typing import Any
 from typing import Dict
 from typing import List
+from typing import Sequence
 
 import cv2
 import numpy as np
 import pycocotools.mask as maskUtils
 
+from dds_cloudapi_sdk.cache import BaseCache
+from dds_cloudapi_sdk.cache import canonical_hash
+from dds_cloudapi_sdk.image_resizer import image_cache_key
 from dds_cloudapi_sdk.image_resizer import image_to_base64
 from dds_cloudapi_sdk.image_resizer import resize_image
+from dds_cloudapi_sdk.instrumentation import instrumented
 from dds_cloudapi_sdk.rle_util import mask_to_rle
 from dds_cloudapi_sdk.rle_util import rle_to_array
 from dds_cloudapi_sdk.tasks.base import BaseTask
@@ -19,16 +27,60 @@ class MaskFormat:
     COCO_RLE = "coco_rle"
 
 
+class ResizePolicy:
+    """
+    How the images of an api are resized before the upload.
+
+    :param max_size: The longest edge of the uploaded images.
+    :param targets: The targets the api returns on a resized image, any registered target by default.
+        A request for another target uploads its image at the full resolution.
+    :param regions: The keys of the request body holding boxes in image coordinates, scaled down with the image.
+    """
+    __slots__ = ("max_size", "targets", "regions")
+
+    def __init__(self, max_size: int = 1536, targets: Sequence[str] = None, regions: Sequence[str] = ()):
+        self.max_size = max_size
+        self.targets = frozenset(targets) if targets is not None else None
+        self.regions = tuple(regions)
+
+    def __repr__(self):
+        return f"ResizePolicy(max_size={self.max_size}, targets={self.targets}, regions={self.regions})"
+
+
 class ResizeHelper:
-    _original_width = None
-    _original_height = None
-    _ratio = None
-    RESIZE_TARGETS = (
-        "bbox",
-        "mask",
-        "pose_keypoints",
-        "hand_keypoints",
-    )
+    __slots__ = ("_original_width", "_original_height", "_ratio")
+
+    # target -> the smallest longest edge keeping it accurate, 0 for the max size of the api
+    RESIZE_TARGETS: Dict[str, int] = {
+        "bbox": 0,
+        "mask": 0,
+        "pose_keypoints": 0,
+        "hand_keypoints": 0,
+        # an embedding or a caption describes the content, the model sees it at its own input size anyway
+        "embedding": 0,
+        "caption": 0,
+        # small text must stay legible
+        "roc": 2048,
+        "ocr": 2048,
+    }
+    # field of the result objects -> how it is scaled back to the original image
+    RESCALE_FIELDS: Dict[str, str] = {
+        "bbox": "bbox",
+        "region": "coords",
+        "mask": "mask",
+        "pose": "keypoints",
+        "hand": "keypoints",
+        # text results are left alone, boxes or polygons nested in them are scaled back
+        "roc": "nested",
+        "ocr": "nested",
+        "polygon": "coords",
+    }
+    POLICIES: Dict[str, ResizePolicy] = {
+        "/v2/task/trex/detection": ResizePolicy(1333),
+        "/v2/task/application/change_cloth_color": ResizePolicy(2048),
+        "/v2/task/dinox/region_vl": ResizePolicy(1536, regions=("regions",)),
+    }
+    DEFAULT_POLICY = ResizePolicy(1536)
     SUPPORTED_MASK_FORMATS = (
         MaskFormat.DDS_RLE,
         MaskFormat.COCO_RLE,
@@ -39,37 +91,53 @@ class ResizeHelper:
         self._original_height = original_height
         self._ratio = ratio
 
+    @property
+    def resize_info(self) -> dict:
+        return {
+            'original_width': self._original_width,
+            'original_height': self._original_height,
+            'ratio': self._ratio,
+        }
+
+    @classmethod
+    def policy(cls, api_path: str) -> ResizePolicy:
+        return cls.POLICIES.get(api_path, cls.DEFAULT_POLICY)
+
     @classmethod
-    def is_resizable(cls, api_body: dict) -> bool:
+    def is_resizable(cls, api_body: dict, api_path: str = None) -> bool:
         targets = api_body.get('targets')
         mask_format = api_body.get('mask_format')
-        if targets and any(target not in cls.RESIZE_TARGETS for target in targets):
-            return False
+        allowed = cls.policy(api_path).targets
+        for target in targets or ():
+            if target not in cls.RESIZE_TARGETS or (allowed is not None and target not in allowed):
+                return False
         if mask_format and mask_format not in cls.SUPPORTED_MASK_FORMATS:
             return False
         return True
 
     @classmethod
-    def image_max_size(cls, api_path: str) -> int:
-        if api_path == "/v2/task/trex/detection":
-            return 1333
-        elif api_path == "/v2/task/application/change_cloth_color":
-            return 2048
-        else:
-            return 1536
+    def image_max_size(cls, api_path: str, targets: Sequence[str] = ()) -> int:
+        return max([cls.policy(api_path).max_size] + [cls.RESIZE_TARGETS.get(target, 0) for target in targets])
+
+    @classmethod
+    def scale_request_regions(cls, api_path: str, api_body: dict, ratio: float):
+        """
+        Scale the boxes of the request body down to the coordinates of the resized image,
+        integer pixel coordinates stay integers.
+        """
+        for key in cls.policy(api_path).regions:
+            if api_body.get(key):
+                api_body[key] = [
+                    [round(coord * ratio) if isinstance(coord, int) else coord * ratio for coord in region]
+                    for region in api_body[key]
+                ]
 
+    @instrumented("rescale_result")
     def format_result(self, result: dict) -> dict:
         try:
             logging.debug(f"resize original result: {result}")
             for item in result['objects']:
-                if item.get('bbox'):
-                    item['bbox'] = self.resize_bbox(item['bbox'])
-                if item.get('mask'):
-                    item['mask'] = self.resize_mask(item['mask'])
-                if item.get('pose'):
-                    item['pose'] = self.resize_keypoints(item['pose'])
-                if item.get('hand'):
-                    item['hand'] = self.resize_keypoints(item['hand'])
+                self._rescale_fields(item)
             return result
         except Exception as e:
             logging.exception(
@@ -81,9 +149,32 @@ class ResizeHelper:
             )
             return result
 
+    def _rescale_fields(self, item: dict):
+        for field, kind in self.RESCALE_FIELDS.items():
+            if item.get(field):
+                item[field] = getattr(self, f"resize_{kind}")(item[field])
+
     def resize_bbox(self, bbox: list) -> list:
         return [int(coord / self._ratio) for coord in bbox]
 
+    def resize_coords(self, coords):
+        """Scale back coordinates nested in lists, keeping integers integers and floats floats."""
+        if isinstance(coords, (list, tuple)):
+            return [self.resize_coords(coord) for coord in coords]
+        if isinstance(coords, int):
+            return int(coords / self._ratio)
+        return coords / self._ratio
+
+    def resize_nested(self, value):
+        """Scale back the fields of the objects nested in a result field, texts are returned as they are."""
+        if isinstance(value, dict):
+            self._rescale_fields(value)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    self._rescale_fields(item)
+        return value
+
     def resize_mask(self, mask: dict) -> dict:
         mask_format = mask.get('format', MaskFormat.DDS_RLE)
         if mask_format == MaskFormat.DDS_RLE:
@@ -132,11 +223,32 @@ class ResizeHelper:
         ]
 
 
+def register_resize_policy(api_path: str, policy: ResizePolicy):
+    """
+    Set how the images of an api are resized, see :func:`create_task_with_local_image_auto_resize`.
+
+    :param api_path: The api path, such as ``/v2/task/dinox/detection``.
+    :param policy: The resize policy of the api.
+    """
+    ResizeHelper.POLICIES[api_path] = policy
+
+
+def register_resize_target(target: str, min_size: int = 0, fields: Dict[str, str] = None):
+    """
+    Let the requests of a target upload resized images.
+
+    :param target: The target, as in the ``targets`` of a request body.
+    :param min_size: The smallest longest edge keeping the target accurate, 0 for the max size of the api.
+    :param fields: The fields of the result objects the target fills, mapped to how they are scaled back:
+        ``bbox``, ``coords``, ``mask``, ``keypoints`` or ``nested``. Fields missing here are left as they are.
+    """
+    ResizeHelper.RESIZE_TARGETS[target] = min_size
+    ResizeHelper.RESCALE_FIELDS.update(fields or {})
+
+
 class V2Task(BaseTask):
-    _api_path = None
-    _api_body = None
-    result = None
-    _resize_helper = None
+    # __dict__ keeps attaching caller metadata to a task working, it is only allocated once something is attached
+    __slots__ = ("_api_path", "_api_body", "_resize_helper", "_body_spill", "__dict__")
 
     def __init__(
         self,
@@ -145,9 +257,11 @@ class V2Task(BaseTask):
         resize_helper: ResizeHelper = None,
     ):
         super().__init__()
-        self._api_path = api_path
+        # a bulk job has millions of tasks and a handful of api paths
+        self._api_path = sys.intern(api_path)
         self._api_body = api_body
         self._resize_helper = resize_helper
+        self._body_spill = None
 
     @property
     def api_path(self):
@@ -155,14 +269,34 @@ class V2Task(BaseTask):
 
     @property
     def api_body(self):
+        if self._api_body is None and self._body_spill is not None:
+            with open(self._body_spill, "r", encoding="utf8") as fp:
+                return json.load(fp)
         return self._api_body or {}
 
+    def release_body(self, spill_path: str = None):
+        self._api_body = None
+        self._body_spill = spill_path
+
+    def discard_spilled_body(self):
+        if self._body_spill is not None:
+            try:
+                os.remove(self._body_spill)
+            except FileNotFoundError:
+                pass
+            self._body_spill = None
+
     def format_result(self, result: dict) -> dict:
         if self._resize_helper:
             return self._resize_helper.format_result(result)
         else:
             return result
 
+    def cache_key(self) -> str:
+        if self._resize_helper:
+            return canonical_hash(self.api_path, self.api_body, resize=self._resize_helper.resize_info)
+        return canonical_hash(self.api_path, self.api_body)
+
     @property
     def result(self):
         return self._result
@@ -187,16 +321,49 @@ def create_task_with_local_image_auto_resize(
     api_body_without_image: Dict[str, Any],
     image_path: str,
     max_size: int = None,
+    cache: BaseCache = None,
 ) -> V2Task:
+    """
+    Create a task on a local image, resized to the maximum size of the api if it supports scaling the result back.
+
+    | The maximum size comes from the :class:`ResizePolicy` of the api and the targets of the request,
+      an OCR request keeps more pixels than a detection one.
+    | The boxes the request body gives in image coordinates, such as the ``regions`` of region_vl,
+      are scaled down with the image, and the boxes of the result are scaled back up.
+
+    :param api_path: The api path of the task.
+    :param api_body_without_image: The request body of the task, without the image.
+    :param image_path: The path or the bytes of the image.
+    :param max_size: The maximum size of the longest edge, the one of the api by default.
+    :param cache: A cache of the resized and encoded images, a :class:`SQLiteCache <dds_cloudapi_sdk.cache.SQLiteCache>`
+        shares them with the other processes of the host.
+    """
     api_body = api_body_without_image or {}
+    resizable = ResizeHelper.is_resizable(api_body, api_path)
+    if resizable:
+        max_size = max_size or ResizeHelper.image_max_size(api_path, api_body.get('targets') or ())
+
+    key = None
+    if cache is not None:
+        key = image_cache_key(image_path, max_size if resizable else None)
+        cached = cache.get(key)
+        if cached is not None:
+            api_body['image'] = cached["image"]
+            resize_info = cached["resize_info"]
+            if resize_info:
+                ResizeHelper.scale_request_regions(api_path, api_body, resize_info['ratio'])
+            return V2Task(api_path, api_body, ResizeHelper(**resize_info) if resize_info else None)
 
-    if ResizeHelper.is_resizable(api_body):
-        max_size = max_size or ResizeHelper.image_max_size(api_path)
+    if resizable:
         image_data, resize_info = resize_image(image_path, max_size)
         resize_helper = ResizeHelper(**resize_info) if resize_info else None
         api_body['image'] = image_to_base64(image_data)
     else:
         api_body['image'] = image_to_base64(image_path)
-        resize_helper = None
+        resize_info = resize_helper = None
 
+    if cache is not None:
+        cache.set(key, {"image": api_body['image'], "resize_info": resize_info})
+    if resize_info:
+        ResizeHelper.scale_request_regions(api_path, api_body, resize_info['ratio'])
     return V2Task(api_path, api_body, resize_helper)
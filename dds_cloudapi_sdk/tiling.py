@@ -0,0 +1,425 @@
+"""
+Run a task on a very large image tile by tile, so small objects survive the size limit of the API.
+
+:class:`TiledInference` splits an image into overlapping tiles, runs the task on the tiles concurrently,
+maps the boxes, masks and keypoints of every tile back to the coordinates of the whole image, and merges the
+objects detected twice where tiles overlap::
+
+    from dds_cloudapi_sdk.tiling import TiledInference
+
+    tiler = TiledInference(
+        client,
+        api_path="/v2/task/dinox/detection",
+        api_body_without_image={"model": "DINO-X-1.0", "prompt": {"type": "text", "text": "car"}, "targets": ["bbox"]},
+        overlap=256,
+    )
+    result = tiler.run("path/to/aerial.tif")
+    print(len(result["objects"]))
+
+Tiles are read lazily from uncompressed images (TIFF, BMP, PPM), ``.npy`` files and numpy arrays or memmaps,
+other formats are decoded in full once.
+"""
+
+import copy
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from dds_cloudapi_sdk.client import Client
+from dds_cloudapi_sdk.rle_util import merge_runs
+from dds_cloudapi_sdk.rle_util import rle_fr_string
+from dds_cloudapi_sdk.rle_util import rle_to_runs
+from dds_cloudapi_sdk.rle_util import rle_to_string
+from dds_cloudapi_sdk.rle_util import rle_union
+from dds_cloudapi_sdk.rle_util import runs_to_rle
+from dds_cloudapi_sdk.rle_util import split_runs
+from dds_cloudapi_sdk.tasks.v2_task import MaskFormat
+from dds_cloudapi_sdk.tasks.v2_task import ResizeHelper
+from dds_cloudapi_sdk.tasks.v2_task import V2Task
+from dds_cloudapi_sdk.tasks.v2_task import create_task_with_local_image_auto_resize
+
+__all__ = [
+    "ImageTileReader",
+    "Tile",
+    "TiledInference",
+    "merge_tile_objects",
+    "tile_boxes",
+]
+
+logger = logging.getLogger("dds_cloudapi_sdk")
+
+# raw mode of PIL -> (bytes per pixel, channels picked to make BGR, None for gray)
+_RAW_MODES = {
+    "L": (1, None),
+    "RGB": (3, (2, 1, 0)),
+    "BGR": (3, (0, 1, 2)),
+    "RGBX": (4, (2, 1, 0)),
+    "RGBA": (4, (2, 1, 0)),
+    "BGRX": (4, (0, 1, 2)),
+    "BGRA": (4, (0, 1, 2)),
+}
+
+_open_lock = threading.Lock()
+
+
+class ImageTileReader:
+    """
+    Read regions of a large image as BGR (or gray) arrays.
+
+    The pixels of uncompressed images are memory mapped from the raw tiles or strips PIL finds in the file,
+    so reading a region only touches the tiles it overlaps. Compressed images are decoded in full with a warning.
+
+    :param image: An image path, a ``.npy`` path, or a BGR or gray numpy array, which may be a memmap.
+    """
+
+    def __init__(self, image: Union[str, np.ndarray]):
+        self._array = None
+        self._tiles = []  # (x0, y0, x1, y1, memmap of the tile pixels, channels making BGR or None for gray)
+        self.channels = 3
+
+        if isinstance(image, np.ndarray):
+            self._array = image
+        elif image.lower().endswith(".npy"):
+            self._array = np.load(image, mmap_mode="r")
+        else:
+            self._open(image)
+
+        if self._array is not None:
+            self.height, self.width = self._array.shape[:2]
+            self.channels = 1 if self._array.ndim == 2 else self._array.shape[2]
+
+    def _open(self, path: str):
+        # gigapixel images are expected here, lift the decompression bomb check of PIL while opening
+        with _open_lock:
+            max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+            try:
+                img = Image.open(path)
+            finally:
+                Image.MAX_IMAGE_PIXELS = max_pixels
+
+        self.width, self.height = img.size
+        tiles = self._map_raw_tiles(path, img.tile)
+        if tiles is None:
+            logger.warning(
+                f"{path} is compressed and decoded in full, "
+                f"store it as an uncompressed TIFF or a .npy file to read its tiles lazily"
+            )
+            with _open_lock:
+                max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+                try:
+                    img.load()
+                finally:
+                    Image.MAX_IMAGE_PIXELS = max_pixels
+            if img.mode == "L":
+                self._array = np.asarray(img)
+            else:
+                self._array = np.ascontiguousarray(np.asarray(img.convert("RGB"))[..., ::-1])
+            return
+
+        self._tiles = tiles
+        self.channels = 1 if tiles and tiles[0][5] is None else 3
+
+    @staticmethod
+    def _map_raw_tiles(path: str, tile_list) -> Optional[list]:
+        tiles = []
+        gray = None
+        for codec, extents, offset, args in tile_list:
+            if isinstance(args, str):
+                args = (args, 0, 1)
+            rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+            if codec != "raw" or rawmode not in _RAW_MODES:
+                return None
+
+            bpp, channels = _RAW_MODES[rawmode]
+            if gray is not None and gray != (channels is None):
+                return None
+            gray = channels is None
+
+            x0, y0, x1, y1 = extents
+            rows, width = y1 - y0, x1 - x0
+            stride = stride or width * bpp
+            data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(rows, stride))
+            pixels = data[:, :width * bpp].reshape(rows, width, bpp)
+            if orientation < 0:
+                pixels = pixels[::-1]
+            tiles.append((x0, y0, x1, y1, pixels, channels))
+        return tiles
+
+    def read(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray:
+        """
+        Read a region of the image.
+
+        :param x0: The left of the region.
+        :param y0: The top of the region.
+        :param x1: The right of the region, exclusive.
+        :param y1: The bottom of the region, exclusive.
+        :return: The pixels of the region, in BGR or gray.
+        """
+        if self._array is not None:
+            return np.ascontiguousarray(self._array[y0:y1, x0:x1])
+
+        shape = (y1 - y0, x1 - x0) if self.channels == 1 else (y1 - y0, x1 - x0, 3)
+        region = np.zeros(shape, dtype=np.uint8)
+        for tx0, ty0, tx1, ty1, pixels, channels in self._tiles:
+            ix0, iy0, ix1, iy1 = max(x0, tx0), max(y0, ty0), min(x1, tx1), min(y1, ty1)
+            if ix0 >= ix1 or iy0 >= iy1:
+                continue
+            # only the overlapping part of the memmap is read
+            part = pixels[iy0 - ty0:iy1 - ty0, ix0 - tx0:ix1 - tx0]
+            part = part[..., 0] if channels is None else part[..., list(channels)]
+            region[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = part
+        return region
+
+
+def _tile_starts(length: int, tile_size: int, overlap: int) -> List[int]:
+    if length <= tile_size:
+        return [0]
+    # the fewest tiles sharing at least `overlap` pixels, spread evenly so the overlaps are equal
+    count = -(-(length - overlap) // (tile_size - overlap))
+    return [int(x) for x in np.linspace(0, length - tile_size, count).round()]
+
+
+def tile_boxes(width: int, height: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Split an image into evenly spaced overlapping tiles covering it.
+
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :param tile_size: The size of the square tiles.
+    :param overlap: The minimum number of pixels adjacent tiles share.
+    :return: The (x0, y0, x1, y1) boxes of the tiles, row by row.
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"overlap must be in [0, {tile_size}), got {overlap}")
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _tile_starts(height, tile_size, overlap)
+        for x in _tile_starts(width, tile_size, overlap)
+    ]
+
+
+def _shift_runs(starts: np.ndarray, ends: np.ndarray, stride: int, major_offset: int, minor_offset: int,
+                global_stride: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Move the runs of a tile mask into the flat index space of the whole image.
+
+    The runs are split where they wrap around a row (or a column for column-major masks),
+    each piece is then shifted by the offset of the tile.
+    """
+    line, lo, hi = split_runs(starts, ends, stride)
+    global_starts = (line + major_offset) * global_stride + lo + minor_offset
+    return global_starts, global_starts + (hi - lo)
+
+
+def _globalize_mask(mask: dict, tile: "Tile", width: int, height: int) -> dict:
+    mask_format = mask.get("format", MaskFormat.DDS_RLE)
+    tile_height, tile_width = mask["size"]
+    counts = mask["counts"]
+    if isinstance(counts, str):
+        counts = rle_fr_string(counts)
+    starts, ends = rle_to_runs(counts)
+
+    if mask_format == MaskFormat.COCO_RLE:
+        # column-major
+        starts, ends = _shift_runs(starts, ends, tile_height, tile.x0, tile.y0, height)
+        counts = runs_to_rle(*merge_runs(starts, ends), width * height)
+    else:
+        starts, ends = _shift_runs(starts, ends, tile_width, tile.y0, tile.x0, width)
+        counts = runs_to_rle(*merge_runs(starts, ends))
+    return {"counts": rle_to_string(counts), "size": [height, width], "format": mask_format}
+
+
+def _shift_keypoints(keypoints: list, dx: int, dy: int) -> list:
+    return [v + (dx if i % 4 == 0 else dy) if i % 4 <= 1 else v for i, v in enumerate(keypoints)]
+
+
+def _union_masks(masks: List[dict]) -> dict:
+    height, width = masks[0]["size"]
+    total = width * height if masks[0].get("format") == MaskFormat.COCO_RLE else None
+    return {"counts": rle_to_string(rle_union([m["counts"] for m in masks], total)), "size": [height, width],
+            "format": masks[0].get("format", MaskFormat.DDS_RLE)}
+
+
+def merge_tile_objects(objects: List[dict], tile_ids: Sequence[int], threshold: float = 0.5) -> List[dict]:
+    """
+    Merge the objects detected by several tiles, in the coordinates of the whole image.
+
+    Objects of the same category from different tiles whose boxes overlap by at least ``threshold`` of the
+    smaller box are merged into the one with the highest score: the boxes and masks are united,
+    the score and keypoints of the best object are kept.
+
+    :param objects: The objects of all tiles.
+    :param tile_ids: The tile each object was detected in.
+    :param threshold: The minimum intersection over the smaller box area of duplicates.
+    :return: The merged objects, by descending score.
+    """
+    with_box = [i for i, obj in enumerate(objects) if obj.get("bbox")]
+    merged = [objects[i] for i in range(len(objects)) if not objects[i].get("bbox")]
+    if not with_box:
+        return merged
+
+    boxes = np.array([objects[i]["bbox"] for i in with_box], dtype=np.float64)
+    scores = np.array([objects[i].get("score", 0.0) for i in with_box], dtype=np.float64)
+    _, categories = np.unique([str(objects[i].get("category")) for i in with_box], return_inverse=True)
+    tiles = np.asarray(tile_ids)[with_box]
+    areas = (boxes[:, 2] - boxes[:, 0]).clip(0) * (boxes[:, 3] - boxes[:, 1]).clip(0)
+
+    alive = np.ones(len(with_box), dtype=bool)
+    for i in np.argsort(-scores, kind="stable"):
+        if not alive[i]:
+            continue
+        alive[i] = False
+        candidates = np.flatnonzero(alive & (categories == categories[i]) & (tiles != tiles[i]))
+        if candidates.size:
+            width = np.minimum(boxes[i, 2], boxes[candidates, 2]) - np.maximum(boxes[i, 0], boxes[candidates, 0])
+            height = np.minimum(boxes[i, 3], boxes[candidates, 3]) - np.maximum(boxes[i, 1], boxes[candidates, 1])
+            intersection = width.clip(0) * height.clip(0)
+            smaller = np.minimum(areas[i], areas[candidates])
+            ratio = np.divide(intersection, smaller, out=np.zeros_like(intersection), where=smaller > 0)
+            duplicates = candidates[ratio >= threshold]
+            alive[duplicates] = False
+        else:
+            duplicates = candidates
+
+        obj = objects[with_box[i]]
+        if duplicates.size:
+            group = [i, *duplicates]
+            group_boxes = [objects[with_box[j]]["bbox"] for j in group]
+            obj = dict(obj)
+            obj["bbox"] = [
+                min(b[0] for b in group_boxes),
+                min(b[1] for b in group_boxes),
+                max(b[2] for b in group_boxes),
+                max(b[3] for b in group_boxes),
+            ]
+            masks = [objects[with_box[j]]["mask"] for j in group if objects[with_box[j]].get("mask")]
+            if len(masks) > 1 and len({m.get("format", MaskFormat.DDS_RLE) for m in masks}) == 1:
+                obj["mask"] = _union_masks(masks)
+        merged.append(obj)
+    return merged
+
+
+class Tile:
+    """
+    A tile of the image and the task run on it.
+
+    :param x0: The left of the tile in the image.
+    :param y0: The top of the tile in the image.
+    :param x1: The right of the tile in the image, exclusive.
+    :param y1: The bottom of the tile in the image, exclusive.
+    """
+
+    def __init__(self, x0: int, y0: int, x1: int, y1: int):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.task: Optional[V2Task] = None
+        self.error: Optional[Exception] = None
+
+    def __repr__(self):
+        return f"Tile<({self.x0}, {self.y0}, {self.x1}, {self.y1}), error:{self.error}>"
+
+
+class TiledInference:
+    """
+    Run a task on overlapping tiles of a large image and stitch the results.
+
+    :param client: The client to run tasks with.
+    :param api_path: The api path of the task run on each tile.
+    :param api_body_without_image: The request body of the task, the tile is added as its image.
+    :param tile_size: The size of the square tiles, the max image size of the api by default,
+        so the tiles are sent at full resolution.
+    :param overlap: The number of pixels adjacent tiles share, objects smaller than it are seen whole by a tile.
+    :param max_workers: The number of tiles read, encoded and processed by the server at the same time.
+    :param merge_threshold: The minimum intersection over the smaller box of objects merged across tiles,
+        see :func:`merge_tile_objects`.
+    :param encode_ext: The image format the tiles are uploaded in.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        api_path: str,
+        api_body_without_image: Dict[str, Any],
+        tile_size: int = None,
+        overlap: int = 256,
+        max_workers: int = 8,
+        merge_threshold: float = 0.5,
+        encode_ext: str = ".jpg",
+    ):
+        self.client = client
+        self.api_path = api_path
+        self.api_body_without_image = api_body_without_image or {}
+        targets = self.api_body_without_image.get("targets") or ()
+        self.tile_size = tile_size or ResizeHelper.image_max_size(api_path, targets)
+        self.overlap = overlap
+        self.max_workers = max_workers
+        self.merge_threshold = merge_threshold
+        self.encode_ext = encode_ext
+        self.tiles: List[Tile] = []
+
+    def _infer(self, reader: ImageTileReader, tile: Tile):
+        pixels = reader.read(tile.x0, tile.y0, tile.x1, tile.y1)
+        ok, buffer = cv2.imencode(self.encode_ext, pixels)
+        del pixels
+        if not ok:
+            raise ValueError(f"Failed to encode tile as {self.encode_ext}")
+        tile.task = create_task_with_local_image_auto_resize(
+            self.api_path,
+            copy.deepcopy(self.api_body_without_image),
+            buffer.tobytes(),
+            self.tile_size,
+        )
+        self.client.run_task(tile.task)
+
+    def _globalize(self, obj: dict, tile: Tile, width: int, height: int) -> dict:
+        obj = dict(obj)
+        if obj.get("bbox"):
+            x0, y0, x1, y1 = obj["bbox"]
+            obj["bbox"] = [x0 + tile.x0, y0 + tile.y0, x1 + tile.x0, y1 + tile.y0]
+        if obj.get("mask"):
+            obj["mask"] = _globalize_mask(obj["mask"], tile, width, height)
+        if obj.get("pose"):
+            obj["pose"] = _shift_keypoints(obj["pose"], tile.x0, tile.y0)
+        if obj.get("hand"):
+            obj["hand"] = _shift_keypoints(obj["hand"], tile.x0, tile.y0)
+        return obj
+
+    def run(self, image: Union[str, np.ndarray]) -> dict:
+        """
+        Run the task on all tiles of an image.
+
+        :param image: An image path, a ``.npy`` path, or a BGR or gray numpy array, see :class:`ImageTileReader`.
+        :return: The merged result, with the objects in the coordinates of the whole image.
+        """
+        reader = ImageTileReader(image)
+        self.tiles = [Tile(*box) for box in tile_boxes(reader.width, reader.height, self.tile_size, self.overlap)]
+        logger.info(f"running {self.api_path} on {len(self.tiles)} tiles of {reader.width}x{reader.height}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dds-tile") as executor:
+            futures = [executor.submit(self._infer, reader, tile) for tile in self.tiles]
+            for tile, future in zip(self.tiles, futures):
+                tile.error = future.exception()
+
+        for tile in self.tiles:
+            if tile.error is not None:
+                raise tile.error
+
+        objects, tile_ids = [], []
+        for tile_id, tile in enumerate(self.tiles):
+            for obj in (tile.task.result or {}).get("objects", []):
+                objects.append(self._globalize(obj, tile, reader.width, reader.height))
+                tile_ids.append(tile_id)
+        return {"objects": merge_tile_objects(objects, tile_ids, self.merge_threshold)}
@@ -0,0 +1,269 @@
+"""
+Run a task on every frame of a video or an image sequence, without paying for near-identical frames.
+
+:class:`VideoPipeline` decodes frames in a background thread, skips frames that look the same as the last
+frame sent to the server, keeps several frames in flight and yields the results in frame order::
+
+    from dds_cloudapi_sdk.video import VideoPipeline
+
+    pipeline = VideoPipeline(
+        client,
+        api_path="/v2/task/dinox/detection",
+        api_body_without_image={"model": "DINO-X-1.0", "prompt": {"type": "text", "text": "person"}, "targets": ["bbox"]},
+        max_in_flight=4,
+    )
+    for frame in pipeline.run("path/to/video.mp4"):
+        print(frame.index, frame.reused, frame.result)
+
+"""
+
+import collections
+import copy
+import queue
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Union
+
+import cv2
+import numpy as np
+
+from dds_cloudapi_sdk.client import Client
+from dds_cloudapi_sdk.tasks.v2_task import V2Task
+from dds_cloudapi_sdk.tasks.v2_task import create_task_with_local_image_auto_resize
+
+__all__ = [
+    "FrameResult",
+    "VideoPipeline",
+    "frame_dhash",
+]
+
+_END = object()
+
+
+def frame_dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Compute the difference hash of a frame, similar frames have hashes within a small hamming distance.
+
+    :param frame: The frame in BGR or gray format.
+    :param hash_size: The hash has hash_size * hash_size bits.
+    :return: The hash as an integer.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _motion_thumbnail(frame: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+class FrameResult:
+    """
+    The result of one frame.
+
+    :param index: The index of the frame in the source.
+    :param result: The task result, shared with the frame it was reused from when ``reused`` is True.
+    :param task: The task run for this frame, or the task of the frame the result is reused from.
+    :param reused: Whether the frame was skipped as a near duplicate of a previous frame.
+    :param error: The error raised by the task, if it failed.
+    """
+
+    def __init__(self, index: int, result: Optional[dict], task: Optional[V2Task], reused: bool, error: Exception = None):
+        self.index = index
+        self.result = result
+        self.task = task
+        self.reused = reused
+        self.error = error
+
+    def __repr__(self):
+        return f"FrameResult<index:{self.index}, reused:{self.reused}, error:{self.error}>"
+
+
+class VideoPipeline:
+    """
+    Pipelined inference over frames with near-duplicate frame skipping.
+
+    :param client: The client to run tasks with.
+    :param api_path: The api path of the task run on each frame.
+    :param api_body_without_image: The request body of the task, the frame is added as its image.
+    :param max_in_flight: The number of frames being processed by the server at the same time.
+    :param dedup: How to detect near-duplicate frames, "dhash" compares difference hashes, "motion" compares the
+        mean absolute difference of thumbnails, None sends every frame.
+    :param hash_threshold: The maximum hamming distance of two frames considered duplicates with "dhash".
+    :param motion_threshold: The maximum mean absolute difference, in [0, 1], of two frames considered duplicates with "motion".
+    :param max_size: The max size the frames are resized to, see :func:`create_task_with_local_image_auto_resize`.
+    :param encode_ext: The image format the frames are uploaded in.
+    :param decode_buffer: The number of decoded frames buffered ahead of the pipeline.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        api_path: str,
+        api_body_without_image: Dict[str, Any],
+        max_in_flight: int = 4,
+        dedup: Optional[str] = "dhash",
+        hash_threshold: int = 4,
+        motion_threshold: float = 0.02,
+        max_size: int = None,
+        encode_ext: str = ".jpg",
+        decode_buffer: int = 16,
+    ):
+        if dedup not in ("dhash", "motion", None):
+            raise ValueError(f"Unsupported dedup method: {dedup}")
+
+        self.client = client
+        self.api_path = api_path
+        self.api_body_without_image = api_body_without_image or {}
+        self.max_in_flight = max_in_flight
+        self.dedup = dedup
+        self.hash_threshold = hash_threshold
+        self.motion_threshold = motion_threshold
+        self.max_size = max_size
+        self.encode_ext = encode_ext
+        self.decode_buffer = decode_buffer
+
+        self.frames = 0
+        self.skipped = 0
+
+    def _decode(self, source, frames: queue.Queue, stop: threading.Event):
+        def put(item):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        try:
+            if isinstance(source, (str, int)):
+                capture = cv2.VideoCapture(source)
+                if not capture.isOpened():
+                    raise ValueError(f"Failed to open video: {source}")
+                try:
+                    while not stop.is_set():
+                        ok, frame = capture.read()
+                        if not ok or not put(frame):
+                            break
+                finally:
+                    capture.release()
+            else:
+                for frame in source:
+                    if isinstance(frame, str):
+                        path, frame = frame, cv2.imread(frame)
+                        if frame is None:
+                            raise ValueError(f"failed to read {path}")
+                    if not put(frame):
+                        break
+        except Exception as e:
+            put(e)
+        put(_END)
+
+    def _is_duplicate(self, frame: np.ndarray, state: dict) -> bool:
+        """Compare a frame with the last frame sent to the server, and remember it if it is sent."""
+        if self.dedup == "dhash":
+            signature = frame_dhash(frame)
+            last = state.get("signature")
+            if last is not None and bin(signature ^ last).count("1") <= self.hash_threshold:
+                return True
+        elif self.dedup == "motion":
+            signature = _motion_thumbnail(frame)
+            last = state.get("signature")
+            if last is not None and np.abs(signature - last).mean() / 255 <= self.motion_threshold:
+                return True
+        else:
+            return False
+
+        state["signature"] = signature
+        return False
+
+    def _infer(self, frame: np.ndarray) -> V2Task:
+        ok, buffer = cv2.imencode(self.encode_ext, frame)
+        if not ok:
+            raise ValueError(f"Failed to encode frame as {self.encode_ext}")
+        task = create_task_with_local_image_auto_resize(
+            self.api_path,
+            copy.deepcopy(self.api_body_without_image),
+            buffer.tobytes(),
+            self.max_size,
+        )
+        self.client.run_task(task)
+        return task
+
+    @staticmethod
+    def _frame_result(index: int, future: Future, reused: bool) -> FrameResult:
+        try:
+            task = future.result()
+        except Exception as e:
+            return FrameResult(index, None, None, reused, e)
+        return FrameResult(index, task.result, task, reused)
+
+    def run(self, source: Union[str, int, Iterable[Union[np.ndarray, str]]]) -> Iterator[FrameResult]:
+        """
+        Run the task on the frames of a source and yield their results in frame order.
+
+        :param source: A video file path, stream URL or camera index opened with cv2.VideoCapture,
+            or an iterable of BGR frames or image paths.
+        :return: An iterator of :class:`FrameResult`.
+        """
+        frames = queue.Queue(maxsize=self.decode_buffer)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode, args=(source, frames, stop), name="dds-video-decoder", daemon=True)
+        decoder.start()
+
+        state = {}
+        pending = collections.deque()  # (frame index, future of the task, whether the frame is reused)
+        in_flight = 0
+        last_future = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="dds-video") as executor:
+                index = 0
+                while True:
+                    frame = frames.get()
+                    if frame is _END:
+                        break
+                    if isinstance(frame, Exception):
+                        raise frame
+
+                    self.frames += 1
+                    if self._is_duplicate(frame, state):
+                        self.skipped += 1
+                        pending.append((index, last_future, True))
+                    else:
+                        # Wait for the oldest frames until a slot is free
+                        while in_flight >= self.max_in_flight:
+                            frame_index, future, reused = pending.popleft()
+                            if not reused:
+                                in_flight -= 1
+                            yield self._frame_result(frame_index, future, reused)
+                        last_future = executor.submit(self._infer, frame)
+                        in_flight += 1
+                        pending.append((index, last_future, False))
+                    index += 1
+
+                    # Emit the frames already done without blocking
+                    while pending and pending[0][1].done():
+                        frame_index, future, reused = pending.popleft()
+                        if not reused:
+                            in_flight -= 1
+                        yield self._frame_result(frame_index, future, reused)
+
+                while pending:
+                    frame_index, future, reused = pending.popleft()
+                    yield self._frame_result(frame_index, future, reused)
+        finally:
+            stop.set()
+            decoder.join()
+
+    @property
+    def skip_ratio(self) -> float:
+        return self.skipped / self.frames if self.frames else 0.0
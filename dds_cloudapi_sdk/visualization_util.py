@@ -1,19 +1,28 @@
+import collections
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Union
 from urllib.parse import urlparse
 
 import cv2
 import numpy as np
-import pycocotools.mask as maskUtils
 import requests
 import supervision as sv
 from PIL import Image
+from supervision.annotators.utils import resolve_color
 
-from dds_cloudapi_sdk.rle_util import rle_to_array
+from dds_cloudapi_sdk.instrumentation import instrumented
+from dds_cloudapi_sdk.rle_util import rle_area
+from dds_cloudapi_sdk.rle_util import rle_fr_string
+from dds_cloudapi_sdk.rle_util import rle_to_indices
 
 # Define body keypoint connections (COCO format with 17 keypoints)
 COCO_KEYPOINTS = [
@@ -52,6 +61,67 @@ HAND_SKELETON = [
 ]
 
 
+# Body keypoint and skeleton drawing plan: the keypoints and connections drawn with each color,
+# in the order they are drawn, so that overlapping strokes of one object stack up deterministically
+_POSE_LEFT_COLOR = (0, 0, 255)  # Red - left limb
+_POSE_RIGHT_COLOR = (0, 255, 0)  # Green - right limb
+_POSE_CENTER_COLOR = (255, 0, 0)  # Blue - center line (torso)
+_POSE_LEFT_KEYPOINTS = (0, 1, 3, 5, 7, 9, 11, 13, 15)
+_POSE_TORSO = ((5, 6), (11, 12), (5, 11), (6, 12))  # shoulders, hips, shoulders to hips
+_NO_KEYPOINTS = np.zeros(0, dtype=int)
+_NO_CONNECTIONS = np.zeros((0, 2), dtype=int)
+
+
+def _group_consecutive(items, colors):
+    """Group consecutive items of the same color into (color, items) pairs"""
+    groups = []
+    for item, color in zip(items, colors):
+        if groups and groups[-1][0] == color:
+            groups[-1][1].append(item)
+        else:
+            groups.append((color, [item]))
+    return groups
+
+
+POSE_DRAW_PLAN = [
+    (np.array(keypoints), _NO_CONNECTIONS, color)
+    for color, keypoints in _group_consecutive(
+        range(len(COCO_KEYPOINTS)),
+        [_POSE_LEFT_COLOR if i in _POSE_LEFT_KEYPOINTS else _POSE_RIGHT_COLOR for i in range(len(COCO_KEYPOINTS))]
+    )
+] + [
+    (_NO_KEYPOINTS, np.array(connections), color)
+    for color, connections in _group_consecutive(
+        COCO_SKELETON,
+        [
+            _POSE_CENTER_COLOR if (start, end) in _POSE_TORSO
+            else _POSE_LEFT_COLOR if start in _POSE_LEFT_KEYPOINTS or end in _POSE_LEFT_KEYPOINTS
+            else _POSE_RIGHT_COLOR
+            for start, end in COCO_SKELETON
+        ]
+    )
+]
+
+# Hand drawing plan: each finger draws its keypoints, the connections along it,
+# and the connection from the palm center to its base unless it is the thumb
+HAND_NUM_KEYPOINTS = 21
+HAND_FINGERS = [
+    ((0, 4), (0, 0, 255)),  # thumb, Red
+    ((5, 8), (0, 255, 0)),  # index finger, Green
+    ((9, 12), (255, 0, 0)),  # middle finger, Blue
+    ((13, 16), (255, 255, 0)),  # ring finger, Cyan
+    ((17, 20), (255, 0, 255)),  # pinky, Purple
+]
+HAND_DRAW_PLAN = [
+    (
+        np.arange(start, end + 1),
+        np.array([(i, i + 1) for i in range(start, end)] + ([(0, start)] if start > 0 else [])),
+        color
+    )
+    for (start, end), color in HAND_FINGERS
+]
+
+
 class ResultVisualizer:
     """Visualize detection results with boxes, masks, labels and keypoints"""
 
@@ -66,10 +136,20 @@ class ResultVisualizer:
         self.class_name_to_id = {name: id for id, name in enumerate(self.classes)}
         self.class_id_to_name = {id: name for name, id in self.class_name_to_id.items()}
 
+        # Annotators are stateless, create them once and reuse them for every image
+        self.box_annotator = sv.BoxAnnotator()
+        self.label_annotator = sv.LabelAnnotator()
+        self.mask_annotator = sv.MaskAnnotator()
+
     def _prepare_detections(self, objects: List[Dict]) -> sv.Detections:
-        """Convert objects to supervision Detections format"""
+        """
+        Convert objects to supervision Detections format
+
+        Masks are kept in their RLE form in self.masks and drawn by _draw_masks,
+        instead of being decoded into the detections
+        """
         boxes = []
-        masks = []
+        self.masks = []
         self.confidences = []
         self.class_names = []
         self.class_ids = []
@@ -81,21 +161,9 @@ class ResultVisualizer:
             if bbox is None:
                 logging.warning(f"Object missing both 'bbox' and 'region': {obj}")
                 continue
-            boxes.append(bbox)
             if "mask" in obj:
-                mask = obj["mask"]
-                mask_format = mask.get('format', 'dds_rle')
-                if mask_format == 'coco_rle':
-                    # Handle COCO RLE format
-                    mask_array = maskUtils.decode(mask)
-                else:
-                    # Handle DDS RLE format (default)
-                    mask_array = rle_to_array(
-                        mask["counts"],
-                        mask["size"][0] * mask["size"][1]
-                    ).reshape(mask["size"])
-
-                masks.append(mask_array)
+                self.masks.append((len(boxes), obj["mask"]))
+            boxes.append(bbox)
             self.confidences.append(obj.get("score", 1.0))
             if "category" in obj:
                 cls_name = obj["category"].lower().strip()
@@ -113,10 +181,64 @@ class ResultVisualizer:
 
         return sv.Detections(
             xyxy=np.array(boxes),
-            mask=np.array(masks).astype(bool) if masks else None,
             class_id=np.array(self.class_ids),
         )
 
+    @staticmethod
+    def _mask_indices(mask: Dict, counts: List[int], height: int, width: int) -> np.ndarray:
+        """Get the flat row-major indices of the foreground pixels of a RLE mask"""
+        indices = rle_to_indices(counts)
+        if mask.get('format', 'dds_rle') == 'coco_rle':
+            # COCO RLE runs go column by column
+            mask_height = mask["size"][0]
+            indices = (indices % mask_height) * width + indices // mask_height
+        return indices[indices < height * width]
+
+    def _draw_masks(
+        self,
+        scene: np.ndarray,
+        detections: sv.Detections,
+        mask_annotator: sv.MaskAnnotator
+    ) -> np.ndarray:
+        """
+        Draw masks the way sv.MaskAnnotator does, but one mask at a time straight from RLE
+
+        Peak memory is one copy of the image, whatever the number of masks
+
+        Args:
+            scene: Image to draw on
+            detections: Detections returned by _prepare_detections
+            mask_annotator: Annotator providing the color, color lookup and opacity
+
+        Returns:
+            np.ndarray: The annotated image
+        """
+        if not self.masks:
+            return scene
+
+        height, width = scene.shape[:2]
+        counts = [
+            rle_fr_string(mask["counts"]) if isinstance(mask["counts"], str) else mask["counts"]
+            for _, mask in self.masks
+        ]
+        areas = np.array([rle_area(cnts) for cnts in counts])
+        colored_mask = scene.copy()
+        flat = colored_mask.reshape(-1, scene.shape[2])
+
+        # Draw larger masks first so smaller ones stay visible on top
+        for i in np.flip(np.argsort(areas)):
+            detection_idx, mask = self.masks[i]
+            color = resolve_color(
+                color=mask_annotator.color,
+                detections=detections,
+                detection_idx=detection_idx,
+                color_lookup=mask_annotator.color_lookup,
+            )
+            flat[self._mask_indices(mask, counts[i], height, width)] = color.as_bgr()
+
+        opacity = mask_annotator.opacity
+        return cv2.addWeighted(colored_mask, opacity, scene, 1 - opacity, 0)
+
     def _get_labels(self) -> List[str]:
         """Generate labels with class names and confidences"""
         logging.info(f"class_names: {self.class_names}, confidences: {self.confidences}")
@@ -135,54 +257,69 @@ class ResultVisualizer:
             labels.append(" | ".join(label_parts))
         return labels
 
+    @staticmethod
+    def _draw_keypoint_groups(
+        frame: np.ndarray,
+        keypoints: List[List[float]],
+        num_keypoints: int,
+        plan: List[Tuple[np.ndarray, np.ndarray, Tuple[int, int, int]]]
+    ) -> None:
+        """
+        Draw keypoints and skeletons of many objects with one cv2.polylines call per plan step
+
+        Args:
+            frame: Image to draw on
+            keypoints: Keypoints of each object, flat lists of [x, y, conf, visibility] * num_keypoints
+            num_keypoints: Number of keypoints of each object
+            plan: Steps of (keypoint indexes, pairs of keypoint indexes to connect, BGR color)
+        """
+        if not keypoints:
+            return
+
+        kps = np.asarray(keypoints, dtype=np.float64).reshape(-1, num_keypoints, 4)
+        visible = kps[:, :, 2] > 0.5  # Confidence threshold
+        xy = kps[:, :, :2].astype(np.int32)
+
+        for points, connections, color in plan:
+            if len(points):
+                selected = xy[:, points][visible[:, points]]
+                if len(selected):
+                    # A zero-length polyline of thickness 6 draws exactly a filled circle of radius 3
+                    cv2.polylines(frame, np.repeat(selected[:, None, :], 2, axis=1), False, color, 6)
+            if len(connections):
+                # Only draw line if both keypoints have confidence above threshold
+                starts, ends = connections[:, 0], connections[:, 1]
+                lines = np.stack([xy[:, starts], xy[:, ends]], axis=2)
+                selected = lines[visible[:, starts] & visible[:, ends]]
+                if len(selected):
+                    cv2.polylines(frame, selected, False, color, 2)
+
     def _draw_pose(self, frame: np.ndarray, pose: List[float]) -> None:
         """
         Draw pose keypoints and skeleton
 
         Args:
             frame: Image to draw on
-            pose: List of keypoints [x1,y1,conf1, x2,y2,conf2, ...]
+            pose: List of keypoints [x1,y1,conf1,vis1, x2,y2,conf2,vis2, ...]
         """
         if pose is None:
             return
+        self._draw_poses(frame, [pose])
 
-        # Define colors for left/right limbs (BGR format)
-        left_color = (0, 0, 255)    # Red - left limb
-        right_color = (0, 255, 0)   # Green - right limb
-        center_color = (255, 0, 0)  # Blue - center line (torso)
-
-        # Draw keypoints
-        for i in range(17):
-            kp = pose[i * 4:(i + 1) * 4]
-            if kp[2] > 0.5:  # Confidence threshold
-                x = int(kp[0])
-                y = int(kp[1])
-                # Select color based on keypoint position
-                if i in [0, 1, 3, 5, 7, 9, 11, 13, 15]:  # Left keypoints
-                    cv2.circle(frame, (x, y), 3, left_color, -1)
-                elif i in [2, 4, 6, 8, 10, 12, 14, 16]:  # Right keypoints
-                    cv2.circle(frame, (x, y), 3, right_color, -1)
-
-        # Draw skeleton connections
-        for start_idx, end_idx in COCO_SKELETON:
-            start_kp = pose[start_idx * 4:(start_idx + 1) * 4]
-            end_kp = pose[end_idx * 4:(end_idx + 1) * 4]
-
-            # Only draw line if both keypoints have confidence above threshold
-            if start_kp[2] > 0.5 and end_kp[2] > 0.5:
-                start_point = (int(start_kp[0]), int(start_kp[1]))
-                end_point = (int(end_kp[0]), int(end_kp[1]))
-
-                # Select color based on connection type
-                if (start_idx, end_idx) in [(5, 6), (11, 12), (5, 11), (6, 12)
-                                            ]:  # Torso connections (shoulders, hips, shoulders to hips)
-                    line_color = center_color
-                elif start_idx in [0, 1, 3, 5, 7, 9, 11, 13, 15] or end_idx in [0, 1, 3, 5, 7, 9, 11, 13, 15]:  # Left connections
-                    line_color = left_color
-                else:  # Right connections
-                    line_color = right_color
-
-                cv2.line(frame, start_point, end_point, line_color, 2)
+    def _draw_poses(self, frame: np.ndarray, poses: List[List[float]]) -> None:
+        """
+        Draw pose keypoints and skeletons of many people at once
+
+        Args:
+            frame: Image to draw on
+            poses: List of keypoints of each person
+        """
+        self._draw_keypoint_groups(
+            frame,
+            poses,
+            len(COCO_KEYPOINTS),
+            POSE_DRAW_PLAN
+        )
 
     def _draw_hand(self, frame: np.ndarray, hand: List[float]) -> None:
         """
@@ -190,87 +327,38 @@ class ResultVisualizer:
 
         Args:
             frame: Image to draw on
-            hand: List of keypoints [x1,y1,conf1, x2,y2,conf2, ...]
+            hand: List of keypoints [x1,y1,conf1,vis1, x2,y2,conf2,vis2, ...]
         """
         if hand is None:
             return
+        self._draw_hands(frame, [hand])
 
-        # Define colors for each finger (BGR format)
-        finger_colors = {
-            'thumb': (0, 0, 255),      # Red - thumb
-            'index': (0, 255, 0),      # Green - index finger
-            'middle': (255, 0, 0),     # Blue - middle finger
-            'ring': (255, 255, 0),     # Cyan - ring finger
-            'pinky': (255, 0, 255)     # Purple - pinky
-        }
-
-        # Define keypoint ranges for each finger
-        finger_ranges = {
-            'thumb': (0, 4),    # 0-4
-            'index': (5, 8),    # 5-8
-            'middle': (9, 12),  # 9-12
-            'ring': (13, 16),   # 13-16
-            'pinky': (17, 20)   # 17-20
-        }
+    def _draw_hands(self, frame: np.ndarray, hands: List[List[float]]) -> None:
+        """
+        Draw hand keypoints and skeletons of many hands at once
 
-        # Draw keypoints and connections
-        for finger, (start_idx, end_idx) in finger_ranges.items():
-            color = finger_colors[finger]
-
-            # Draw keypoints
-            for i in range(start_idx, end_idx + 1):
-                kp = hand[i * 4:(i + 1) * 4]
-                if kp[2] > 0.5:  # Confidence threshold
-                    x = int(kp[0])
-                    y = int(kp[1])
-                    cv2.circle(frame, (x, y), 3, color, -1)  # Solid circle
-
-            # Draw finger connections
-            for i in range(start_idx, end_idx):
-                start_kp = hand[i * 4:(i + 1) * 4]
-                end_kp = hand[(i + 1) * 4:(i + 2) * 4]
-
-                if start_kp[2] > 0.5 and end_kp[2] > 0.5:
-                    start_point = (int(start_kp[0]), int(start_kp[1]))
-                    end_point = (int(end_kp[0]), int(end_kp[1]))
-                    cv2.line(frame, start_point, end_point, color, 2)
-
-            # Draw connection to palm center
-            if start_idx > 0:  # Not thumb
-                palm_kp = hand[0:4]  # Palm center point
-                finger_kp = hand[start_idx * 4:(start_idx + 1) * 4]
-
-                if palm_kp[2] > 0.5 and finger_kp[2] > 0.5:
-                    palm_point = (int(palm_kp[0]), int(palm_kp[1]))
-                    finger_point = (int(finger_kp[0]), int(finger_kp[1]))
-                    cv2.line(frame, palm_point, finger_point, color, 2)
+        Args:
+            frame: Image to draw on
+            hands: List of keypoints of each hand
+        """
+        self._draw_keypoint_groups(
+            frame,
+            hands,
+            HAND_NUM_KEYPOINTS,
+            HAND_DRAW_PLAN
+        )
 
-    def visualize(
-        self,
-        image_path: str,
-        objects: List[Dict],
-        output_dir: str,
-        show_mask: bool = True,
-        show_box: bool = True,
-        show_label: bool = True,
-        show_pose: bool = True
-    ) -> str:
+    @staticmethod
+    def read_image(image_path: str) -> np.ndarray:
         """
-        Visualize detection results on image
+        Read image from local file or URL
 
         Args:
             image_path: Path to input image or image URL
-            objects: List of detection objects
-            output_dir: Directory to save output image
-            show_mask: Whether to show masks
-            show_box: Whether to show boxes
-            show_label: Whether to show labels
-            show_pose: Whether to show pose keypoints and skeleton
 
         Returns:
-            str: Path to saved image
+            np.ndarray: The image in BGR format
         """
-        # Read image from local file or URL
         if urlparse(image_path).scheme in ('http', 'https'):
             try:
                 response = requests.get(image_path)
@@ -290,20 +378,43 @@ class ResultVisualizer:
             img = cv2.imread(image_path)
             if img is None:
                 raise ValueError(f"Failed to read image: {image_path}")
+        return img
+
+    @instrumented("annotate", nbytes=lambda img: img.nbytes)
+    def annotate(
+        self,
+        img: np.ndarray,
+        objects: List[Dict],
+        show_mask: bool = True,
+        show_box: bool = True,
+        show_label: bool = True,
+        show_pose: bool = True
+    ) -> np.ndarray:
+        """
+        Draw detection results on a copy of an image
 
+        Args:
+            img: Image in BGR format
+            objects: List of detection objects
+            show_mask: Whether to show masks
+            show_box: Whether to show boxes
+            show_label: Whether to show labels
+            show_pose: Whether to show pose keypoints and skeleton
+
+        Returns:
+            np.ndarray: The annotated image
+        """
         # Prepare detections
         detections = self._prepare_detections(objects)
         annotated_frame = img.copy()
 
         # Draw boxes and labels
         if show_box:
-            box_annotator = sv.BoxAnnotator()
-            annotated_frame = box_annotator.annotate(scene=annotated_frame, detections=detections)
+            annotated_frame = self.box_annotator.annotate(scene=annotated_frame, detections=detections)
 
         if show_label:
-            label_annotator = sv.LabelAnnotator()
             labels = self._get_labels()
-            annotated_frame = label_annotator.annotate(
+            annotated_frame = self.label_annotator.annotate(
                 scene=annotated_frame,
                 detections=detections,
                 labels=labels
@@ -311,29 +422,71 @@ class ResultVisualizer:
 
         # Draw masks
         if show_mask:
-            mask_annotator = sv.MaskAnnotator()
-            annotated_frame = mask_annotator.annotate(scene=annotated_frame, detections=detections)
+            annotated_frame = self._draw_masks(annotated_frame, detections, self.mask_annotator)
 
         # Draw pose keypoints and skeleton
         if show_pose:
-            for obj in objects:
-                if 'pose' in obj:
-                    self._draw_pose(annotated_frame, obj['pose'])
+            self._draw_poses(annotated_frame, [obj['pose'] for obj in objects if obj.get('pose')])
 
         # Draw hand keypoints and skeleton
         if show_pose:
-            for obj in objects:
-                if 'hand' in obj:
-                    self._draw_hand(annotated_frame, obj['hand'])
+            self._draw_hands(annotated_frame, [obj['hand'] for obj in objects if obj.get('hand')])
+
+        return annotated_frame
+
+    def visualize(
+        self,
+        image_path: str,
+        objects: List[Dict],
+        output_dir: str,
+        show_mask: bool = True,
+        show_box: bool = True,
+        show_label: bool = True,
+        show_pose: bool = True,
+        output_name: str = "annotated_image.jpg"
+    ) -> str:
+        """
+        Visualize detection results on image
+
+        Args:
+            image_path: Path to input image or image URL
+            objects: List of detection objects
+            output_dir: Directory to save output image
+            show_mask: Whether to show masks
+            show_box: Whether to show boxes
+            show_label: Whether to show labels
+            show_pose: Whether to show pose keypoints and skeleton
+            output_name: File name of the output image
+
+        Returns:
+            str: Path to saved image
+        """
+        img = self.read_image(image_path)
+        annotated_frame = self.annotate(
+            img,
+            objects,
+            show_mask=show_mask,
+            show_box=show_box,
+            show_label=show_label,
+            show_pose=show_pose
+        )
 
         # Save result
         os.makedirs(output_dir, exist_ok=True)
-        output_path = os.path.join(output_dir, "annotated_image.jpg")
+        output_path = os.path.join(output_dir, output_name)
         cv2.imwrite(output_path, annotated_frame)
 
         return output_path
 
 
+def _extract_class_names(objects: List[Dict]) -> List[str]:
+    """Extract class names from objects, in first-seen order"""
+    return list(dict.fromkeys(
+        obj['category'] if 'category' in obj else str(obj.get('category_id', 'unknown'))
+        for obj in objects
+    ))
+
+
 def visualize_result(
     image_path: str,
     result: Dict,
@@ -365,10 +518,7 @@ def visualize_result(
 
     # Extract class names if not provided
     if class_names is None:
-        class_names = list(set(
-            obj['category'] if 'category' in obj else str(obj.get('category_id', 'unknown'))
-            for obj in objects
-        ))
+        class_names = _extract_class_names(objects)
 
     # Create visualizer and visualize
     visualizer = ResultVisualizer(class_names)
@@ -380,3 +530,178 @@ def visualize_result(
         show_box=show_box,
         show_label=show_label
     )
+
+
+# The visualizer of a render worker process, shared by all the images it renders
+_worker_visualizer: Optional[ResultVisualizer] = None
+# Without given class names, the visualizers of the class names extracted from the results, reused across images
+_worker_visualizers: Dict[tuple, ResultVisualizer] = {}
+_MAX_WORKER_VISUALIZERS = 64
+
+
+def _init_render_worker(class_names: Optional[List[str]]) -> None:
+    global _worker_visualizer
+    _worker_visualizer = ResultVisualizer(class_names) if class_names is not None else None
+    _worker_visualizers.clear()
+
+
+def _visualizer_for(objects: List[Dict]) -> ResultVisualizer:
+    key = tuple(_extract_class_names(objects))
+    visualizer = _worker_visualizers.get(key)
+    if visualizer is None:
+        if len(_worker_visualizers) >= _MAX_WORKER_VISUALIZERS:
+            del _worker_visualizers[next(iter(_worker_visualizers))]
+        visualizer = _worker_visualizers[key] = ResultVisualizer(list(key))
+    return visualizer
+
+
+def _render_one(
+    image_path: str,
+    objects: List[Dict],
+    output_path: Optional[str],
+    encode_ext: str,
+    show_options: Dict[str, bool]
+) -> Union[str, bytes]:
+    """Read, annotate and write or encode one image, in a render worker"""
+    visualizer = _worker_visualizer or _visualizer_for(objects)
+    img = ResultVisualizer.read_image(image_path)
+    annotated_frame = visualizer.annotate(img, objects, **show_options) if objects else img
+
+    if output_path is not None:
+        cv2.imwrite(output_path, annotated_frame)
+        return output_path
+
+    ok, buffer = cv2.imencode(encode_ext, annotated_frame)
+    if not ok:
+        raise ValueError(f"Failed to encode annotated image of {image_path} as {encode_ext}")
+    return buffer.tobytes()
+
+
+class BatchVisualizer:
+    """
+    Render detection results of many images in parallel across a process pool
+
+    Each worker process builds its visualizer and annotators once and reuses them for every image,
+    decoding, drawing and encoding happen in the workers so rendering scales with cores.
+    """
+
+    def __init__(
+        self,
+        class_names: Optional[List[str]] = None,
+        workers: Optional[int] = None,
+        encode_ext: str = ".jpg",
+        show_mask: bool = True,
+        show_box: bool = True,
+        show_label: bool = True,
+        show_pose: bool = True
+    ):
+        """
+        Initialize the batch visualizer
+
+        Args:
+            class_names: List of class names shared by all images, if None will be extracted from each result
+            workers: Number of worker processes, None for the number of CPUs, 0 to render in the current process
+            encode_ext: Image format extension of the outputs, e.g. ".jpg" or ".png"
+            show_mask: Whether to show masks
+            show_box: Whether to show boxes
+            show_label: Whether to show labels
+            show_pose: Whether to show pose keypoints and skeleton
+        """
+        self.class_names = class_names
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.encode_ext = encode_ext
+        self.show_options = {
+            "show_mask": show_mask,
+            "show_box": show_box,
+            "show_label": show_label,
+            "show_pose": show_pose,
+        }
+
+    def _output_path(self, output_dir: str, index: int, image_path: str) -> str:
+        stem = os.path.splitext(os.path.basename(urlparse(image_path).path))[0] or "image"
+        return os.path.join(output_dir, f"{index:06d}_{stem}{self.encode_ext}")
+
+    def render(
+        self,
+        items: Iterable[Tuple[str, Dict]],
+        output_dir: Optional[str] = None
+    ) -> Iterator[Union[str, bytes]]:
+        """
+        Render results lazily, in the order of the items
+
+        Args:
+            items: Pairs of image path or URL and its detection result dictionary
+            output_dir: Directory to save output images in, with names unique per item;
+                if None, the encoded images are yielded as bytes instead
+
+        Yields:
+            Union[str, bytes]: Path to each saved image, or each encoded image
+        """
+        if output_dir is not None:
+            os.makedirs(output_dir, exist_ok=True)
+
+        jobs = (
+            (
+                image_path,
+                result.get('objects', []),
+                self._output_path(output_dir, index, image_path) if output_dir is not None else None,
+                self.encode_ext,
+                self.show_options,
+            )
+            for index, (image_path, result) in enumerate(items)
+        )
+
+        if self.workers == 0:
+            _init_render_worker(self.class_names)
+            for job in jobs:
+                yield _render_one(*job)
+            return
+
+        # Keep a bounded number of images in flight, so memory does not grow with the dataset
+        max_pending = self.workers * 2
+        pending = collections.deque()
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_render_worker,
+            initargs=(self.class_names,)
+        ) as executor:
+            for job in jobs:
+                pending.append(executor.submit(_render_one, *job))
+                if len(pending) >= max_pending:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+def visualize_results(
+    items: Iterable[Tuple[str, Dict]],
+    output_dir: str,
+    class_names: Optional[List[str]] = None,
+    workers: Optional[int] = None,
+    show_mask: bool = True,
+    show_box: bool = True,
+    show_label: bool = True
+) -> List[str]:
+    """
+    Convenience function to visualize the detection results of many images in parallel
+
+    Args:
+        items: Pairs of image path or URL and its detection result dictionary
+        output_dir: Directory to save output images
+        class_names: List of class names shared by all images, if None will be extracted from each result
+        workers: Number of worker processes, None for the number of CPUs
+        show_mask: Whether to show masks
+        show_box: Whether to show boxes
+        show_label: Whether to show labels
+
+    Returns:
+        List[str]: Paths to saved images, in the order of the items
+    """
+    visualizer = BatchVisualizer(
+        class_names=class_names,
+        workers=workers,
+        show_mask=show_mask,
+        show_box=show_box,
+        show_label=show_label
+    )
+    return list(visualizer.render(items, output_dir))
@@ -61,4 +61,9 @@ setup(name="dds-cloudapi-sdk",
       include_package_data=True,
       install_requires=install_requires,
       classifiers=classifiers,
+      entry_points={
+          "console_scripts": [
+              "dds-cloudapi = dds_cloudapi_sdk.cli:main",
+          ],
+      },
       )